@@ -127,6 +127,20 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Shared cache so invalidations (e.g. chat membership) reach every worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    },
+}
+
+
+# Chat encryption: rotate a conversation's session key after this many messages
+CHAT_SESSION_KEY_ROTATE_AFTER = int(os.getenv('CHAT_SESSION_KEY_ROTATE_AFTER', '1000'))
+
+# Chat archiving: messages older than this many days are moved to compressed segments
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv('CHAT_ARCHIVE_AFTER_DAYS', '180'))
 
 
 # Database
@@ -160,6 +174,12 @@ else:
             'default': {
                 'ENGINE': 'django.db.backends.sqlite3',
                 'NAME': BASE_DIR / 'db.sqlite3',
+                'OPTIONS': {
+                    # SQLite ignores select_for_update; taking the write lock up front
+                    # serializes allocations (core.sequences) instead of failing them
+                    'transaction_mode': 'IMMEDIATE',
+                    'timeout': 20,
+                },
             }
         }
 
@@ -205,6 +225,38 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hash uploads while they stream in so document storage can dedupe without re-reading them
+FILE_UPLOAD_HANDLERS = [
+    'core.storage.HashingMemoryFileUploadHandler',
+    'core.storage.HashingTemporaryFileUploadHandler',
+]
+DOCUMENT_BLOB_GC_GRACE_HOURS = int(os.getenv('DOCUMENT_BLOB_GC_GRACE_HOURS', '1'))
+
+# Enquiry duplicate detection: numbers without a country code are assumed to be local
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv('DEFAULT_PHONE_COUNTRY_CODE', '91')
+PHONE_NATIONAL_LENGTH = int(os.getenv('PHONE_NATIONAL_LENGTH', '10'))
+
+# Days before a document's expiry_date at which its holder is notified
+DOCUMENT_EXPIRY_ALERT_DAYS = [
+    int(days) for days in os.getenv('DOCUMENT_EXPIRY_ALERT_DAYS', '30,7,1').split(',') if days.strip()
+]
+
+# Document thumbnails are rendered by a small in-process thread pool after upload
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', '2'))
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '320'))
+
+# Protected downloads: behind nginx, hand the transfer off with X-Accel-Redirect
+# to an `internal` location aliased to MEDIA_ROOT (see nginx_fullstack.conf)
+USE_X_ACCEL_REDIRECT = os.getenv('USE_X_ACCEL_REDIRECT', 'False') == 'True'
+PROTECTED_MEDIA_URL = os.getenv('PROTECTED_MEDIA_URL', '/protected-media/')
+
+# Chunked uploads: each chunk is a short request, so slow clients never hit the worker timeout
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(5 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', str(2 * 1024 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv('UPLOAD_SESSION_TTL_HOURS', '24'))
+# Assembling a completed upload (up to UPLOAD_MAX_SIZE) runs in this many background threads
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '2'))
+
 # Whitenoise configuration for serving static files in production
 if not DEBUG:
     MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
@@ -0,0 +1,168 @@
+"""
+Chat Archive - moves old chat messages into compressed ChatMessageArchive
+segments and reads them back as (unsaved) ChatMessage instances, so the
+history API can serve archived and live messages the same way
+"""
+import json
+import zlib
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import ChatMessage, ChatMessageArchive, ChatSessionKey, User
+
+ARCHIVE_SEGMENT_SIZE = 500
+
+ARCHIVED_FIELDS = (
+    'id', 'sender_id', 'encrypted_content', 'text', 'encrypted_keys',
+    'session_key_id', 'read_by', 'timestamp', 'client_id', 'company_id',
+    'attachment', 'attachment_name', 'attachment_size', 'attachment_content_type',
+)
+
+
+def encode_segment(rows):
+    records = []
+    for row in rows:
+        record = dict(row)
+        record['id'] = str(row['id'])
+        record['sender_id'] = str(row['sender_id'])
+        record['session_key_id'] = str(row['session_key_id']) if row['session_key_id'] else None
+        record['timestamp'] = row['timestamp'].isoformat()
+        records.append(record)
+    return zlib.compress(json.dumps(records, separators=(',', ':')).encode(), 9)
+
+
+def decode_segment(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def archive_conversation(conversation_id, cutoff, segment_size=ARCHIVE_SEGMENT_SIZE):
+    """
+    Move a conversation's messages older than cutoff into archive segments.
+    Each segment is written and its rows deleted in one transaction.
+    Returns the number of messages archived.
+    """
+    archived = 0
+    while True:
+        with transaction.atomic():
+            rows = list(ChatMessage.objects.filter(
+                conversation_id=conversation_id,
+                timestamp__lt=cutoff
+            ).order_by('timestamp', 'id').values(*ARCHIVED_FIELDS)[:segment_size])
+            if not rows:
+                return archived
+
+            ChatMessageArchive.objects.create(
+                conversation_id=conversation_id,
+                start_time=rows[0]['timestamp'],
+                end_time=rows[-1]['timestamp'],
+                message_count=len(rows),
+                data=encode_segment(rows),
+                company_id=rows[0]['company_id']
+            )
+            ChatMessage.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+        archived += len(rows)
+
+
+def hydrate(conversation_id, records):
+    """Rebuild unsaved ChatMessage instances with sender and session key attached"""
+    senders = {
+        str(pk): user for pk, user in
+        User.objects.in_bulk({record['sender_id'] for record in records}).items()
+    }
+    session_keys = {
+        str(pk): session_key for pk, session_key in
+        ChatSessionKey.objects.in_bulk(
+            {record['session_key_id'] for record in records if record['session_key_id']}
+        ).items()
+    }
+
+    messages = []
+    for record in records:
+        sender = senders.get(record['sender_id'])
+        if sender is None:
+            continue
+        message = ChatMessage(
+            id=record['id'],
+            conversation_id=conversation_id,
+            sender=sender,
+            encrypted_content=record['encrypted_content'],
+            text=record['text'],
+            encrypted_keys=record['encrypted_keys'],
+            read_by=record['read_by'],
+            client_id=record['client_id'],
+            company_id=record['company_id'],
+            attachment=record.get('attachment'),
+            attachment_name=record.get('attachment_name', ''),
+            attachment_size=record.get('attachment_size'),
+            attachment_content_type=record.get('attachment_content_type', ''),
+        )
+        message.session_key_id = record['session_key_id']
+        if record['session_key_id']:
+            message.session_key = session_keys.get(record['session_key_id'])
+            if message.session_key is None:
+                message.session_key_id = None
+        message.timestamp = parse_datetime(record['timestamp'])
+        messages.append(message)
+    return messages
+
+
+def record_position(record):
+    return parse_datetime(record['timestamp']), record['id']
+
+
+def archived_messages(conversation_id, before=None, limit=None, before_id=None):
+    """
+    Archived messages of a conversation, newest first, optionally older than
+    before (and, among messages sharing that timestamp, ordered before before_id)
+    """
+    archives = ChatMessageArchive.objects.filter(conversation_id=conversation_id).order_by('-end_time')
+    if before:
+        # Messages sharing the cursor's timestamp can sit in the segment that starts with it
+        archives = archives.filter(start_time__lte=before) if before_id else archives.filter(start_time__lt=before)
+    cursor = (before, str(before_id)) if before_id else None
+
+    records = []
+    for archive in archives.iterator(chunk_size=4):
+        segment = [
+            record for record in sorted(decode_segment(archive.data), key=record_position, reverse=True)
+            if not before or (
+                record_position(record) < cursor if cursor else parse_datetime(record['timestamp']) < before
+            )
+        ]
+        records.extend(segment)
+        if limit and len(records) >= limit:
+            records = records[:limit]
+            break
+
+    return hydrate(conversation_id, records)
+
+
+def history_page(conversation_id, before=None, limit=50, before_id=None):
+    """
+    Up to `limit` messages older than the (before, before_id) cursor - the
+    oldest message of the previous page - or the latest ones, oldest first,
+    continuing into the archive once the live table runs out. Without
+    before_id everything at the `before` timestamp is skipped.
+    """
+    messages = ChatMessage.objects.filter(
+        conversation_id=conversation_id
+    ).select_related('sender', 'session_key').order_by('-timestamp', '-id')
+    if before and before_id:
+        messages = messages.filter(Q(timestamp__lt=before) | Q(timestamp=before, id__lt=before_id))
+    elif before:
+        messages = messages.filter(timestamp__lt=before)
+
+    page = list(messages[:limit])
+    if len(page) < limit:
+        if page:
+            before, before_id = page[-1].timestamp, page[-1].id
+        page += archived_messages(
+            conversation_id,
+            before=before,
+            limit=limit - len(page),
+            before_id=before_id
+        )
+    return list(reversed(page))
@@ -0,0 +1,106 @@
+"""
+Chat Search - full-text search over the plain text copy of chat messages
+
+PostgreSQL uses a GIN index on to_tsvector('simple', text); SQLite (dev) uses
+the core_chatmessage_fts FTS5 table. Both are created by migration
+0005_chat_message_search and kept up to date by the database on insert.
+Other backends fall back to a case-insensitive scan.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import ChatMessage
+
+MAX_SEARCH_TERMS = 8
+SNIPPET_CONTEXT = 60
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class UnknownCursor(Exception):
+    """The `before` message is not in the conversation (deleted or archived)"""
+
+
+def search_terms(query):
+    """Split a user query into word terms; anything else is dropped"""
+    return [term.lower() for term in TERM_RE.findall(query or '')][:MAX_SEARCH_TERMS]
+
+
+def full_text_filter(terms):
+    """Filter matching every term as a word prefix, using the vendor's index"""
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return RawSQL(
+            "to_tsvector('simple', \"core_chatmessage\".\"text\") @@ to_tsquery('simple', %s)",
+            (tsquery,),
+            output_field=BooleanField()
+        )
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return RawSQL(
+            '"core_chatmessage"."id" IN (SELECT message_id FROM core_chatmessage_fts WHERE core_chatmessage_fts MATCH %s)',
+            (match,),
+            output_field=BooleanField()
+        )
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(text__icontains=term)
+    return condition
+
+
+def build_snippet(text, terms):
+    """
+    Excerpt of text around the first hit.
+    Returns (snippet, highlights) where highlights are [start, end] offsets into the snippet.
+    """
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+    first = pattern.search(text)
+    start = max(0, first.start() - SNIPPET_CONTEXT) if first else 0
+    end = min(len(text), (first.end() if first else 0) + SNIPPET_CONTEXT * 2)
+
+    snippet = text[start:end]
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+
+    highlights = [
+        [match.start() + len(prefix), match.end() + len(prefix)]
+        for match in pattern.finditer(snippet)
+    ]
+    return prefix + snippet + suffix, highlights
+
+
+def search_messages(conversation_id, query, before=None, limit=20):
+    """
+    Newest-first messages in a conversation whose text matches every query term.
+    before is a message id; only hits after it in (timestamp, id) order are
+    returned (pagination cursor), so ties on timestamp are neither skipped
+    nor repeated. Raises UnknownCursor if the message no longer exists.
+    Returns: (hits, terms) where hits is a list of ChatMessage
+    """
+    terms = search_terms(query)
+    if not terms:
+        return [], terms
+
+    messages = ChatMessage.objects.filter(
+        conversation_id=conversation_id
+    ).exclude(text='').filter(full_text_filter(terms))
+
+    if before:
+        cursor = ChatMessage.objects.filter(
+            conversation_id=conversation_id,
+            id=before
+        ).values('timestamp', 'id').first()
+        if cursor is None:
+            raise UnknownCursor(before)
+        messages = messages.filter(
+            Q(timestamp__lt=cursor['timestamp']) |
+            Q(timestamp=cursor['timestamp'], id__lt=cursor['id'])
+        )
+
+    hits = list(messages.select_related('sender').order_by('-timestamp', '-id')[:limit])
+    return hits, terms
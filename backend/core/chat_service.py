@@ -0,0 +1,434 @@
+"""
+Chat Service - conversation session keys and message helpers shared by the
+chat API views and WebSocket consumers
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+
+from .models import ChatConversation, ChatMessage, ChatSessionKey
+from .encryption_service import MessageEncryptionService
+
+# Unwrapped session keys are cached so a send or a history read costs at most
+# one RSA operation per key epoch instead of one per message per recipient.
+# Raw key material never leaves process memory: the shared cache (Redis) would
+# let anyone who can read it decrypt the whole epoch.
+SESSION_KEY_CACHE_TIMEOUT = 60 * 60
+SESSION_KEY_CACHE_SIZE = 1024
+
+# Participant ids per conversation. Entries are keyed by a generation that is
+# bumped once a membership change commits, so a reader that loaded the old
+# membership can only ever cache it under a generation nobody reads any more;
+# the short timeout bounds anything that slips through (e.g. an evicted generation)
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 5
+
+class SessionKeyCache:
+    """Bounded, per-process LRU of unwrapped AES keys with a time-to-live"""
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_key_id):
+        with self.lock:
+            entry = self.entries.get(session_key_id)
+            if entry is None:
+                return None
+            aes_key, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[session_key_id]
+                return None
+            self.entries.move_to_end(session_key_id)
+            return aes_key
+
+    def set(self, session_key_id, aes_key):
+        with self.lock:
+            self.entries[session_key_id] = (aes_key, time.monotonic() + self.timeout)
+            self.entries.move_to_end(session_key_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+session_key_cache = SessionKeyCache(SESSION_KEY_CACHE_SIZE, SESSION_KEY_CACHE_TIMEOUT)
+
+
+def membership_generation_key(conversation_id):
+    return f'chat_members_gen_{conversation_id}'
+
+
+def membership_generation(conversation_id):
+    key = membership_generation_key(conversation_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def membership_cache_key(conversation_id, generation):
+    return f'chat_members_{conversation_id}_{generation}'
+
+
+def get_member_ids(conversation_id):
+    """Set of participant ids (as strings) for a conversation, served from cache"""
+    # Read the generation before the rows: if a change commits in between, what
+    # we load is cached under the generation it retires
+    key = membership_cache_key(conversation_id, membership_generation(conversation_id))
+    member_ids = cache.get(key)
+    if member_ids is None:
+        member_ids = frozenset(
+            str(member_id) for member_id in ChatConversation.participants.through.objects.filter(
+                chatconversation_id=conversation_id
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(key, member_ids, MEMBERSHIP_CACHE_TIMEOUT)
+    return member_ids
+
+
+def is_member(conversation_id, user):
+    """Check that a user participates in a conversation without touching the DB"""
+    return str(user.id) in get_member_ids(conversation_id)
+
+
+def invalidate_membership(conversation_ids):
+    """Retire the cached membership of these conversations once the current transaction commits"""
+    keys = [membership_generation_key(conversation_id) for conversation_id in conversation_ids]
+
+    def bump():
+        generation = uuid.uuid4().hex
+        cache.set_many({key: generation for key in keys}, None)
+
+    if keys:
+        transaction.on_commit(bump)
+
+
+def display_name(user):
+    return f"{user.first_name} {user.last_name}".strip() or user.username
+
+
+def user_group_name(user_id):
+    """Channel group joined by every chat socket a user has open"""
+    return f'chat_user_{user_id}'
+
+
+def conversation_group_names(conversation_id):
+    """
+    Channel groups that receive a conversation's events: the legacy
+    per-conversation room plus the user group of every participant
+    """
+    return [f'chat_{conversation_id}'] + [
+        user_group_name(member_id) for member_id in get_member_ids(conversation_id)
+    ]
+
+
+def broadcast_to_conversation(conversation_id, event):
+    """Fan an event out to everyone in a conversation (sync callers)"""
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        return
+    for group_name in conversation_group_names(conversation_id):
+        async_to_sync(channel_layer.group_send)(group_name, event)
+
+
+def participant_hash(user_ids):
+    """Canonical hash of a participant set, independent of order"""
+    member_ids = sorted({str(user_id) for user_id in user_ids})
+    return hashlib.sha256(','.join(member_ids).encode()).hexdigest()
+
+
+def get_or_create_direct_conversation(company_id, participants):
+    """
+    Return the company's direct conversation between exactly two users,
+    creating it if needed. Returns: (conversation, created)
+    """
+    lookup = {
+        'company_id': company_id,
+        'is_group': False,
+        'participant_hash': participant_hash(p.id for p in participants),
+    }
+    existing = ChatConversation.objects.filter(**lookup).first()
+    if existing:
+        return existing, False
+
+    try:
+        with transaction.atomic():
+            conversation = ChatConversation.objects.create(**lookup)
+            conversation.participants.set(participants)
+    except IntegrityError:
+        # Concurrent request created the same DM first
+        return ChatConversation.objects.get(**lookup), False
+
+    return conversation, True
+
+
+def refresh_participant_hashes(conversation_ids):
+    """Keep direct message hashes in step with membership changes"""
+    conversations = ChatConversation.objects.filter(
+        id__in=conversation_ids,
+        is_group=False
+    ).prefetch_related('participants')
+
+    for conversation in conversations:
+        member_ids = [p.id for p in conversation.participants.all()]
+        new_hash = participant_hash(member_ids) if len(member_ids) == 2 else ''
+        if new_hash == conversation.participant_hash:
+            continue
+        try:
+            with transaction.atomic():
+                ChatConversation.objects.filter(pk=conversation.pk).update(participant_hash=new_hash)
+        except IntegrityError:
+            # Pair already has its own DM - this one stops being the canonical thread
+            ChatConversation.objects.filter(pk=conversation.pk).update(participant_hash='')
+
+
+def rotate_session_key(conversation, participants):
+    """
+    Start a new key epoch for a conversation, wrapped once for each participant.
+    Any previously active epoch is retired; its messages stay decryptable.
+    """
+    aes_key = MessageEncryptionService.generate_session_key()
+    encrypted_keys = MessageEncryptionService.wrap_key(
+        aes_key,
+        {str(p.id): p.rsa_public_key for p in participants}
+    )
+
+    try:
+        with transaction.atomic():
+            conversation.session_keys.filter(is_active=True).update(is_active=False)
+            last_epoch = conversation.session_keys.aggregate(last=Max('epoch'))['last'] or 0
+            session_key = ChatSessionKey.objects.create(
+                conversation=conversation,
+                epoch=last_epoch + 1,
+                encrypted_keys=encrypted_keys,
+                company_id=conversation.company_id
+            )
+    except IntegrityError:
+        # Another request rotated concurrently - use the epoch it created
+        return conversation.session_keys.filter(is_active=True).first()
+
+    session_key_cache.set(session_key.id, aes_key)
+    return session_key
+
+
+def get_active_session_key(conversation, participants):
+    """Return the conversation's current key epoch, rotating it when exhausted"""
+    session_key = conversation.session_keys.filter(is_active=True).first()
+    if session_key and session_key.message_count < settings.CHAT_SESSION_KEY_ROTATE_AFTER:
+        return session_key
+    return rotate_session_key(conversation, participants)
+
+
+def retire_session_keys(conversation_ids):
+    """Retire active epochs so the next message is keyed to the current members"""
+    ChatSessionKey.objects.filter(
+        conversation_id__in=conversation_ids,
+        is_active=True
+    ).update(is_active=False)
+
+
+def get_session_aes_key(session_key, user):
+    """
+    Return the raw AES key of an epoch for a user who holds a wrapped copy of it.
+    Returns None if the user was not a member when the epoch was created.
+    """
+    encrypted_aes_key = session_key.encrypted_keys.get(str(user.id))
+    if not encrypted_aes_key:
+        return None
+
+    aes_key = session_key_cache.get(session_key.id)
+    if aes_key is None:
+        if not user.rsa_private_key_encrypted:
+            return None
+        aes_key = MessageEncryptionService.unwrap_key(encrypted_aes_key, user.rsa_private_key_encrypted)
+        session_key_cache.set(session_key.id, aes_key)
+    return aes_key
+
+
+def encrypt_for_conversation(conversation, sender, content):
+    """
+    Encrypt message content with the conversation's session key.
+    Returns the encryption fields for ChatMessage (empty if encryption is unavailable).
+    """
+    participants = list(conversation.participants.all())
+
+    # Only use encryption if ALL participants have keys
+    missing = [p for p in participants if not p.rsa_public_key]
+    if missing or not participants:
+        for participant in missing:
+            print(f"Warning: Participant {participant.username} (ID:{participant.id}) doesn't have encryption keys")
+        return {'encrypted_content': '', 'encrypted_keys': {}}
+
+    try:
+        session_key = get_active_session_key(conversation, participants)
+        aes_key = get_session_aes_key(session_key, sender) if session_key else None
+        if aes_key is None:
+            return {'encrypted_content': '', 'encrypted_keys': {}}
+
+        ChatSessionKey.objects.filter(pk=session_key.pk).update(message_count=F('message_count') + 1)
+        return {
+            'encrypted_content': MessageEncryptionService.encrypt_with_key(content, aes_key),
+            'encrypted_keys': {},
+            'session_key': session_key,
+        }
+    except Exception as e:
+        print(f"Encryption failed: {str(e)}, falling back to plain text")
+        return {'encrypted_content': '', 'encrypted_keys': {}}
+
+
+def create_chat_message(conversation, sender, content, client_id='', extra_fields=None):
+    """
+    Encrypt and store a message, then bump the conversation timestamp.
+    A repeated client_id from the same sender in the same conversation returns the stored message.
+    extra_fields are stored as-is (e.g. attachment details).
+    Returns: (message, created)
+    """
+    if client_id:
+        existing = ChatMessage.objects.select_related('sender').filter(
+            conversation=conversation, sender=sender, client_id=client_id
+        ).first()
+        if existing:
+            return existing, False
+
+    encryption_fields = encrypt_for_conversation(conversation, sender, content)
+    try:
+        with transaction.atomic():
+            message = ChatMessage.objects.create(
+                conversation=conversation,
+                sender=sender,
+                text=content,  # Store plain text as backup
+                company_id=sender.company_id,
+                read_by=[str(sender.id)],
+                client_id=client_id,
+                **encryption_fields,
+                **(extra_fields or {})
+            )
+    except IntegrityError:
+        if not client_id:
+            raise
+        # Concurrent retry of the same send won the race
+        return ChatMessage.objects.select_related('sender').get(
+            conversation=conversation, sender=sender, client_id=client_id
+        ), False
+
+    # Update conversation timestamp
+    conversation.updated_at = message.timestamp
+    conversation.save(update_fields=['updated_at'])
+
+    return message, True
+
+
+def mark_messages_read(conversation_id, user, message_ids):
+    """Add the user to read_by on the given messages. Returns the ids that changed."""
+    user_id = str(user.id)
+    messages = ChatMessage.objects.filter(
+        conversation_id=conversation_id,
+        id__in=parse_uuids(message_ids)
+    ).exclude(sender=user).only('id', 'read_by')
+
+    updated = []
+    for message in messages:
+        if user_id not in [str(uid) for uid in (message.read_by or [])]:
+            message.read_by = (message.read_by or []) + [user_id]
+            updated.append(message)
+
+    ChatMessage.objects.bulk_update(updated, ['read_by'])
+    return [str(message.id) for message in updated]
+
+
+def parse_uuids(values):
+    """Drop anything that isn't a valid UUID so lookups can't raise"""
+    parsed = []
+    for value in values or []:
+        try:
+            parsed.append(uuid.UUID(str(value)))
+        except ValueError:
+            continue
+    return parsed
+
+
+def decrypt_for_user(message, user, key_cache=None):
+    """
+    Decrypt a message for a user, falling back to the plain text backup.
+    key_cache is an optional dict reused across a batch so each epoch is
+    unwrapped once. Returns None if there is no readable content.
+    """
+    if key_cache is None:
+        key_cache = {}
+
+    try:
+        if message.session_key_id and message.encrypted_content:
+            if message.session_key_id not in key_cache:
+                key_cache[message.session_key_id] = get_session_aes_key(message.session_key, user)
+            aes_key = key_cache[message.session_key_id]
+            if aes_key is not None:
+                return MessageEncryptionService.decrypt_with_key(message.encrypted_content, aes_key)
+        elif message.encrypted_content and message.encrypted_keys and user.rsa_private_key_encrypted:
+            # Legacy messages carry a per-message AES key for each recipient
+            encrypted_aes_key = message.encrypted_keys.get(str(user.id))
+            if encrypted_aes_key:
+                return MessageEncryptionService.decrypt_message(
+                    message.encrypted_content,
+                    encrypted_aes_key,
+                    user.rsa_private_key_encrypted
+                )
+    except Exception as e:
+        print(f"Error decrypting message {message.id}: {e}")
+
+    # User might have been added to conversation later, or there are no keys
+    if message.text:
+        return message.text
+    return '' if message.attachment else None
+
+
+def is_read_by(message, user):
+    return str(user.id) in [str(uid) for uid in (message.read_by or [])]
+
+
+def attachment_payload(message):
+    if not message.attachment:
+        return None
+    return {
+        'url': message.attachment.url,
+        'name': message.attachment_name,
+        'size': message.attachment_size,
+        'contentType': message.attachment_content_type,
+    }
+
+
+def message_payload(message, text):
+    """Message body delivered over the socket to every participant"""
+    return {
+        'id': str(message.id),
+        'conversationId': str(message.conversation_id),
+        'clientId': message.client_id or None,
+        'senderId': str(message.sender_id),
+        'senderName': display_name(message.sender),
+        'senderAvatar': message.sender.avatar,
+        'text': text,
+        'attachment': attachment_payload(message),
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def serialize_message(message, user, text):
+    return {
+        'id': str(message.id),
+        'senderId': str(message.sender.id),
+        'senderName': display_name(message.sender),
+        'senderAvatar': message.sender.avatar,
+        'text': text,
+        'attachment': attachment_payload(message),
+        'timestamp': message.timestamp.isoformat(),
+        'read': is_read_by(message, user),
+    }
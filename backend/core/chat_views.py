@@ -5,13 +5,18 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
 from django.db.models import Q, Max
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 from .models import User, ChatConversation, ChatMessage
-from .encryption_service import MessageEncryptionService
+from . import chat_archive, chat_search
+from .chat_service import (
+    broadcast_to_conversation, create_chat_message, decrypt_for_user, display_name,
+    get_or_create_direct_conversation, is_member, is_read_by, mark_messages_read, message_payload,
+    parse_uuids, serialize_message
+)
 
 
 @api_view(['GET'])
@@ -37,6 +42,12 @@ def get_conversations(request):
         # Get last message
         last_msg = conv.messages.order_by('-timestamp').first()
         
+        # Live updates arrive on the user's chat socket; this seeds the sidebar count
+        unread_count = sum(
+            1 for msg in conv.messages.all()
+            if msg.sender_id != user.id and not is_read_by(msg, user)
+        )
+        
         # If it's a direct conversation (2 participants)
         if conv.participants.count() == 2 and not conv.is_group:
             other_user = other_participants.first()
@@ -48,7 +59,7 @@ def get_conversations(request):
                     'participantAvatar': other_user.avatar,
                     'participantRole': other_user.role,
                     'isGroup': False,
-                    'unreadCount': 0,  # Calculate unread
+                    'unreadCount': unread_count,
                     'isOnline': True,  # Set to True for now (TODO: implement WebSocket presence tracking)
                     'lastMessage': '',  # Don't send encrypted content
                     'lastMessageTime': last_msg.timestamp.isoformat() if last_msg else None,
@@ -64,7 +75,7 @@ def get_conversations(request):
                 'groupName': group_info.group_name if group_info else 'Unnamed Group',
                 'groupAvatar': group_info.group_avatar if group_info else None,
                 'memberIds': [str(p.id) for p in conv.participants.all()],
-                'unreadCount': 0,
+                'unreadCount': unread_count,
                 'isOnline': True,
                 'lastMessage': '',
                 'lastMessageTime': last_msg.timestamp.isoformat() if last_msg else None,
@@ -77,81 +88,133 @@ def get_conversations(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_messages(request, conversation_id):
-    """Get all messages for a conversation (decrypted for current user)"""
+    """
+    Get a conversation's messages (decrypted for current user), oldest first;
+    the latest `limit` unless paging further back with `before`, continuing
+    into archived messages
+    
+    Query params:
+        before: ISO timestamp - return the `limit` messages older than it;
+                pass the oldest returned timestamp to load the next page
+        before_id: id of that oldest message, so messages sharing its
+                   timestamp are neither skipped nor repeated
+        around: message id - return only `limit` messages either side of it
+        limit: page/window size (default 50 for pages, 25 for `around`; max 100)
+    """
     user = request.user
     
     # Verify user is participant
-    conversation = get_object_or_404(
-        ChatConversation, 
-        id=conversation_id,
-        participants=user
-    )
+    if not is_member(conversation_id, user):
+        raise Http404
     
     # Get messages
     messages = ChatMessage.objects.filter(
-        conversation=conversation
-    ).select_related('sender').order_by('timestamp')
+        conversation_id=conversation_id
+    ).select_related('sender', 'session_key').order_by('timestamp')
     
-    # Decrypt messages
+    around = parse_uuids([request.query_params.get('around')])
+    before = request.query_params.get('before')
+    if around:
+        anchor = messages.filter(id=around[0]).values('timestamp').first()
+        if not anchor:
+            raise Http404
+        limit = page_limit(request, default=25)
+        older = messages.filter(timestamp__lt=anchor['timestamp']).order_by('-timestamp')[:limit]
+        newer = messages.filter(timestamp__gte=anchor['timestamp'])[:limit + 1]
+        messages = list(reversed(older)) + list(newer)
+    else:
+        # A '+' in an unencoded UTC offset arrives as a space
+        before_time = parse_datetime(before.replace(' ', '+')) if before else None
+        if before and before_time is None:
+            return Response(
+                {'error': 'before must be an ISO timestamp'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        before_id = parse_uuids([request.query_params.get('before_id')])
+        if request.query_params.get('before_id') and not (before_id and before_time):
+            return Response(
+                {'error': 'before_id must be a message id, sent with before'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        messages = chat_archive.history_page(
+            conversation_id,
+            before_time,
+            page_limit(request, default=50),
+            before_id=before_id[0] if before_id else None
+        )
+    
+    # Decrypt messages, unwrapping each conversation key epoch only once
     decrypted_messages = []
-    user_private_key = user.rsa_private_key_encrypted
+    key_cache = {}
     
     for msg in messages:
-        try:
-            # Check if user has encryption keys AND message is encrypted
-            if user_private_key and msg.encrypted_content and msg.encrypted_keys:
-                # Get encrypted AES key for this user
-                encrypted_aes_key = msg.encrypted_keys.get(str(user.id))
-                
-                if not encrypted_aes_key:
-                    # User might have been added to conversation later, try plain text
-                    print(f"Message {msg.id} has no encrypted key for user {user.id}, trying plain text")
-                    if msg.text:
-                        decrypted_content = msg.text
-                    else:
-                        continue
-                else:
-                    # Decrypt message
-                    decrypted_content = MessageEncryptionService.decrypt_message(
-                        msg.encrypted_content,
-                        encrypted_aes_key,
-                        user_private_key
-                    )
-            elif msg.text:
-                # Fallback to legacy text field (for backward compatibility or no encryption keys)
-                decrypted_content = msg.text
-            else:
-                # No content available at all
-                print(f"Message {msg.id} has no content (no text and no encrypted_content)")
-                continue
-            
-            decrypted_messages.append({
-                'id': str(msg.id),
-                'senderId': str(msg.sender.id),
-                'senderName': f"{msg.sender.first_name} {msg.sender.last_name}".strip() or msg.sender.username,
-                'senderAvatar': msg.sender.avatar,
-                'text': decrypted_content,
-                'timestamp': msg.timestamp.isoformat(),
-                'read': user.id in msg.read_by if msg.read_by else False,
-            })
-        except Exception as e:
-            print(f"Error processing message {msg.id}: {e}")
-            # Try fallback to legacy text field
-            if msg.text:
-                decrypted_messages.append({
-                    'id': str(msg.id),
-                    'senderId': str(msg.sender.id),
-                    'senderName': f"{msg.sender.first_name} {msg.sender.last_name}".strip() or msg.sender.username,
-                    'senderAvatar': msg.sender.avatar,
-                    'text': msg.text,
-                    'timestamp': msg.timestamp.isoformat(),
-                    'read': user.id in msg.read_by if msg.read_by else False,
-                })
+        decrypted_content = decrypt_for_user(msg, user, key_cache)
+        if decrypted_content is None:
+            # No key for this user and no plain text backup
+            print(f"Message {msg.id} has no readable content for user {user.id}")
             continue
+        decrypted_messages.append(serialize_message(msg, user, decrypted_content))
     
     return Response(decrypted_messages)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_messages(request, conversation_id):
+    """
+    Full-text search within a conversation
+    
+    Query params:
+        q: search text; every word must match (as a word prefix)
+        before: message id cursor from the previous page's `next`
+        limit: hits per page (default 20, max 100)
+    Each hit's id can be passed to get_messages as `around` to open history there.
+    """
+    user = request.user
+    
+    if not is_member(conversation_id, user):
+        raise Http404
+    
+    before = request.query_params.get('before')
+    cursor = parse_uuids([before])
+    if before and not cursor:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    limit = page_limit(request, default=20)
+    try:
+        hits, terms = chat_search.search_messages(
+            conversation_id,
+            request.query_params.get('q', ''),
+            before=cursor[0] if cursor else None,
+            limit=limit
+        )
+    except chat_search.UnknownCursor:
+        # Deleted or archived since the previous page: restarting would loop the client
+        return Response({'error': 'Cursor message no longer exists'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = []
+    for msg in hits:
+        snippet, highlights = chat_search.build_snippet(msg.text, terms)
+        results.append({
+            'id': str(msg.id),
+            'senderId': str(msg.sender_id),
+            'senderName': display_name(msg.sender),
+            'timestamp': msg.timestamp.isoformat(),
+            'snippet': snippet,
+            'highlights': highlights,
+        })
+    
+    return Response({
+        'results': results,
+        'next': results[-1]['id'] if len(results) == limit else None,
+    })
+
+
+def page_limit(request, default, maximum=100):
+    try:
+        return max(1, min(int(request.query_params.get('limit', default)), maximum))
+    except (TypeError, ValueError):
+        return default
+
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -168,98 +231,27 @@ def send_message(request):
         )
     
     # Get conversation
-    conversation = get_object_or_404(
-        ChatConversation,
-        id=conversation_id,
-        participants=user
-    )
+    conversation_ids = parse_uuids([conversation_id])
+    if not conversation_ids or not is_member(conversation_ids[0], user):
+        raise Http404
+    conversation = get_object_or_404(ChatConversation, id=conversation_ids[0])
     
-    # Get recipient public keys
-    participants = conversation.participants.all()
-    recipient_keys = {}
-    encryption_available = True
+    # Encrypt with the conversation's session key and save
+    client_id = str(request.data.get('client_id') or '')[:64]
+    message, created = create_chat_message(conversation, user, content, client_id)
     
-    for participant in participants:
-        if participant.rsa_public_key:
-            recipient_keys[str(participant.id)] = participant.rsa_public_key
-        else:
-            encryption_available = False
-            print(f"Warning: Participant {participant.username} (ID:{participant.id}) doesn't have encryption keys")
-    
-    # Only use encryption if ALL participants have keys
-    if encryption_available and recipient_keys:
-        # Encrypt message
-        try:
-            encrypted_data = MessageEncryptionService.encrypt_message(content, recipient_keys)
-            
-            # Save encrypted message
-            message = ChatMessage.objects.create(
-                conversation=conversation,
-                sender=user,
-                encrypted_content=encrypted_data['encrypted_content'],
-                encrypted_keys=encrypted_data['encrypted_keys'],
-                text=content,  # Store plain text as backup
-                company_id=user.company_id,
-                read_by=[user.id]
-            )
-        except Exception as e:
-            print(f"Encryption failed: {str(e)}, falling back to plain text")
-            # Fallback to plain text
-            message = ChatMessage.objects.create(
-                conversation=conversation,
-                sender=user,
-                text=content,
-                encrypted_content='',
-                encrypted_keys={},
-                company_id=user.company_id,
-                read_by=[user.id]
-            )
-    else:
-        # Store as plain text (encryption keys not available for all participants)
-        print(f"Storing message as plain text - encryption not available for all participants")
-        message = ChatMessage.objects.create(
-            conversation=conversation,
-            sender=user,
-            text=content,
-            encrypted_content='',
-            encrypted_keys={},
-            company_id=user.company_id,
-            read_by=[user.id]
-        )
-    
-    # Update conversation timestamp
-    conversation.updated_at = message.timestamp
-    conversation.save()
-    
-    # Broadcast via WebSocket (if consumer is connected)
-    channel_layer = get_channel_layer()
-    if channel_layer:
-        async_to_sync(channel_layer.group_send)(
-            f'chat_{conversation_id}',
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': str(message.id),
-                    'senderId': str(user.id),
-                    'senderName': f"{user.first_name} {user.last_name}".strip() or user.username,
-                    'senderAvatar': user.avatar,
-                    'timestamp': message.timestamp.isoformat(),
-                    # Don't send encrypted content via websocket for security
-                    # Clients should fetch via API
-                }
-            }
-        )
+    # Deliver to every participant's chat sockets
+    if created:
+        broadcast_to_conversation(conversation.id, {
+            'type': 'chat_message',
+            'message': message_payload(message, content)
+        })
     
     # Return the message
-    return Response({
-        'id': str(message.id),
-        'senderId': str(user.id),
-        'senderName': f"{user.first_name} {user.last_name}".strip() or user.username,
-        'senderAvatar': user.avatar,
-        'text': content,  # Return the original content
-        'timestamp': message.timestamp.isoformat(),
-        'read': True,
-    }, status=status.HTTP_201_CREATED)
+    return Response(
+        serialize_message(message, user, message.text or content),
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    )
 
 
 @api_view(['POST'])
@@ -276,31 +268,33 @@ def create_conversation(request):
         )
     
     # Include current user in participants
-    all_participant_ids = set([user.id] + [int(pid) for pid in participant_ids])
+    participants = list(User.objects.filter(
+        id__in=set([user.id] + parse_uuids(participant_ids)),
+        company_id=user.company_id
+    ))
+    if user not in participants:
+        participants.append(user)
     
-    # Check if conversation already exists (for direct messages)
-    if len(all_participant_ids) == 2:
-        existing = ChatConversation.objects.filter(
-            is_group=False,
-            company_id=user.company_id
+    if len(participants) < 2:
+        return Response(
+            {'error': 'At least one participant is required'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        for conv in existing:
-            conv_participant_ids = set(conv.participants.values_list('id', flat=True))
-            if conv_participant_ids == all_participant_ids:
-                return Response({
-                    'id': str(conv.id),
-                    'exists': True
-                })
     
-    # Create new conversation
-    conversation = ChatConversation.objects.create(
-        company_id=user.company_id,
-        is_group=len(all_participant_ids) > 2
-    )
-    
-    # Add participants
-    participants = User.objects.filter(id__in=all_participant_ids)
-    conversation.participants.set(participants)
+    # Direct messages are unique per pair of users
+    if len(participants) == 2:
+        conversation, created = get_or_create_direct_conversation(user.company_id, participants)
+        if not created:
+            return Response({
+                'id': str(conversation.id),
+                'exists': True
+            })
+    else:
+        conversation = ChatConversation.objects.create(
+            company_id=user.company_id,
+            is_group=True
+        )
+        conversation.participants.set(participants)
     
     return Response({
         'id': str(conversation.id),
@@ -315,10 +309,17 @@ def mark_as_read(request, message_id):
     user = request.user
     
     message = get_object_or_404(ChatMessage, id=message_id)
+    if not is_member(message.conversation_id, user):
+        raise Http404
     
     # Add user to read_by list if not already there
-    if user.id not in message.read_by:
-        message.read_by.append(user.id)
-        message.save()
+    updated_ids = mark_messages_read(message.conversation_id, user, [message.id])
+    if updated_ids:
+        broadcast_to_conversation(message.conversation_id, {
+            'type': 'read_receipt',
+            'conversation_id': str(message.conversation_id),
+            'user_id': str(user.id),
+            'message_ids': updated_ids
+        })
     
     return Response({'status': 'success'})
@@ -1,16 +1,102 @@
 """
 WebSocket consumer for real-time updates
 """
+import asyncio
+
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 
+from .models import ChatConversation
+from .chat_service import (
+    conversation_group_names, create_chat_message, decrypt_for_user, is_member,
+    mark_messages_read, message_payload, parse_uuids, user_group_name
+)
+
 User = get_user_model()
 
 # Global dictionary to track online users by company
 # Format: {company_id: set(user_ids)}
 online_users = {}
 
+# Typing frames are coalesced per conversation into at most one snapshot per
+# interval; a typer that stops refreshing is dropped after the TTL
+TYPING_SNAPSHOT_INTERVAL = 1.0
+TYPING_TTL = 5.0
+
+# Typing state for sockets connected to this worker
+# Format: {conversation_id: {'typing': {user_id: (user_name, expires_at)}, 'stopped': set(user_ids), 'dirty': bool}}
+typing_state = {}
+
+
+def set_typing(conversation_id, user_id, user_name, is_typing):
+    """
+    Record a typing frame. Returns True if a snapshot task must be started
+    for the conversation.
+    """
+    state = typing_state.get(conversation_id)
+    if state is None:
+        if not is_typing:
+            return False
+        state = typing_state[conversation_id] = {'typing': {}, 'stopped': set(), 'dirty': False}
+        started = True
+    else:
+        started = False
+    
+    if is_typing:
+        if user_id not in state['typing']:
+            state['dirty'] = True
+        state['typing'][user_id] = (user_name, asyncio.get_running_loop().time() + TYPING_TTL)
+        state['stopped'].discard(user_id)
+    elif state['typing'].pop(user_id, None):
+        state['stopped'].add(user_id)
+        state['dirty'] = True
+    return started
+
+
+async def publish_typing_snapshots(channel_layer, conversation_id):
+    """Periodically fan out who is typing in a conversation until nobody is"""
+    loop = asyncio.get_running_loop()
+    last_sent = 0
+    
+    try:
+        while True:
+            await asyncio.sleep(TYPING_SNAPSHOT_INTERVAL)
+            state = typing_state[conversation_id]
+            now = loop.time()
+            
+            for user_id, (user_name, expires_at) in list(state['typing'].items()):
+                if expires_at <= now:
+                    del state['typing'][user_id]
+                    state['stopped'].add(user_id)
+            
+            # Re-announce active typers before remote clients expire them
+            refresh_due = state['typing'] and now - last_sent >= TYPING_TTL / 2
+            if state['dirty'] or state['stopped'] or refresh_due:
+                event = {
+                    'type': 'typing_snapshot',
+                    'conversation_id': conversation_id,
+                    'users': [
+                        {'user_id': user_id, 'user_name': user_name}
+                        for user_id, (user_name, expires_at) in state['typing'].items()
+                    ],
+                    'stopped': sorted(state['stopped']),
+                    'expires_in': TYPING_TTL
+                }
+                state['stopped'] = set()
+                state['dirty'] = False
+                last_sent = now
+            
+                group_names = await database_sync_to_async(conversation_group_names)(conversation_id)
+                for group_name in group_names:
+                    await channel_layer.group_send(group_name, event)
+            
+            if not state['typing'] and not state['stopped'] and not state['dirty']:
+                return
+    finally:
+        # A failed publish must not leave the conversation without a task
+        typing_state.pop(conversation_id, None)
+
 
 class UpdatesConsumer(AsyncJsonWebsocketConsumer):
     """
@@ -163,10 +249,227 @@ class UpdatesConsumer(AsyncJsonWebsocketConsumer):
             return None
 
 
-class ChatConsumer(AsyncJsonWebsocketConsumer):
+class BaseChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Chat frame handling shared by the per-conversation and per-user sockets
+    
+    Client frames:
+        {'type': 'send', 'client_id': str, 'content': str}
+        {'type': 'read', 'message_ids': [str], 'client_id': str (optional)}
+        {'type': 'typing', 'is_typing': bool}
+    Every send/read frame is answered with an 'ack' frame carrying its client_id.
+    Retrying a send with the same client_id never stores a second message.
+    Events are fanned out to the conversation room and to each participant's
+    user group, so both socket styles see the same traffic.
+    Typing frames are coalesced into at most one 'typing' snapshot per
+    conversation per TYPING_SNAPSHOT_INTERVAL, listing who is typing.
+    Frames refer to the socket's own conversation when it is bound to one
+    (conversation_id set on connect), otherwise to their 'conversation_id'.
+    """
+    
+    conversation_id = None
+    
+    def get_conversation_id(self, content):
+        """Conversation a client frame refers to"""
+        if self.conversation_id:
+            return self.conversation_id
+        conversation_id = parse_uuids([content.get('conversation_id')])
+        return str(conversation_id[0]) if conversation_id else None
+    
+    async def receive_json(self, content):
+        """Handle messages from WebSocket client"""
+        message_type = content.get('type')
+        
+        if message_type == 'ping':
+            # Keep-alive ping
+            await self.send_json({'type': 'pong'})
+            return
+        
+        conversation_id = self.get_conversation_id(content)
+        if not conversation_id:
+            await self.send_json({
+                'type': 'error',
+                'client_id': content.get('client_id'),
+                'error': 'conversation_id is required'
+            })
+            return
+        
+        if message_type == 'typing':
+            await self.handle_typing(conversation_id, content)
+        
+        elif message_type == 'send':
+            await self.handle_send(conversation_id, content)
+        
+        elif message_type == 'read':
+            await self.handle_read(conversation_id, content)
+    
+    async def fan_out(self, conversation_id, event):
+        """Send an event to every group that follows the conversation"""
+        for group_name in await self.get_group_names(conversation_id):
+            await self.channel_layer.group_send(group_name, event)
+    
+    async def handle_typing(self, conversation_id, content):
+        """Record typing state; other participants get it in the next snapshot"""
+        if not await self.is_participant(conversation_id):
+            return
+        
+        self.update_typing(conversation_id, bool(content.get('is_typing', False)))
+    
+    def update_typing(self, conversation_id, is_typing):
+        if not hasattr(self, 'typing_conversations'):
+            self.typing_conversations = set()
+        
+        if is_typing:
+            self.typing_conversations.add(conversation_id)
+        else:
+            self.typing_conversations.discard(conversation_id)
+        
+        user_name = f"{self.user.first_name} {self.user.last_name}".strip() or self.user.username
+        if set_typing(conversation_id, str(self.user.id), user_name, is_typing):
+            asyncio.ensure_future(publish_typing_snapshots(self.channel_layer, conversation_id))
+    
+    def stop_typing(self):
+        """Clear typing state left behind by this socket"""
+        for conversation_id in list(getattr(self, 'typing_conversations', ())):
+            self.update_typing(conversation_id, False)
+    
+    async def handle_send(self, conversation_id, content):
+        """Persist a message and deliver its body to every participant"""
+        client_id = str(content.get('client_id') or '')[:64]
+        text = content.get('content')
+        
+        if not client_id or not text:
+            await self.send_json({
+                'type': 'error',
+                'client_id': client_id or None,
+                'error': 'client_id and content are required'
+            })
+            return
+        
+        result = await self.persist_message(conversation_id, text, client_id)
+        if result is None:
+            await self.send_json({
+                'type': 'error',
+                'client_id': client_id,
+                'error': 'Conversation not found'
+            })
+            return
+        
+        payload, created = result
+        
+        # Only the first delivery of a client_id is broadcast; retries just get the ack
+        if created:
+            self.update_typing(conversation_id, False)
+            await self.fan_out(conversation_id, {
+                'type': 'chat_message',
+                'message': payload
+            })
+        
+        await self.send_json({
+            'type': 'ack',
+            'client_id': client_id,
+            'duplicate': not created,
+            'message': payload
+        })
+    
+    async def handle_read(self, conversation_id, content):
+        """Record read receipts and notify the other participants"""
+        message_ids = content.get('message_ids') or []
+        if not isinstance(message_ids, list):
+            message_ids = [message_ids]
+        
+        updated_ids = await self.persist_read(conversation_id, message_ids)
+        
+        if updated_ids:
+            await self.fan_out(conversation_id, {
+                'type': 'read_receipt',
+                'conversation_id': conversation_id,
+                'user_id': str(self.user.id),
+                'message_ids': updated_ids
+            })
+        
+        if content.get('client_id'):
+            await self.send_json({
+                'type': 'ack',
+                'client_id': str(content['client_id'])[:64],
+                'conversation_id': conversation_id,
+                'message_ids': updated_ids
+            })
+    
+    async def chat_message(self, event):
+        """
+        Handle chat_message events from channel layer
+        Forward the message body to WebSocket client
+        """
+        message = dict(event['message'])
+        message['read'] = message['senderId'] == str(self.user.id)
+        await self.send_json({
+            'type': 'new_message',
+            'conversation_id': message['conversationId'],
+            'message': message
+        })
+    
+    async def read_receipt(self, event):
+        """Handle read receipt broadcast"""
+        # The reader's own sockets use this to clear their unread badge
+        await self.send_json({
+            'type': 'read',
+            'conversation_id': event.get('conversation_id'),
+            'user_id': event['user_id'],
+            'message_ids': event['message_ids']
+        })
+    
+    async def typing_snapshot(self, event):
+        """Handle coalesced typing state broadcast"""
+        # Don't echo the user's own typing back to them
+        user_id = str(self.user.id)
+        users = [u for u in event['users'] if u['user_id'] != user_id]
+        stopped = [uid for uid in event['stopped'] if uid != user_id]
+        if users or stopped:
+            await self.send_json({
+                'type': 'typing',
+                'conversation_id': event['conversation_id'],
+                'users': users,
+                'stopped': stopped,
+                'expires_in': event['expires_in']
+            })
+    
+    @database_sync_to_async
+    def get_group_names(self, conversation_id):
+        return conversation_group_names(conversation_id)
+    
+    @database_sync_to_async
+    def is_participant(self, conversation_id):
+        """Check that the current user belongs to the conversation (cached)"""
+        return is_member(conversation_id, self.user)
+    
+    @database_sync_to_async
+    def persist_message(self, conversation_id, text, client_id):
+        """Store the message; returns (payload, created) or None if not a participant"""
+        if not is_member(conversation_id, self.user):
+            return None
+        conversation = ChatConversation.objects.filter(id=conversation_id).first()
+        if not conversation:
+            return None
+        
+        message, created = create_chat_message(conversation, self.user, text, client_id)
+        if not created:
+            text = decrypt_for_user(message, self.user)
+        return message_payload(message, text), created
+    
+    @database_sync_to_async
+    def persist_read(self, conversation_id, message_ids):
+        """Mark messages as read by the current user"""
+        if not is_member(conversation_id, self.user):
+            return []
+        return mark_messages_read(conversation_id, self.user, message_ids)
+
+
+class ChatConsumer(BaseChatConsumer):
     """
-    WebSocket consumer for real-time chat messaging
-    Handles message delivery, typing indicators, and read receipts
+    WebSocket consumer for a single conversation (ws/chat/<conversation_id>/)
+    Kept for clients that open one socket per thread; new clients should use
+    UserChatConsumer instead.
     """
     
     async def connect(self):
@@ -179,7 +482,13 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             return
         
         # Get conversation_id from URL
-        self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
+        self.conversation_id = str(self.scope['url_route']['kwargs']['conversation_id'])
+        
+        # Message bodies are delivered over this socket, so only participants may join
+        if not await self.is_participant(self.conversation_id):
+            await self.close()
+            return
+        
         self.room_group_name = f'chat_{self.conversation_id}'
         
         # Join chat room
@@ -198,52 +507,54 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
+        self.stop_typing()
+        
         # Leave chat room
         if hasattr(self, 'room_group_name'):
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
             )
+
+
+class UserChatConsumer(BaseChatConsumer):
+    """
+    Single multiplexed chat socket per user (ws/chat/)
+    Receives events for all of the user's conversations through its user
+    group; client frames name the conversation with 'conversation_id'.
+    """
     
-    async def receive_json(self, content):
-        """Handle messages from WebSocket client"""
-        message_type = content.get('type')
+    async def connect(self):
+        """Handle WebSocket connection"""
+        self.user = self.scope.get('user')
         
-        if message_type == 'ping':
-            # Keep-alive ping
-            await self.send_json({'type': 'pong'})
-            
-        elif message_type == 'typing':
-            # Broadcast typing indicator to other participants
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'typing_indicator',
-                    'user_id': str(self.user.id),
-                    'user_name': f"{self.user.first_name} {self.user.last_name}".strip() or self.user.username,
-                    'is_typing': content.get('is_typing', False)
-                }
-            )
-    
-    async def chat_message(self, event):
-        """
-        Handle chat_message events from channel layer
-        Forward message notification to WebSocket client
-        """
-        # Don't send encrypted content - client should fetch via API
+        # Only allow authenticated users
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+        
+        self.room_group_name = user_group_name(self.user.id)
+        
+        # Join the user's group
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
+        
+        # Send connection confirmation
         await self.send_json({
-            'type': 'new_message',
-            'message': event['message']
+            'type': 'connection_established',
+            'message': 'Connected to chat'
         })
     
-    async def typing_indicator(self, event):
-        """Handle typing indicator broadcast"""
-        # Don't send to the user who is typing
-        if str(event['user_id']) != str(self.user.id):
-            await self.send_json({
-                'type': 'typing',
-                'user_id': event['user_id'],
-                'user_name': event['user_name'],
-                'is_typing': event['is_typing']
-            })
-
+    async def disconnect(self, close_code):
+        """Handle WebSocket disconnection"""
+        self.stop_typing()
+        
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
@@ -0,0 +1,79 @@
+"""
+Contact keys - normalized mobile / email / name used to spot duplicate enquiries
+
+mobile_key is E.164 (+919876543210), email_key is the trimmed lower-cased
+address, and name_key is the Soundex code of each name word, sorted, so
+"Rahul Kumar", "rahul  kumaar" and "Kumar Rahul" share a key.
+"""
+import re
+
+from django.conf import settings
+
+E164_MAX_DIGITS = 15
+
+SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def normalize_mobile(value, country_code=None):
+    """
+    E.164 form of a phone number; numbers without a country code get the
+    default one. Anything longer than E.164's 15 digits isn't a phone number
+    and gets no key.
+    """
+    country_code = country_code or settings.DEFAULT_PHONE_COUNTRY_CODE
+    value = (value or '').strip()
+    digits = re.sub(r'\D', '', value)
+    if len(digits) < 7:
+        return ''
+    if value.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        # Trunk prefix (098765...) or bare national number: add the country code
+        digits = digits.lstrip('0')
+        if len(digits) == settings.PHONE_NATIONAL_LENGTH:
+            digits = f'{country_code}{digits}'
+    if len(digits) > E164_MAX_DIGITS:
+        return ''
+    return f'+{digits}'
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def soundex(word):
+    letters = [char for char in word.lower() if char.isalpha() and char.isascii()]
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for char in letters[1:]:
+        digit = SOUNDEX_CODES.get(char, '')
+        if digit and digit != previous:
+            code += digit
+        # h and w don't separate letters with the same code; vowels do
+        if char not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def name_key(value):
+    codes = sorted(filter(None, (soundex(word) for word in re.split(r'[\s.,-]+', value or ''))))
+    return ' '.join(codes)[:60]
+
+
+def contact_keys(mobile, email, name):
+    return {
+        'mobile_key': normalize_mobile(mobile),
+        'email_key': normalize_email(email),
+        'name_key': name_key(name),
+    }
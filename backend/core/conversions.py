@@ -0,0 +1,150 @@
+"""
+Conversions - turn enquiries into registrations server-side
+
+A conversion copies the enquiry's columns onto a new Registration, allocates
+its number, records the registration fee payment and the physical documents
+taken in, and marks the enquiry Converted, all in one transaction: either
+everything is there afterwards or nothing is.
+"""
+import functools
+
+from django.db import transaction
+
+from .models import Enquiry, Payment, Registration
+from .sequences import REGISTRATION_PREFIX, next_number, next_numbers
+from .serializers import RegistrationSerializer
+from .signals import broadcast_bulk_event
+from .student_documents import create_student_documents
+
+# Registration field -> Enquiry field, where the names differ
+RENAMED_FIELDS = {
+    'student_name': 'candidate_name',
+    'date_of_birth': 'dob',
+    'class10_percentage': 'class_10_percentage',
+    'class10_school_name': 'class_10_school_name',
+    'class10_board': 'class_10_board',
+    'class10_passing_year': 'class_10_passing_year',
+    'class10_place': 'class_10_place',
+    'class10_state': 'class_10_state',
+    'class12_percentage': 'class_12_percentage',
+    'preferences': 'preferred_locations',
+}
+NOT_COPIED = {'id', 'company_id', 'created_by', 'enquiry', 'registration_no'}
+
+
+class ConversionError(Exception):
+    pass
+
+
+@functools.cache
+def copied_fields():
+    """Registration field -> Enquiry field for every column the two share"""
+    enquiry_fields = {field.name for field in Enquiry._meta.concrete_fields}
+    mapping = {}
+    for field in Registration._meta.concrete_fields:
+        if field.name in NOT_COPIED:
+            continue
+        source = RENAMED_FIELDS.get(field.name, field.name)
+        if source in enquiry_fields:
+            mapping[field.name] = source
+    return mapping
+
+
+def registration_data(enquiry, overrides):
+    """Serializer input for the enquiry's registration; overrides win over copied values"""
+    data = {
+        field: getattr(enquiry, source)
+        for field, source in copied_fields().items()
+        if getattr(enquiry, source) is not None
+    }
+    data['registration_fee'] = enquiry.payment_amount or 0
+    data.update({key: value for key, value in overrides.items() if key != 'student_documents'})
+    data['enquiry'] = enquiry.id
+    return data
+
+
+def register(serializer, user, student_documents, registration_no=None):
+    """
+    Save a validated RegistrationSerializer with the company's next number
+    (or one the caller reserved), its fee payment and its physical documents.
+    Must run inside a transaction.
+    """
+    company_id = user.company_id
+    registration = serializer.save(
+        company_id=company_id,
+        created_by=user,
+        registration_no=registration_no or next_number(company_id, REGISTRATION_PREFIX)
+    )
+
+    # Auto-create payment
+    if registration.registration_fee > 0:
+        Payment.objects.create(
+            student_name=registration.student_name,
+            amount=registration.registration_fee,
+            type='Registration',
+            status='Success',
+            method='Cash', # Default
+            company_id=registration.company_id,
+            registration=registration
+        )
+
+    create_student_documents(registration, student_documents or [], user)
+    return registration
+
+
+def validated_serializer(enquiry, overrides, context=None):
+    """RegistrationSerializer for a locked enquiry, validated; raises ConversionError"""
+    if enquiry.status == 'Converted' or Registration.objects.filter(enquiry=enquiry).exists():
+        raise ConversionError('Enquiry is already converted')
+
+    serializer = RegistrationSerializer(data=registration_data(enquiry, overrides), context=context or {})
+    if not serializer.is_valid():
+        raise ConversionError(serializer.errors)
+    return serializer
+
+
+def convert_locked(enquiry, user, overrides, context=None):
+    """Convert an enquiry already locked by the caller's transaction"""
+    serializer = validated_serializer(enquiry, overrides, context)
+    return register(serializer, user, overrides.get('student_documents'))
+
+
+def convert_enquiry(enquiry, user, overrides, context=None):
+    """Convert one enquiry; raises ConversionError when it can't be"""
+    with transaction.atomic():
+        enquiry = Enquiry.objects.select_for_update().get(pk=enquiry.pk)
+        registration = convert_locked(enquiry, user, overrides, context)
+        enquiry.status = 'Converted'
+        enquiry.save(update_fields=['status'])
+    return registration
+
+
+def convert_enquiries(enquiries, user, overrides, context=None):
+    """
+    Convert many enquiries in one transaction. Enquiries that can't be
+    converted are skipped; the rest are validated first so their registration
+    numbers can be reserved as one block.
+    Returns ({enquiry_id: registration}, {enquiry_id: error}).
+    """
+    converted = {}
+    skipped = {}
+    with transaction.atomic():
+        locked = Enquiry.objects.select_for_update().filter(pk__in=[enquiry.pk for enquiry in enquiries])
+        valid = []
+        for enquiry in locked.order_by('date'):
+            try:
+                valid.append((enquiry, validated_serializer(enquiry, overrides, context)))
+            except ConversionError as e:
+                skipped[enquiry.id] = e.args[0]
+
+        if valid:
+            numbers = next_numbers(user.company_id, REGISTRATION_PREFIX, len(valid))
+            for (enquiry, serializer), registration_no in zip(valid, numbers):
+                converted[enquiry.id] = register(
+                    serializer, user, overrides.get('student_documents'), registration_no=registration_no
+                )
+
+        if converted:
+            Enquiry.objects.filter(pk__in=converted).update(status='Converted')
+            broadcast_bulk_event('enquiry', 'updated', list(converted), user.company_id)
+    return converted, skipped
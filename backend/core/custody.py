@@ -0,0 +1,85 @@
+"""
+Custody ledger for physical student documents
+
+Every change of hands closes the document's open StudentDocumentCustody row
+and appends a new one, so holdings at any point in time and each holder's
+current inventory can be read straight from the ledger indexes.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PhysicalDocumentTransfer, StudentDocumentCustody
+
+
+def close_open_custody(document_ids, at):
+    StudentDocumentCustody.objects.filter(
+        document_id__in=document_ids,
+        ended_at__isnull=True
+    ).update(ended_at=at)
+
+
+def open_custody(documents):
+    """First ledger row for newly created documents (bulk_create skips the post_save signal)"""
+    StudentDocumentCustody.objects.bulk_create([
+        StudentDocumentCustody(
+            document=document,
+            holder_id=None if document.status == 'Returned' else (document.current_holder_id or document.created_by_id),
+            action='Returned' if document.status == 'Returned' else 'Received',
+            started_at=document.received_at,
+            company_id=document.company_id
+        )
+        for document in documents
+    ])
+
+
+def move_custody(document_ids, holder, action, company_id, at=None):
+    """Hand documents to holder (None = back with the student)"""
+    at = at or timezone.now()
+    document_ids = list(document_ids)
+    close_open_custody(document_ids, at)
+    StudentDocumentCustody.objects.bulk_create([
+        StudentDocumentCustody(
+            document_id=document_id,
+            holder=holder,
+            action=action,
+            started_at=at,
+            company_id=company_id
+        )
+        for document_id in document_ids
+    ])
+
+
+def record_transfer_custody(transfers, holder, at=None):
+    """Append a 'Transferred' period for each document of the given physical transfers"""
+    at = at or timezone.now()
+    transfers_by_document = {}
+    for transfer_id, document_id in PhysicalDocumentTransfer.documents.through.objects.filter(
+        physicaldocumenttransfer_id__in=[transfer.id for transfer in transfers]
+    ).values_list('physicaldocumenttransfer_id', 'studentdocument_id'):
+        transfers_by_document.setdefault(document_id, transfer_id)
+
+    close_open_custody(transfers_by_document.keys(), at)
+    StudentDocumentCustody.objects.bulk_create([
+        StudentDocumentCustody(
+            document_id=document_id,
+            holder=holder,
+            action='Transferred',
+            transfer_id=transfer_id,
+            started_at=at,
+            company_id=holder.company_id
+        )
+        for document_id, transfer_id in transfers_by_document.items()
+    ])
+
+
+def holdings_at(at):
+    """Custody periods covering a point in time (documents held by staff then)"""
+    return StudentDocumentCustody.objects.filter(
+        started_at__lte=at,
+        holder__isnull=False
+    ).filter(Q(ended_at__isnull=True) | Q(ended_at__gt=at))
+
+
+def current_inventory(holder):
+    """Open custody periods of a holder (served by the partial holder index)"""
+    return StudentDocumentCustody.objects.filter(holder=holder, ended_at__isnull=True)
@@ -0,0 +1,114 @@
+"""
+Document Expiry - expiring-document queries and the daily holder alerts
+
+Days until expiry are computed by the database, and alerts are recorded in
+DocumentExpiryAlert so each document notifies its holder once per threshold.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DateField, DurationField, ExpressionWrapper, F, Value
+from django.utils import timezone
+
+from .models import Document, DocumentExpiryAlert, Notification
+from .signals import broadcast_bulk_event
+
+
+def expiring_documents(queryset, days, today=None):
+    """Documents expiring within `days`, soonest first, annotated with days_left (a timedelta)"""
+    today = today or timezone.localdate()
+    return queryset.filter(
+        expiry_date__gte=today,
+        expiry_date__lte=today + timedelta(days=days)
+    ).annotate(
+        days_left=ExpressionWrapper(
+            F('expiry_date') - Value(today, output_field=DateField()),
+            output_field=DurationField()
+        )
+    ).order_by('expiry_date')
+
+
+def threshold_for(days_left, thresholds):
+    """Smallest threshold the document has crossed"""
+    return min(threshold for threshold in thresholds if days_left <= threshold)
+
+
+def alert_message(documents, threshold):
+    if len(documents) == 1:
+        document = documents[0]
+        owner = f' for {document.student_name}' if document.student_name else ''
+        days = document.days_left.days
+        when = 'today' if days == 0 else f'in {days} day{"s" if days != 1 else ""}'
+        return f'{document.type}{owner} ({document.file_name}) expires {when}'[:255]
+    names = ', '.join(document.file_name for document in documents)
+    within = f'{threshold} day{"s" if threshold != 1 else ""}'
+    return f'{len(documents)} documents expire within {within}: {names}'[:255]
+
+
+def send_expiry_alerts(today=None, thresholds=None, dry_run=False):
+    """
+    Notify current holders of documents that crossed an alert threshold since
+    the last run. Returns (alerts recorded, notifications created).
+    """
+    today = today or timezone.localdate()
+    thresholds = sorted(set(thresholds or settings.DOCUMENT_EXPIRY_ALERT_DAYS))
+    if not thresholds:
+        return 0, 0
+
+    candidates = list(
+        expiring_documents(
+            Document.objects.filter(current_holder__isnull=False).select_related('current_holder'),
+            thresholds[-1],
+            today
+        )
+    )
+    already_alerted = set(
+        DocumentExpiryAlert.objects.filter(
+            document_id__in=[document.id for document in candidates]
+        ).values_list('document_id', 'threshold', 'expiry_date')
+    )
+
+    due = defaultdict(list)
+    for document in candidates:
+        threshold = threshold_for(document.days_left.days, thresholds)
+        if (document.id, threshold, document.expiry_date) not in already_alerted:
+            due[(document.current_holder, threshold)].append(document)
+
+    if dry_run or not due:
+        return sum(len(documents) for documents in due.values()), len(due)
+
+    with transaction.atomic():
+        DocumentExpiryAlert.objects.bulk_create(
+            [
+                DocumentExpiryAlert(
+                    document=document,
+                    threshold=threshold,
+                    expiry_date=document.expiry_date,
+                    company_id=document.company_id
+                )
+                for (holder, threshold), documents in due.items()
+                for document in documents
+            ],
+            ignore_conflicts=True
+        )
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user=holder,
+                title='Document expiring soon' if len(documents) == 1 else 'Documents expiring soon',
+                message=alert_message(documents, threshold),
+                type='Warning',
+                action_url='/app/documents',
+                company_id=holder.company_id
+            )
+            for (holder, threshold), documents in due.items()
+        ])
+
+        ids_by_company = defaultdict(list)
+        for notification in notifications:
+            ids_by_company[notification.company_id].append(notification.id)
+        for company_id, ids in ids_by_company.items():
+            broadcast_bulk_event('notification', 'created', ids, company_id=company_id)
+
+    return sum(len(documents) for documents in due.values()), len(notifications)
@@ -42,41 +42,25 @@ class MessageEncryptionService:
         return public_pem, private_pem
     
     @staticmethod
-    def encrypt_message(content, recipient_public_keys):
+    def generate_session_key():
         """
-        Encrypt message with AES, then encrypt AES key with each recipient's RSA public key
+        Generate a random AES-256 key for a conversation key epoch
+        Returns: bytes
+        """
+        return os.urandom(32)
+    
+    @staticmethod
+    def wrap_key(aes_key, recipient_public_keys):
+        """
+        Encrypt an AES key with each recipient's RSA public key
         
         Args:
-            content: str - The message content to encrypt
+            aes_key: bytes - The AES key to wrap
             recipient_public_keys: dict - {user_id: public_key_pem}
         
         Returns:
-            dict: {'encrypted_content': base64_str, 'encrypted_keys': {user_id: encrypted_aes_key}}
+            dict: {user_id: base64 encrypted AES key}
         """
-        # Generate random AES key (256-bit) and IV (128-bit)
-        aes_key = os.urandom(32)
-        iv = os.urandom(16)
-        
-        # Pad content to AES block size (16 bytes)
-        content_bytes = content.encode('utf-8')
-        block_size = 16
-        padding_length = block_size - (len(content_bytes) % block_size)
-        padded_content = content_bytes + bytes([padding_length] * padding_length)
-        
-        # Encrypt content with AES-CBC
-        cipher = Cipher(
-            algorithms.AES(aes_key),
-            modes.CBC(iv),
-            backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
-        encrypted_content = encryptor.update(padded_content) + encryptor.finalize()
-        
-        # Combine IV and encrypted content
-        encrypted_data = iv + encrypted_content
-        encrypted_content_b64 = base64.b64encode(encrypted_data).decode('utf-8')
-        
-        # Encrypt AES key for each recipient
         encrypted_keys = {}
         for user_id, public_key_pem in recipient_public_keys.items():
             # Load public key
@@ -97,23 +81,19 @@ class MessageEncryptionService:
             
             encrypted_keys[str(user_id)] = base64.b64encode(encrypted_aes_key).decode('utf-8')
         
-        return {
-            'encrypted_content': encrypted_content_b64,
-            'encrypted_keys': encrypted_keys
-        }
+        return encrypted_keys
     
     @staticmethod
-    def decrypt_message(encrypted_content_b64, encrypted_aes_key_b64, private_key_pem):
+    def unwrap_key(encrypted_aes_key_b64, private_key_pem):
         """
-        Decrypt message using user's private key
+        Decrypt a wrapped AES key using a user's private key
         
         Args:
-            encrypted_content_b64: str - Base64 encoded encrypted content
             encrypted_aes_key_b64: str - Base64 encoded encrypted AES key
             private_key_pem: str - User's private key in PEM format
         
         Returns:
-            str: Decrypted message content
+            bytes: The AES key
         """
         # Load private key
         private_key = serialization.load_pem_private_key(
@@ -124,7 +104,7 @@ class MessageEncryptionService:
         
         # Decrypt AES key with RSA
         encrypted_aes_key = base64.b64decode(encrypted_aes_key_b64)
-        aes_key = private_key.decrypt(
+        return private_key.decrypt(
             encrypted_aes_key,
             padding.OAEP(
                 mgf=padding.MGF1(algorithm=hashes.SHA256()),
@@ -132,7 +112,51 @@ class MessageEncryptionService:
                 label=None
             )
         )
+    
+    @staticmethod
+    def encrypt_with_key(content, aes_key):
+        """
+        Encrypt message content with an existing AES key
+        
+        Args:
+            content: str - The message content to encrypt
+            aes_key: bytes - AES-256 key
+        
+        Returns:
+            str: Base64 encoded IV + ciphertext
+        """
+        iv = os.urandom(16)
+        
+        # Pad content to AES block size (16 bytes)
+        content_bytes = content.encode('utf-8')
+        block_size = 16
+        padding_length = block_size - (len(content_bytes) % block_size)
+        padded_content = content_bytes + bytes([padding_length] * padding_length)
+        
+        # Encrypt content with AES-CBC
+        cipher = Cipher(
+            algorithms.AES(aes_key),
+            modes.CBC(iv),
+            backend=default_backend()
+        )
+        encryptor = cipher.encryptor()
+        encrypted_content = encryptor.update(padded_content) + encryptor.finalize()
         
+        # Combine IV and encrypted content
+        return base64.b64encode(iv + encrypted_content).decode('utf-8')
+    
+    @staticmethod
+    def decrypt_with_key(encrypted_content_b64, aes_key):
+        """
+        Decrypt message content with an already unwrapped AES key
+        
+        Args:
+            encrypted_content_b64: str - Base64 encoded IV + ciphertext
+            aes_key: bytes - AES-256 key
+        
+        Returns:
+            str: Decrypted message content
+        """
         # Decode encrypted content
         encrypted_data = base64.b64decode(encrypted_content_b64)
         iv = encrypted_data[:16]
@@ -152,3 +176,39 @@ class MessageEncryptionService:
         content = padded_content[:-padding_length]
         
         return content.decode('utf-8')
+    
+    @staticmethod
+    def encrypt_message(content, recipient_public_keys):
+        """
+        Encrypt message with AES, then encrypt AES key with each recipient's RSA public key
+        
+        Args:
+            content: str - The message content to encrypt
+            recipient_public_keys: dict - {user_id: public_key_pem}
+        
+        Returns:
+            dict: {'encrypted_content': base64_str, 'encrypted_keys': {user_id: encrypted_aes_key}}
+        """
+        # Generate random AES key (256-bit)
+        aes_key = MessageEncryptionService.generate_session_key()
+        
+        return {
+            'encrypted_content': MessageEncryptionService.encrypt_with_key(content, aes_key),
+            'encrypted_keys': MessageEncryptionService.wrap_key(aes_key, recipient_public_keys)
+        }
+    
+    @staticmethod
+    def decrypt_message(encrypted_content_b64, encrypted_aes_key_b64, private_key_pem):
+        """
+        Decrypt message using user's private key
+        
+        Args:
+            encrypted_content_b64: str - Base64 encoded encrypted content
+            encrypted_aes_key_b64: str - Base64 encoded encrypted AES key
+            private_key_pem: str - User's private key in PEM format
+        
+        Returns:
+            str: Decrypted message content
+        """
+        aes_key = MessageEncryptionService.unwrap_key(encrypted_aes_key_b64, private_key_pem)
+        return MessageEncryptionService.decrypt_with_key(encrypted_content_b64, aes_key)
@@ -0,0 +1,112 @@
+"""
+Enquiry duplicates - likely-match lookup at create time and tenant-wide clustering
+
+Lookups only touch the (company_id, *_key) indexes. Mobile and email
+matches are strong evidence; a phonetic name match alone is reported as a
+weak match and never merges clusters.
+"""
+from django.db.models import Q
+
+from .contacts import contact_keys
+from .models import Enquiry
+
+MATCH_WEIGHTS = {'mobile': 3, 'email': 3, 'name': 1}
+
+
+def find_duplicates(company_id, mobile='', email='', name='', exclude_id=None, limit=10):
+    """Likely duplicates of a contact, best match first, each with the keys it matched on"""
+    keys = contact_keys(mobile, email, name)
+    lookups = {
+        'mobile': ('mobile_key', keys['mobile_key']),
+        'email': ('email_key', keys['email_key']),
+        'name': ('name_key', keys['name_key']),
+    }
+    strong = Q()
+    for reason in ('mobile', 'email'):
+        field, value = lookups[reason]
+        if value:
+            strong |= Q(**{field: value})
+    name_field, name_value = lookups['name']
+    if not strong and not name_value:
+        return []
+
+    candidates = Enquiry.objects.filter(company_id=company_id)
+    if exclude_id:
+        candidates = candidates.exclude(id=exclude_id)
+
+    # Mobile / email matches first, so common names can't crowd them out of the window
+    found = list(candidates.filter(strong).order_by('-date')[:limit * 5]) if strong else []
+    if name_value and len(found) < limit * 5:
+        found += candidates.filter(**{name_field: name_value}).exclude(
+            id__in=[enquiry.id for enquiry in found]
+        ).order_by('-date')[:limit * 5 - len(found)]
+
+    matches = []
+    for enquiry in found:
+        reasons = [
+            reason for reason, (field, value) in lookups.items()
+            if value and getattr(enquiry, field) == value
+        ]
+        matches.append((sum(MATCH_WEIGHTS[reason] for reason in reasons), enquiry, reasons))
+
+    matches.sort(key=lambda match: match[0], reverse=True)
+    return [
+        {
+            'id': str(enquiry.id),
+            'candidate_name': enquiry.candidate_name,
+            'mobile': enquiry.mobile,
+            'email': enquiry.email,
+            'status': enquiry.status,
+            'date': enquiry.date,
+            'duplicate_of': str(enquiry.duplicate_of_id) if enquiry.duplicate_of_id else None,
+            'matched_on': reasons,
+            'strong': any(reason != 'name' for reason in reasons),
+        }
+        for _, enquiry, reasons in matches[:limit]
+    ]
+
+
+def cluster_duplicates(company_id, dry_run=False):
+    """
+    Group a company's enquiries that share a mobile or email key (transitively)
+    and point every member at the earliest one. Returns (clusters, duplicates, updated).
+    """
+    rows = list(
+        Enquiry.objects.filter(company_id=company_id)
+        .order_by('date', 'id')
+        .values_list('id', 'mobile_key', 'email_key', 'duplicate_of_id')
+    )
+    # Union-find over row positions; rows are in date order, so the smaller
+    # root is always the earliest enquiry of its cluster
+    parent = list(range(len(rows)))
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    first_with_key = {}
+    for position, (_, mobile_key, email_key, _) in enumerate(rows):
+        for key in (('mobile', mobile_key), ('email', email_key)):
+            if not key[1]:
+                continue
+            root, other_root = find(position), find(first_with_key.setdefault(key, position))
+            if root != other_root:
+                parent[max(root, other_root)] = min(root, other_root)
+
+    changed = []
+    roots = set()
+    duplicates = 0
+    for position, (enquiry_id, _, _, duplicate_of_id) in enumerate(rows):
+        root = find(position)
+        target = rows[root][0] if root != position else None
+        if target is not None:
+            roots.add(root)
+            duplicates += 1
+        if target != duplicate_of_id:
+            changed.append(Enquiry(id=enquiry_id, duplicate_of_id=target))
+
+    if changed and not dry_run:
+        Enquiry.objects.bulk_update(changed, ['duplicate_of'], batch_size=500)
+    return len(roots), duplicates, len(changed)
@@ -0,0 +1,177 @@
+"""
+Installments - enrollment fee schedules, the daily overdue sweep and receivables aging
+
+Schedules fall due on the same day of each following month (clamped to the
+month's last day) and their amounts always add up to the fee exactly. The
+sweep flips Pending installments past their due date to Overdue through the
+(status, due_date) index and tells each enrolling counselor once.
+"""
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Installment, Notification
+from .signals import broadcast_bulk_event
+
+CENT = Decimal('0.01')
+# (label, fewest days overdue, most days overdue)
+AGING_BUCKETS = (
+    ('1-30', 1, 30),
+    ('31-60', 31, 60),
+    ('61-90', 61, 90),
+    ('90+', 91, None),
+)
+
+
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def split_amount(total, count):
+    """`count` amounts to the cent that sum to `total`; the first ones take the leftover cents"""
+    cents = int((Decimal(total) / CENT).to_integral_value())
+    base, extra = divmod(cents, count)
+    return [Decimal(base + (1 if i < extra else 0)) * CENT for i in range(count)]
+
+
+def build_schedule(total, count, start_date, amount=None):
+    """
+    (number, due_date, amount) for `count` monthly installments of `total`
+    starting a month after start_date. With a fixed `amount` the last
+    installment takes whatever is left so the schedule still sums to `total`.
+    """
+    total = Decimal(total).quantize(CENT)
+    if amount:
+        amount = Decimal(amount).quantize(CENT)
+        amounts = [amount] * (count - 1) + [total - amount * (count - 1)]
+        if amounts[-1] < 0:
+            amounts = split_amount(total, count)
+    else:
+        amounts = split_amount(total, count)
+    return [(i + 1, add_months(start_date, i + 1), amounts[i]) for i in range(count)]
+
+
+def overdue_message(installments):
+    if len(installments) == 1:
+        installment = installments[0]
+        student = installment.enrollment.student.student_name
+        return f'Installment {installment.number} of {student} (₹{installment.amount}) was due on {installment.due_date}'[:255]
+    total = sum(installment.amount for installment in installments)
+    names = ', '.join(sorted({installment.enrollment.student.student_name for installment in installments}))
+    return f'{len(installments)} installments are overdue (₹{total}): {names}'[:255]
+
+
+def sweep_overdue(today=None, dry_run=False):
+    """
+    Mark Pending installments due before today Overdue and notify the
+    counselors who enrolled the students. Returns (installments, notifications).
+    """
+    today = today or timezone.localdate()
+    due = list(
+        Installment.objects.filter(status='Pending', due_date__lt=today)
+        .select_related('enrollment__student', 'enrollment__created_by')
+        .order_by('due_date')
+    )
+
+    by_counselor = defaultdict(list)
+    for installment in due:
+        if installment.enrollment.created_by:
+            by_counselor[installment.enrollment.created_by].append(installment)
+
+    if dry_run or not due:
+        return len(due), len(by_counselor)
+
+    with transaction.atomic():
+        ids = [installment.id for installment in due]
+        for start in range(0, len(ids), 500):
+            # status='Pending' again: anything paid since we read it stays paid
+            Installment.objects.filter(id__in=ids[start:start + 500], status='Pending').update(status='Overdue')
+
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user=counselor,
+                title='Installment overdue' if len(installments) == 1 else 'Installments overdue',
+                message=overdue_message(installments),
+                type='Warning',
+                action_url='/app/enrollments',
+                company_id=counselor.company_id
+            )
+            for counselor, installments in by_counselor.items()
+        ])
+
+        ids_by_company = defaultdict(list)
+        for installment in due:
+            ids_by_company[installment.enrollment.company_id].append(installment.id)
+        for company_id, company_ids in ids_by_company.items():
+            broadcast_bulk_event('installment', 'updated', company_ids, company_id=company_id)
+
+        ids_by_company = defaultdict(list)
+        for notification in notifications:
+            ids_by_company[notification.company_id].append(notification.id)
+        for company_id, notification_ids in ids_by_company.items():
+            broadcast_bulk_event('notification', 'created', notification_ids, company_id=company_id)
+
+    return len(due), len(notifications)
+
+
+def money_field():
+    return DecimalField(max_digits=12, decimal_places=2)
+
+
+def aging_columns(today):
+    """Sum of amount per AGING_BUCKETS label, by how long ago the installment fell due"""
+    columns = {}
+    for label, fewest, most in AGING_BUCKETS:
+        condition = Q(due_date__lte=today - timedelta(days=fewest))
+        if most is not None:
+            condition &= Q(due_date__gte=today - timedelta(days=most))
+        columns[label] = Coalesce(Sum('amount', filter=condition), Value(0), output_field=money_field())
+    return columns
+
+
+def aged_receivables(queryset, today=None):
+    """
+    Overdue installments of `queryset` bucketed by days overdue: company totals
+    and one row per student, largest amount first.
+    """
+    today = today or timezone.localdate()
+    overdue = queryset.filter(status='Overdue')
+    columns = aging_columns(today)
+
+    totals = overdue.aggregate(
+        **columns,
+        total=Coalesce(Sum('amount'), Value(0), output_field=money_field())
+    )
+    students = list(
+        overdue.values(
+            'enrollment__student_id',
+            'enrollment__student__registration_no',
+            'enrollment__student__student_name',
+        )
+        .annotate(**columns, total=Sum('amount', output_field=money_field()), oldest_due_date=Min('due_date'))
+        .order_by('-total')
+    )
+    amounts = [*columns, 'total']
+    return {
+        'as_of': today,
+        'buckets': [label for label, _, _ in AGING_BUCKETS],
+        'totals': {key: totals[key].quantize(CENT) for key in amounts},
+        'students': [
+            {
+                'registration': row['enrollment__student_id'],
+                'registration_no': row['enrollment__student__registration_no'],
+                'student_name': row['enrollment__student__student_name'],
+                **{key: row[key].quantize(CENT) for key in amounts},
+                'oldest_due_date': row['oldest_due_date'],
+            }
+            for row in students
+        ],
+    }
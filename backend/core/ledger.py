@@ -0,0 +1,183 @@
+"""
+Ledger - per-registration fee ledger and its materialized balance
+
+Every money-relevant row posts one LedgerEntry: the registration fee and
+each enrollment's total fees are charges, successful payments are credits,
+and approved refunds are charges again. The entry is keyed by its source,
+so reposting after an edit replaces it and a payment that stops counting
+(failed, moved to another student) loses its entry.
+
+StudentBalance holds the totals of a registration's entries. It is
+recomputed under a row lock in the same transaction that changed the
+entries, so statements and the receivables list can read it directly.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from .models import Enrollment, LedgerEntry, Payment, Refund, Registration, StudentBalance
+
+POSTED_PAYMENT_STATUSES = ('Success',)
+POSTED_REFUND_STATUSES = ('Approved', 'Completed')
+ZERO = Decimal('0')
+
+
+def registration_entry(registration):
+    return f'registration:{registration.pk}', {
+        'registration_id': registration.pk,
+        'kind': 'Charge',
+        'amount': registration.registration_fee or ZERO,
+        'description': 'Registration fee',
+        'occurred_at': registration.registration_date,
+        'company_id': registration.company_id,
+    }
+
+
+def enrollment_entry(enrollment):
+    return f'enrollment:{enrollment.pk}', {
+        'registration_id': enrollment.student_id,
+        'enrollment_id': enrollment.pk,
+        'kind': 'Charge',
+        'amount': enrollment.total_fees or ZERO,
+        'description': f'Enrollment {enrollment.enrollment_no}: {enrollment.program_name}',
+        'occurred_at': enrollment.created_at,
+        'company_id': enrollment.company_id,
+    }
+
+
+def payment_entry(payment):
+    registration_id = payment.registration_id
+    if registration_id is None and payment.enrollment_id:
+        registration_id = payment.enrollment.student_id
+    if payment.status not in POSTED_PAYMENT_STATUSES:
+        registration_id = None
+    return f'payment:{payment.pk}', {
+        'registration_id': registration_id,
+        'enrollment_id': payment.enrollment_id,
+        'payment_id': payment.pk,
+        'kind': 'Payment',
+        'amount': -(payment.amount or ZERO),
+        'description': f'{payment.type} payment ({payment.method})',
+        'occurred_at': payment.date,
+        'company_id': payment.company_id,
+    }
+
+
+def refund_entry(refund):
+    registration_id = refund.registration_id or refund.payment.registration_id
+    if refund.status not in POSTED_REFUND_STATUSES:
+        registration_id = None
+    return f'refund:{refund.pk}', {
+        'registration_id': registration_id,
+        'payment_id': refund.payment_id,
+        'refund_id': refund.pk,
+        'kind': 'Refund',
+        'amount': refund.amount or ZERO,
+        'description': f'Refund: {refund.reason}'[:255],
+        'occurred_at': refund.processed_at or refund.refund_date,
+        'company_id': refund.company_id,
+    }
+
+
+ENTRY_BUILDERS = {
+    Registration: registration_entry,
+    Enrollment: enrollment_entry,
+    Payment: payment_entry,
+    Refund: refund_entry,
+}
+
+
+def post_entry(instance):
+    """(Re)post the ledger entry of a registration, enrollment, payment or refund and refresh the balances it touched"""
+    source_key, fields = ENTRY_BUILDERS[type(instance)](instance)
+    with transaction.atomic():
+        affected = set(LedgerEntry.objects.filter(source_key=source_key).values_list('registration_id', flat=True))
+        if fields['registration_id'] is None or not fields['amount']:
+            LedgerEntry.objects.filter(source_key=source_key).delete()
+        else:
+            LedgerEntry.objects.update_or_create(source_key=source_key, defaults=fields)
+            affected.add(fields['registration_id'])
+        refresh_balances(affected)
+
+
+def refresh_balances(registration_ids, create=True):
+    """
+    Recompute the StudentBalance of each registration from its entries.
+    create=False only updates existing rows (used while a registration is being deleted).
+    """
+    registration_ids = {pk for pk in registration_ids if pk}
+    if not registration_ids:
+        return
+
+    with transaction.atomic():
+        if create:
+            StudentBalance.objects.bulk_create(
+                [
+                    StudentBalance(registration_id=pk, company_id=company_id)
+                    for pk, company_id in Registration.objects.filter(pk__in=registration_ids).values_list('pk', 'company_id')
+                ],
+                ignore_conflicts=True
+            )
+        # Lock first so the sums below include everything committed before us
+        balances = list(StudentBalance.objects.select_for_update().filter(registration_id__in=registration_ids))
+
+        totals = {}
+        for row in (
+            LedgerEntry.objects.filter(registration_id__in=registration_ids)
+            .values('registration_id', 'kind')
+            .annotate(total=Sum('amount'), last=Max('occurred_at'))
+            .order_by()
+        ):
+            totals[(row['registration_id'], row['kind'])] = row
+
+        now = timezone.now()
+        for balance in balances:
+            kinds = [totals.get((balance.registration_id, kind)) for kind in ('Charge', 'Payment', 'Refund')]
+            charged, paid, refunded = (row['total'] if row else ZERO for row in kinds)
+            balance.charged = charged
+            balance.paid = -paid
+            balance.refunded = refunded
+            balance.balance = charged + paid + refunded
+            balance.last_activity_at = max((row['last'] for row in kinds if row), default=None)
+            balance.updated_at = now
+        StudentBalance.objects.bulk_update(
+            balances, ['charged', 'paid', 'refunded', 'balance', 'last_activity_at', 'updated_at']
+        )
+
+
+def rebuild_ledger(registrations):
+    """
+    Repost every entry of the given registrations from their source rows and
+    recompute their balances. Returns the number of entries written.
+    """
+    registration_ids = set(registrations.values_list('pk', flat=True))
+    sources = [
+        *Registration.objects.filter(pk__in=registration_ids),
+        *Enrollment.objects.filter(student_id__in=registration_ids),
+        *Payment.objects.select_related('enrollment').filter(
+            Q(registration_id__in=registration_ids) |
+            Q(registration__isnull=True, enrollment__student_id__in=registration_ids)
+        ),
+        *Refund.objects.select_related('payment').filter(
+            Q(registration_id__in=registration_ids) |
+            Q(registration__isnull=True, payment__registration_id__in=registration_ids)
+        ),
+    ]
+    entries = []
+    for source in sources:
+        source_key, fields = ENTRY_BUILDERS[type(source)](source)
+        if fields['registration_id'] is not None and fields['amount']:
+            entries.append(LedgerEntry(source_key=source_key, **fields))
+
+    with transaction.atomic():
+        # Entries of these sources may still sit on other registrations (a payment that was moved)
+        stale = LedgerEntry.objects.filter(
+            Q(registration_id__in=registration_ids) | Q(source_key__in=[entry.source_key for entry in entries])
+        )
+        affected = registration_ids | set(stale.values_list('registration_id', flat=True))
+        stale.delete()
+        LedgerEntry.objects.bulk_create(entries, batch_size=500)
+        refresh_balances(affected)
+    return len(entries)
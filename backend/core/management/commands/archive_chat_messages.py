@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.chat_archive import ARCHIVE_SEGMENT_SIZE, archive_conversation
+from core.models import ChatMessage
+
+
+class Command(BaseCommand):
+    help = 'Moves old chat messages into compressed per-conversation archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+            help=f'Archive messages older than this many days (default: {settings.CHAT_ARCHIVE_AFTER_DAYS})'
+        )
+        parser.add_argument(
+            '--segment-size',
+            type=int,
+            default=ARCHIVE_SEGMENT_SIZE,
+            help=f'Messages per archive segment (default: {ARCHIVE_SEGMENT_SIZE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many messages would be archived'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        old_messages = ChatMessage.objects.filter(timestamp__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{old_messages.count()} messages older than {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        conversation_ids = list(old_messages.values_list('conversation_id', flat=True).distinct())
+        total = 0
+        for conversation_id in conversation_ids:
+            total += archive_conversation(conversation_id, cutoff, options['segment_size'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Archived {total} messages from {len(conversation_ids)} conversations'
+            )
+        )
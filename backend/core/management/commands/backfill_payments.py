@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from core.payment_backfill import backfill_missing_payments, link_legacy_payments
+
+
+class Command(BaseCommand):
+    help = (
+        'Links legacy payments to their registrations and enrollments, then creates the '
+        'registration and enrollment payments that are still missing (safe to re-run)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only this company id (default: every company)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per batch (default: 500)')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be linked and created'
+        )
+
+    def handle(self, *args, **options):
+        company_id = options['company']
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        linked, ambiguous, registrations_held, enrollments_held = link_legacy_payments(company_id, batch_size, dry_run)
+        registrations, enrollments = backfill_missing_payments(
+            company_id, batch_size, dry_run, linked, registrations_held, enrollments_held
+        )
+
+        if ambiguous:
+            self.stdout.write(self.style.WARNING(
+                f'{ambiguous} legacy payments match more than one student by name and amount; '
+                f'{len(registrations_held) + len(enrollments_held)} students were skipped until they are linked by hand'
+            ))
+
+        if dry_run:
+            self.stdout.write(
+                f'{len(linked)} legacy payments would be linked, {registrations} registration and '
+                f'{enrollments} enrollment payments would be created'
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Linked {len(linked)} legacy payments, created {registrations} registration and '
+            f'{enrollments} enrollment payments'
+        ))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.enquiry_duplicates import cluster_duplicates
+from core.models import Enquiry
+
+
+class Command(BaseCommand):
+    help = (
+        'Links enquiries sharing a normalized mobile or email to the earliest one '
+        '(duplicate_of), per company'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only this company id (default: every company)')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many enquiries would be relinked'
+        )
+
+    def handle(self, *args, **options):
+        if options['company']:
+            company_ids = [options['company']]
+        else:
+            company_ids = (
+                Enquiry.objects.exclude(company_id='')
+                .values_list('company_id', flat=True).distinct().order_by('company_id')
+            )
+
+        totals = [0, 0, 0]
+        for company_id in company_ids:
+            with transaction.atomic():
+                result = cluster_duplicates(company_id, dry_run=options['dry_run'])
+            totals = [total + value for total, value in zip(totals, result)]
+            if result[2]:
+                self.stdout.write(f'{company_id}: {result[0]} clusters, {result[1]} duplicates, {result[2]} relinked')
+
+        clusters, duplicates, changed = totals
+        if options['dry_run']:
+            self.stdout.write(f'{changed} enquiries would be relinked ({clusters} clusters, {duplicates} duplicates)')
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Relinked {changed} enquiries ({clusters} clusters, {duplicates} duplicates)')
+        )
@@ -0,0 +1,110 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.models import Document, StoredBlob
+from core.storage import BLOB_PREFIX, get_document_storage, hash_from_name
+from core.thumbnails import thumbnail_name
+
+
+class Command(BaseCommand):
+    help = 'Deletes document blobs no Document references any more, and orphaned blob files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=int,
+            default=settings.DOCUMENT_BLOB_GC_GRACE_HOURS,
+            help=f'Only collect blobs unreferenced for this long (default: {settings.DOCUMENT_BLOB_GC_GRACE_HOURS})'
+        )
+        parser.add_argument(
+            '--adopt',
+            action='store_true',
+            help='Also move legacy documents/ files into content-addressed storage'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted'
+        )
+
+    def handle(self, *args, **options):
+        storage = get_document_storage()
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        dry_run = options['dry_run']
+
+        if options['adopt']:
+            adopted = self.adopt_legacy_files(storage, dry_run)
+            self.stdout.write(f'{"Would adopt" if dry_run else "Adopted"} {adopted} legacy document files')
+
+        # The Exists check guards against counts that drifted (e.g. rows changed with update())
+        unreferenced = StoredBlob.objects.filter(
+            ref_count__lte=0,
+            updated_at__lt=cutoff
+        ).exclude(Exists(Document.objects.filter(blob_id=OuterRef('pk'))))
+
+        collected = 0
+        freed = 0
+        for blob in unreferenced.iterator():
+            if not dry_run:
+                # Re-check under the row lock a save takes before reusing the blob
+                with transaction.atomic():
+                    if not unreferenced.select_for_update().filter(pk=blob.pk).exists():
+                        continue
+                    blob.delete()
+                    storage.delete(blob.name)
+                    storage.delete(thumbnail_name(blob.name))
+            collected += 1
+            freed += blob.size
+
+        orphans = self.orphan_files(storage, cutoff)
+        if not dry_run:
+            for name in orphans:
+                storage.delete(name)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {collected} unreferenced blobs ({freed} bytes) and {len(orphans)} orphaned files'
+            )
+        )
+
+    def orphan_files(self, storage, cutoff):
+        """Blob files (and abandoned temp files) with no StoredBlob row, older than cutoff"""
+        root = storage.path(BLOB_PREFIX)
+        known = set(StoredBlob.objects.values_list('sha256', flat=True))
+        orphans = []
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+                if hash_from_name(name) in known and not name.startswith(f'{BLOB_PREFIX}/tmp/'):
+                    continue
+                if storage.get_modified_time(name) < cutoff:
+                    orphans.append(name)
+        return orphans
+
+    def adopt_legacy_files(self, storage, dry_run):
+        """Re-save documents stored under their upload name so identical files share a blob"""
+        legacy = Document.objects.exclude(file='').exclude(file__isnull=True).exclude(
+            file__startswith=f'{BLOB_PREFIX}/'
+        )
+        adopted = 0
+        for document in legacy.iterator():
+            old_name = document.file.name
+            if not storage.exists(old_name):
+                continue
+            adopted += 1
+            if dry_run:
+                continue
+            with storage.open(old_name) as content:
+                document.file.name = storage.save(old_name, content)
+            document.save(update_fields=['file'])
+            if not Document.objects.filter(file=old_name).exists():
+                storage.delete(old_name)
+        return adopted
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Document
+from core.thumbnails import can_render, generate_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Renders thumbnails for documents uploaded before thumbnails existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Re-check every document, not only those without a thumbnail'
+        )
+
+    def handle(self, *args, **options):
+        documents = Document.objects.exclude(file='').exclude(file__isnull=True)
+        if not options['all']:
+            documents = documents.filter(thumbnail__isnull=True) | documents.filter(thumbnail='')
+
+        count = 0
+        for document_id, name in documents.values_list('id', 'file').iterator():
+            if can_render(name):
+                generate_thumbnail(document_id)
+                count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed thumbnails for {count} documents'))
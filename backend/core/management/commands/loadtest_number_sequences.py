@@ -0,0 +1,82 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+
+from core.models import NumberSequence
+from core.sequences import allocate
+
+
+class Command(BaseCommand):
+    help = (
+        'Allocates numbers from many threads at once against the configured database '
+        'and checks they are unique and gapless (uses a throwaway company id)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent workers (default: 16)')
+        parser.add_argument('--per-thread', type=int, default=50, help='Allocations per worker (default: 50)')
+        parser.add_argument('--batch', type=int, default=1, help='Numbers per allocation (default: 1)')
+        parser.add_argument(
+            '--rollback-every',
+            type=int,
+            default=7,
+            help='Roll back every Nth allocation to check numbers are returned (0 to disable, default: 7)'
+        )
+
+    def handle(self, *args, **options):
+        company_id = f'loadtest-{uuid.uuid4().hex[:12]}'
+        prefix = 'LT'
+        batch = options['batch']
+        rollback_every = options['rollback_every']
+        committed = []
+        errors = []
+        lock = threading.Lock()
+
+        class Rollback(Exception):
+            pass
+
+        def worker():
+            try:
+                for i in range(1, options['per_thread'] + 1):
+                    try:
+                        with transaction.atomic():
+                            first = allocate(company_id, prefix, batch)
+                            if rollback_every and i % rollback_every == 0:
+                                raise Rollback
+                    except Rollback:
+                        continue
+                    with lock:
+                        committed.extend(range(first, first + batch))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        NumberSequence.objects.filter(company_id=company_id).delete()
+
+        if errors:
+            raise CommandError(f'{len(errors)} workers failed, first error: {errors[0]!r}')
+
+        values = sorted(committed)
+        if len(values) != len(set(values)):
+            raise CommandError('Duplicate numbers were allocated')
+        if values != list(range(1, len(values) + 1)):
+            raise CommandError('Allocated numbers have gaps')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{len(values)} numbers from {len(threads)} threads in {elapsed:.2f}s '
+                f'({len(values) / elapsed:.0f}/s): unique and gapless'
+            )
+        )
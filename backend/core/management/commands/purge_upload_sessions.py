@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.upload_service import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = 'Deletes unfinished chunked uploads and their stored chunks once they expire'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=settings.UPLOAD_SESSION_TTL_HOURS,
+            help=f'Idle time after which an upload expires (default: {settings.UPLOAD_SESSION_TTL_HOURS})'
+        )
+
+    def handle(self, *args, **options):
+        count = purge_expired_sessions(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {count} expired upload sessions'))
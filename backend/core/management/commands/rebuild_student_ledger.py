@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.ledger import rebuild_ledger
+from core.models import Registration
+
+
+class Command(BaseCommand):
+    help = (
+        'Reposts the fee ledger of every registration from its registration fee, enrollments, '
+        'payments and refunds, and recomputes the balance snapshots'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', help='Only this company id (default: every company)')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Registrations per transaction (default: 200)')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Rebuild inside a transaction that is rolled back, only reporting the counts'
+        )
+
+    def handle(self, *args, **options):
+        registrations = Registration.objects.order_by('pk')
+        if options['company']:
+            registrations = registrations.filter(company_id=options['company'])
+
+        chunk_size = options['chunk_size']
+        ids = list(registrations.values_list('pk', flat=True))
+        entries = 0
+        for start in range(0, len(ids), chunk_size):
+            with transaction.atomic():
+                entries += rebuild_ledger(Registration.objects.filter(pk__in=ids[start:start + chunk_size]))
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+
+        if options['dry_run']:
+            self.stdout.write(f'{entries} ledger entries would be posted for {len(ids)} registrations')
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Posted {entries} ledger entries for {len(ids)} registrations'))
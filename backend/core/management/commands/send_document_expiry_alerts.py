@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.document_expiry import send_expiry_alerts
+
+
+class Command(BaseCommand):
+    help = 'Notifies document holders once per threshold as their documents approach expiry (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            nargs='+',
+            default=settings.DOCUMENT_EXPIRY_ALERT_DAYS,
+            help=f'Alert thresholds in days before expiry (default: {settings.DOCUMENT_EXPIRY_ALERT_DAYS})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many alerts would be sent'
+        )
+
+    def handle(self, *args, **options):
+        alerts, notifications = send_expiry_alerts(thresholds=options['days'], dry_run=options['dry_run'])
+
+        if options['dry_run']:
+            self.stdout.write(f'{alerts} document alerts would be sent in {notifications} notifications')
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Sent {alerts} document alerts in {notifications} notifications')
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.installments import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = 'Marks pending installments past their due date Overdue and reminds the enrolling counselors (run daily)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many installments would be marked overdue'
+        )
+
+    def handle(self, *args, **options):
+        installments, notifications = sweep_overdue(dry_run=options['dry_run'])
+        reminders = f'{notifications} reminder{"s" if notifications != 1 else ""}'
+
+        if options['dry_run']:
+            self.stdout.write(f'{installments} installments would be marked overdue and {reminders} sent')
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Marked {installments} installments overdue and sent {reminders}')
+        )
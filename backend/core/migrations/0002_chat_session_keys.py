@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:27
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatSessionKey',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('epoch', models.PositiveIntegerField()),
+                ('encrypted_keys', models.JSONField(default=dict, help_text='Format: {user_id: encrypted_aes_key}')),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_keys', to='core.chatconversation')),
+            ],
+            options={
+                'ordering': ['-epoch'],
+            },
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='session_key',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='messages', to='core.chatsessionkey'),
+        ),
+        migrations.AddConstraint(
+            model_name='chatsessionkey',
+            constraint=models.UniqueConstraint(fields=('conversation', 'epoch'), name='unique_chat_session_key_epoch'),
+        ),
+    ]
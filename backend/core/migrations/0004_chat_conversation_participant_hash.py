@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:33
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_participant_hash(apps, schema_editor):
+    """Hash existing direct messages; duplicates of an existing pair stay unhashed"""
+    ChatConversation = apps.get_model('core', 'ChatConversation')
+    seen = set()
+    for conversation in ChatConversation.objects.filter(is_group=False).order_by('created_at').prefetch_related('participants'):
+        member_ids = sorted(str(p.id) for p in conversation.participants.all())
+        if len(member_ids) != 2:
+            continue
+        participant_hash = hashlib.sha256(','.join(member_ids).encode()).hexdigest()
+        if (conversation.company_id, participant_hash) in seen:
+            continue
+        seen.add((conversation.company_id, participant_hash))
+        ChatConversation.objects.filter(pk=conversation.pk).update(participant_hash=participant_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_chat_message_client_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatconversation',
+            name='participant_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(backfill_participant_hash, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='chatconversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_group', False), models.Q(('participant_hash', ''), _negated=True)), fields=('company_id', 'participant_hash'), name='unique_chat_direct_conversation'),
+        ),
+    ]
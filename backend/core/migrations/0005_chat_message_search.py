@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:36
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS core_chatmessage_text_fts "
+    "ON core_chatmessage USING GIN (to_tsvector('simple', text))",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS core_chatmessage_text_fts",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS core_chatmessage_fts "
+    "USING fts5(message_id UNINDEXED, text)",
+    "INSERT INTO core_chatmessage_fts (message_id, text) "
+    "SELECT id, text FROM core_chatmessage WHERE text != ''",
+    "CREATE TRIGGER IF NOT EXISTS core_chatmessage_fts_insert AFTER INSERT ON core_chatmessage "
+    "WHEN NEW.text != '' BEGIN "
+    "INSERT INTO core_chatmessage_fts (message_id, text) VALUES (NEW.id, NEW.text); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS core_chatmessage_fts_update AFTER UPDATE OF text ON core_chatmessage BEGIN "
+    "DELETE FROM core_chatmessage_fts WHERE message_id = OLD.id; "
+    "INSERT INTO core_chatmessage_fts (message_id, text) SELECT NEW.id, NEW.text WHERE NEW.text != ''; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS core_chatmessage_fts_delete AFTER DELETE ON core_chatmessage BEGIN "
+    "DELETE FROM core_chatmessage_fts WHERE message_id = OLD.id; "
+    "END",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS core_chatmessage_fts_insert",
+    "DROP TRIGGER IF EXISTS core_chatmessage_fts_update",
+    "DROP TRIGGER IF EXISTS core_chatmessage_fts_delete",
+    "DROP TABLE IF EXISTS core_chatmessage_fts",
+]
+
+
+def run_statements(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_chat_conversation_participant_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_statements({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
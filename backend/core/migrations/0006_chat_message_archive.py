@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:39
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_chat_message_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMessageArchive',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='core.chatconversation')),
+            ],
+            options={
+                'ordering': ['-end_time'],
+                'indexes': [models.Index(fields=['conversation', 'end_time'], name='core_chatme_convers_9fa8f6_idx')],
+            },
+        ),
+    ]
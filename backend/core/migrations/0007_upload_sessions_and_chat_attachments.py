@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:40
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+def restore_sqlite_search_triggers(apps, schema_editor):
+    """SQLite rebuilds core_chatmessage for the new columns, dropping its FTS triggers"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search_migration = import_module('core.migrations.0005_chat_message_search')
+    for statement in search_migration.SQLITE_FORWARD:
+        if statement.startswith('CREATE TRIGGER'):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_chat_message_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, upload_to='chat_attachments/'),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='attachment_content_type',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='attachment_name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chatmessage',
+            name='attachment_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('purpose', models.CharField(choices=[('document', 'Document'), ('chat', 'Chat Attachment')], max_length=20)),
+                ('file_name', models.CharField(max_length=255)),
+                ('content_type', models.CharField(blank=True, default='', max_length=100)),
+                ('total_size', models.BigIntegerField()),
+                ('chunk_size', models.PositiveIntegerField()),
+                ('checksum', models.CharField(blank=True, default='', help_text='Optional sha256 of the whole file', max_length=64)),
+                ('received_chunks', models.JSONField(default=list, help_text='Indexes of chunks stored so far')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('COMPLETE', 'Complete')], default='PENDING', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(restore_sqlite_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:44
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_existing_custody(apps, schema_editor):
+    """Start every existing document's ledger from its current state"""
+    StudentDocument = apps.get_model('core', 'StudentDocument')
+    StudentDocumentCustody = apps.get_model('core', 'StudentDocumentCustody')
+    
+    rows = []
+    for doc in StudentDocument.objects.all().iterator():
+        holder_id = doc.current_holder_id or doc.created_by_id
+        if doc.status == 'Returned':
+            returned_at = doc.returned_at or doc.received_at
+            rows.append(StudentDocumentCustody(
+                document_id=doc.id, holder_id=holder_id, action='Received',
+                started_at=doc.received_at, ended_at=returned_at, company_id=doc.company_id
+            ))
+            rows.append(StudentDocumentCustody(
+                document_id=doc.id, holder_id=None, action='Returned',
+                started_at=returned_at, company_id=doc.company_id
+            ))
+        else:
+            rows.append(StudentDocumentCustody(
+                document_id=doc.id, holder_id=holder_id, action='Received',
+                started_at=doc.received_at, company_id=doc.company_id
+            ))
+    StudentDocumentCustody.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_upload_sessions_and_chat_attachments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentDocumentCustody',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('Received', 'Received'), ('Transferred', 'Transferred'), ('Returned', 'Returned')], max_length=20)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='custody', to='core.studentdocument')),
+                ('holder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='document_custody', to=settings.AUTH_USER_MODEL)),
+                ('transfer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='custody', to='core.physicaldocumenttransfer')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['document', 'started_at'], name='core_studen_documen_0a376a_idx'), models.Index(condition=models.Q(('ended_at__isnull', True)), fields=['holder'], name='custody_open_by_holder')],
+            },
+        ),
+        migrations.RunPython(open_existing_custody, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:51
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_content_addressed_documents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='thumbnail',
+            field=models.FileField(blank=True, editable=False, null=True, storage=core.storage.get_document_storage, upload_to='documents/'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:52
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_document_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentExpiryAlert',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('threshold', models.PositiveIntegerField()),
+                ('expiry_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['company_id', 'expiry_date'], name='document_company_expiry'),
+        ),
+        migrations.AddField(
+            model_name='documentexpiryalert',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_alerts', to='core.document'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentexpiryalert',
+            constraint=models.UniqueConstraint(fields=('document', 'threshold', 'expiry_date'), name='unique_document_expiry_alert'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_document_expiry_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('company_id', models.CharField(max_length=100)),
+                ('prefix', models.CharField(max_length=20)),
+                ('next_value', models.BigIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='enrollment',
+            name='enrollment_no',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='registration',
+            name='registration_no',
+            field=models.CharField(max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('company_id', 'enrollment_no'), name='unique_enrollment_no_per_company'),
+        ),
+        migrations.AddConstraint(
+            model_name='registration',
+            constraint=models.UniqueConstraint(fields=('company_id', 'registration_no'), name='unique_registration_no_per_company'),
+        ),
+        migrations.AddConstraint(
+            model_name='numbersequence',
+            constraint=models.UniqueConstraint(fields=('company_id', 'prefix'), name='unique_number_sequence'),
+        ),
+    ]
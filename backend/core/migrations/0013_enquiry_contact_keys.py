@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.contacts import contact_keys
+
+
+def fill_contact_keys(apps, schema_editor):
+    """Compute the contact keys of existing enquiries"""
+    Enquiry = apps.get_model('core', 'Enquiry')
+    
+    batch = []
+    for enquiry in Enquiry.objects.only('id', 'mobile', 'email', 'candidate_name').iterator(chunk_size=1000):
+        for field, value in contact_keys(enquiry.mobile, enquiry.email, enquiry.candidate_name).items():
+            setattr(enquiry, field, value)
+        batch.append(enquiry)
+        if len(batch) >= 1000:
+            Enquiry.objects.bulk_update(batch, ['mobile_key', 'email_key', 'name_key'])
+            batch = []
+    if batch:
+        Enquiry.objects.bulk_update(batch, ['mobile_key', 'email_key', 'name_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_per_company_number_sequences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enquiry',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='core.enquiry'),
+        ),
+        migrations.AddField(
+            model_name='enquiry',
+            name='email_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='enquiry',
+            name='mobile_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='enquiry',
+            name='name_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=60),
+        ),
+        migrations.AddIndex(
+            model_name='enquiry',
+            index=models.Index(fields=['company_id', 'mobile_key'], name='enquiry_company_mobile'),
+        ),
+        migrations.AddIndex(
+            model_name='enquiry',
+            index=models.Index(fields=['company_id', 'email_key'], name='enquiry_company_email'),
+        ),
+        migrations.AddIndex(
+            model_name='enquiry',
+            index=models.Index(fields=['company_id', 'name_key'], name='enquiry_company_name'),
+        ),
+        migrations.RunPython(fill_contact_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:07
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_enquiry_contact_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='enrollment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='core.enrollment'),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='registration',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='core.registration'),
+        ),
+        migrations.AddField(
+            model_name='refund',
+            name='registration',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='refunds', to='core.registration'),
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('Charge', 'Charge'), ('Payment', 'Payment'), ('Refund', 'Refund')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('description', models.CharField(blank=True, default='', max_length=255)),
+                ('occurred_at', models.DateTimeField()),
+                ('source_key', models.CharField(max_length=80, unique=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('enrollment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.enrollment')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.payment')),
+                ('refund', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.refund')),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='core.registration')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['registration', 'occurred_at'], name='ledger_registration_time')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('charged', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('refunded', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('company_id', models.CharField(default='', max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('registration', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='core.registration')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['company_id', 'balance'], name='balance_company_balance')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_installment_status_due'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('ASSEMBLING', 'Assembling'), ('COMPLETE', 'Complete')], default='PENDING', max_length=20),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_ledgerentry_enrollment_set_null'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='chatmessage',
+            name='unique_chat_message_client_id',
+        ),
+        migrations.AddConstraint(
+            model_name='chatmessage',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_id', ''), _negated=True), fields=('conversation', 'sender', 'client_id'), name='unique_chat_message_client_id'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:46
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_chatmessage_client_id_per_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='error',
+            field=models.CharField(blank=True, default='', help_text='Why the last completion failed', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='params',
+            field=models.JSONField(blank=True, default=dict, help_text='Fields sent with the complete request'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='result',
+            field=models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Created Document or chat message', null=True),
+        ),
+    ]
@@ -1,7 +1,11 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 import uuid
 from django.contrib.auth.models import AbstractUser
 
+from .contacts import contact_keys
+from .storage import get_document_storage
+
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     ROLE_CHOICES = (
@@ -106,9 +110,31 @@ class Enquiry(models.Model):
     company_id = models.CharField(max_length=100, default='')
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_enquiries')
 
+    # Normalized contact keys for duplicate detection (see core.contacts), set on save
+    mobile_key = models.CharField(max_length=20, blank=True, default='', editable=False)
+    email_key = models.CharField(max_length=254, blank=True, default='', editable=False)
+    name_key = models.CharField(max_length=60, blank=True, default='', editable=False)
+    # Earliest enquiry of the duplicate cluster this one belongs to (cluster_enquiry_duplicates)
+    duplicate_of = models.ForeignKey('self', related_name='duplicates', on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company_id', 'mobile_key'], name='enquiry_company_mobile'),
+            models.Index(fields=['company_id', 'email_key'], name='enquiry_company_email'),
+            models.Index(fields=['company_id', 'name_key'], name='enquiry_company_name'),
+        ]
+
+    def save(self, *args, **kwargs):
+        for field, value in contact_keys(self.mobile, self.email, self.candidate_name).items():
+            setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'mobile_key', 'email_key', 'name_key'}
+        super().save(*args, **kwargs)
+
 class Registration(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    registration_no = models.CharField(max_length=50, unique=True)
+    registration_no = models.CharField(max_length=50)
     student_name = models.CharField(max_length=255)
     mobile = models.CharField(max_length=20)
     email = models.EmailField()
@@ -171,9 +197,14 @@ class Registration(models.Model):
     enquiry = models.ForeignKey(Enquiry, on_delete=models.SET_NULL, null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_registrations')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company_id', 'registration_no'], name='unique_registration_no_per_company'),
+        ]
+
 class Enrollment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    enrollment_no = models.CharField(max_length=50, unique=True)
+    enrollment_no = models.CharField(max_length=50)
     student = models.ForeignKey(Registration, on_delete=models.CASCADE)
     program_name = models.CharField(max_length=255)
     university = models.CharField(max_length=255, blank=True, default='')
@@ -191,13 +222,23 @@ class Enrollment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company_id', 'enrollment_no'], name='unique_enrollment_no_per_company'),
+        ]
+
 class Installment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     enrollment = models.ForeignKey(Enrollment, related_name='installments', on_delete=models.CASCADE)
     number = models.IntegerField()
     due_date = models.DateField()
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    status = models.CharField(max_length=20, default='Pending')
+    status = models.CharField(max_length=20, default='Pending')  # Pending, Overdue (sweep_overdue_installments), Paid
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'due_date'], name='installment_status_due'),
+        ]
 
 class Payment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -209,6 +250,8 @@ class Payment(models.Model):
     method = models.CharField(max_length=50)
     metadata = models.JSONField(default=dict, blank=True)
     company_id = models.CharField(max_length=100, default='')
+    registration = models.ForeignKey(Registration, related_name='payments', on_delete=models.SET_NULL, null=True, blank=True)
+    enrollment = models.ForeignKey(Enrollment, related_name='payments', on_delete=models.SET_NULL, null=True, blank=True)
 
 class Refund(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -228,14 +271,82 @@ class Refund(models.Model):
     rejection_reason = models.TextField(blank=True, default='')
     student_name = models.CharField(max_length=255, default='')
     company_id = models.CharField(max_length=100, default='')
+    registration = models.ForeignKey(Registration, related_name='refunds', on_delete=models.SET_NULL, null=True, blank=True)
     
     def __str__(self):
         return f"Refund ₹{self.amount} for {self.student_name} - {self.status}"
 
+class LedgerEntry(models.Model):
+    """
+    One line of a student's fee ledger (see core.ledger). Charges are positive,
+    payments negative and refunds positive again, so a registration's entries
+    sum to what the student owes. source_key ('payment:<id>', ...) makes
+    reposting a source replace its line instead of adding another.
+    """
+    KIND_CHOICES = (
+        ('Charge', 'Charge'),
+        ('Payment', 'Payment'),
+        ('Refund', 'Refund'),
+    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    registration = models.ForeignKey(Registration, related_name='ledger_entries', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    description = models.CharField(max_length=255, blank=True, default='')
+    occurred_at = models.DateTimeField()
+    source_key = models.CharField(max_length=80, unique=True)
+    # SET_NULL: payments made against a deleted enrollment still count (its own charge is removed by the ledger signals)
+    enrollment = models.ForeignKey(Enrollment, related_name='ledger_entries', on_delete=models.SET_NULL, null=True, blank=True)
+    payment = models.ForeignKey(Payment, related_name='ledger_entries', on_delete=models.CASCADE, null=True, blank=True)
+    refund = models.ForeignKey(Refund, related_name='ledger_entries', on_delete=models.CASCADE, null=True, blank=True)
+    company_id = models.CharField(max_length=100, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['registration', 'occurred_at'], name='ledger_registration_time'),
+        ]
+
+class StudentBalance(models.Model):
+    """
+    Materialized totals of a registration's ledger, rewritten in the same
+    transaction as the entries (core.ledger.refresh_balances). Statements and
+    receivables read this instead of summing payments.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    registration = models.OneToOneField(Registration, related_name='balance', on_delete=models.CASCADE)
+    charged = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refunded = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    company_id = models.CharField(max_length=100, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company_id', 'balance'], name='balance_company_balance'),
+        ]
+
+class StoredBlob(models.Model):
+    """
+    A unique file in content-addressed storage (see core.storage).
+    ref_count is the number of Documents pointing at it; blobs that drop to
+    zero are deleted by the gc_document_blobs command.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class Document(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     file_name = models.CharField(max_length=255)
-    file = models.FileField(upload_to='documents/', null=True, blank=True)
+    file = models.FileField(upload_to='documents/', storage=get_document_storage, null=True, blank=True)
+    blob = models.ForeignKey(StoredBlob, related_name='documents', on_delete=models.SET_NULL, null=True, blank=True)
+    thumbnail = models.FileField(upload_to='documents/', storage=get_document_storage, null=True, blank=True, editable=False)
     description = models.CharField(max_length=255, blank=True, default='')
     type = models.CharField(max_length=50)
     status = models.CharField(max_length=10, choices=(('IN', 'IN'), ('OUT', 'OUT')), default='IN')
@@ -247,6 +358,32 @@ class Document(models.Model):
     expiry_date = models.DateField(blank=True, null=True)
     company_id = models.CharField(max_length=100, default='')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company_id', 'expiry_date'], name='document_company_expiry'),
+        ]
+
+class DocumentExpiryAlert(models.Model):
+    """
+    One row per (document, threshold, expiry date) that has been alerted, so
+    send_document_expiry_alerts warns once per threshold. A changed expiry
+    date starts a fresh set of alerts.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    document = models.ForeignKey(Document, related_name='expiry_alerts', on_delete=models.CASCADE)
+    threshold = models.PositiveIntegerField()  # days before expiry
+    expiry_date = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    company_id = models.CharField(max_length=100, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['document', 'threshold', 'expiry_date'],
+                name='unique_document_expiry_alert'
+            ),
+        ]
+
 class StudentDocument(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     registration = models.ForeignKey(Registration, on_delete=models.CASCADE, related_name='student_documents')
@@ -327,6 +464,35 @@ class TransferTimeline(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class StudentDocumentCustody(models.Model):
+    """
+    Append-only custody ledger for physical documents: one row per holding
+    period. A period is closed (ended_at set) when the document moves on and
+    is never edited otherwise. holder is null while the document is back with
+    the student.
+    """
+    ACTION_CHOICES = (
+        ('Received', 'Received'),
+        ('Transferred', 'Transferred'),
+        ('Returned', 'Returned'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    document = models.ForeignKey(StudentDocument, on_delete=models.CASCADE, related_name='custody')
+    holder = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='document_custody')
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    transfer = models.ForeignKey(PhysicalDocumentTransfer, on_delete=models.SET_NULL, null=True, blank=True, related_name='custody')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+    company_id = models.CharField(max_length=100, default='')
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['document', 'started_at']),
+            models.Index(fields=['holder'], condition=models.Q(ended_at__isnull=True), name='custody_open_by_holder'),
+        ]
+
 class Task(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255)
@@ -517,10 +683,21 @@ class ChatConversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     participants = models.ManyToManyField(User, related_name='conversations')
     is_group = models.BooleanField(default=False)
+    # sha256 of the sorted participant ids; only set on direct messages
+    participant_hash = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     company_id = models.CharField(max_length=100, default='')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company_id', 'participant_hash'],
+                condition=models.Q(is_group=False) & ~models.Q(participant_hash=''),
+                name='unique_chat_direct_conversation'
+            ),
+        ]
+
 class ChatMessage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     conversation = models.ForeignKey(ChatConversation, related_name='messages', on_delete=models.CASCADE)
@@ -532,9 +709,12 @@ class ChatMessage(models.Model):
     # Deprecated: plain text field (keeping for migration compatibility)
     text = models.TextField(blank=True, default='')
     
-    # AES key encrypted for each recipient with their RSA public key
+    # AES key encrypted for each recipient with their RSA public key (legacy per-message keys)
     encrypted_keys = models.JSONField(default=dict, help_text="Format: {user_id: encrypted_aes_key}")
     
+    # Conversation key epoch used to encrypt this message (null for legacy per-message keys)
+    session_key = models.ForeignKey('ChatSessionKey', on_delete=models.PROTECT, null=True, blank=True, related_name='messages')
+    
     # Read receipts
     is_read = models.BooleanField(default=False)  # Legacy field
     read_by = models.JSONField(default=list, help_text="List of user IDs who have read this message")
@@ -542,6 +722,104 @@ class ChatMessage(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)  # Legacy field
     company_id = models.CharField(max_length=100, default='')
+    
+    # Client-generated id so retried sends are stored only once
+    client_id = models.CharField(max_length=64, blank=True, default='')
+    
+    # Optional file attachment (uploaded through an UploadSession)
+    attachment = models.FileField(upload_to='chat_attachments/', null=True, blank=True)
+    attachment_name = models.CharField(max_length=255, blank=True, default='')
+    attachment_size = models.BigIntegerField(null=True, blank=True)
+    attachment_content_type = models.CharField(max_length=100, blank=True, default='')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'sender', 'client_id'],
+                condition=~models.Q(client_id=''),
+                name='unique_chat_message_client_id'
+            ),
+        ]
+
+class UploadSession(models.Model):
+    """
+    Resumable chunked upload. Chunks are stored under MEDIA_ROOT/uploads/<id>/
+    until the upload is completed and assembled into its final file.
+    """
+    PURPOSE_CHOICES = (
+        ('document', 'Document'),
+        ('chat', 'Chat Attachment'),
+    )
+    STATUS_CHOICES = (
+        ('PENDING', 'Pending'),
+        ('ASSEMBLING', 'Assembling'),
+        ('COMPLETE', 'Complete'),
+    )
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(User, related_name='upload_sessions', on_delete=models.CASCADE)
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    file_name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    checksum = models.CharField(max_length=64, blank=True, default='', help_text="Optional sha256 of the whole file")
+    received_chunks = models.JSONField(default=list, help_text="Indexes of chunks stored so far")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # Completion runs in the background: the request's fields go in, the created object comes out
+    params = models.JSONField(default=dict, blank=True, help_text="Fields sent with the complete request")
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder, help_text="Created Document or chat message")
+    error = models.CharField(max_length=255, blank=True, default='', help_text="Why the last completion failed")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    company_id = models.CharField(max_length=100, default='')
+    
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+class ChatMessageArchive(models.Model):
+    """
+    Compressed segment of old messages moved out of ChatMessage.
+    data is zlib-compressed JSON: a list of message rows ordered by timestamp.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(ChatConversation, related_name='archives', on_delete=models.CASCADE)
+    start_time = models.DateTimeField()
+    end_time = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    company_id = models.CharField(max_length=100, default='')
+
+    class Meta:
+        ordering = ['-end_time']
+        indexes = [
+            models.Index(fields=['conversation', 'end_time']),
+        ]
+
+class ChatSessionKey(models.Model):
+    """Conversation-level AES key, wrapped once per member and rotated by epoch"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(ChatConversation, related_name='session_keys', on_delete=models.CASCADE)
+    epoch = models.PositiveIntegerField()
+    
+    # AES key encrypted for each member with their RSA public key
+    encrypted_keys = models.JSONField(default=dict, help_text="Format: {user_id: encrypted_aes_key}")
+    
+    message_count = models.PositiveIntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    company_id = models.CharField(max_length=100, default='')
+    
+    class Meta:
+        ordering = ['-epoch']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'epoch'], name='unique_chat_session_key_epoch'),
+        ]
+    
+    def __str__(self):
+        return f"Session key epoch {self.epoch} for {self.conversation_id}"
 
 class GroupChat(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -714,3 +992,22 @@ class Earning(models.Model):
     
     def __str__(self):
         return f"{self.user.username} - {self.amount} from {self.source_type}"
+
+class NumberSequence(models.Model):
+    """
+    Per-company counter behind human-readable numbers (REG-00042, ENR-00007).
+    Allocated under a row lock by core.sequences, inside the caller's
+    transaction, so numbers are sequential and a rollback returns them.
+    """
+    company_id = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=20)
+    next_value = models.BigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['company_id', 'prefix'], name='unique_number_sequence'),
+        ]
+
+    def __str__(self):
+        return f"{self.company_id} {self.prefix} -> {self.next_value}"
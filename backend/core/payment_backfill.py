@@ -0,0 +1,202 @@
+"""
+Payment backfill - link legacy payments to their students and create the missing ones
+
+Older payments only carry student_name. link_legacy_payments() attaches
+them to a registration (or enrollment) when the company, name and amount
+identify exactly one payment and exactly one unpaid candidate; repeated
+names are left alone, reported, and get no new payment either, since one
+of them is already paid. backfill_missing_payments() then creates the
+registration and enrollment payments that still don't exist,
+found with anti-joins on the payment FKs, so running it again creates
+nothing new. Enrollments on an installment plan never get one: their fees
+are paid installment by installment, and a full payment would record money
+that was never received. Touched ledgers are reposted (bulk writes skip the
+signals).
+"""
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .ledger import rebuild_ledger
+from .models import Enrollment, Installment, Payment, Registration
+
+
+def scoped(queryset, company_id):
+    return queryset.filter(company_id=company_id) if company_id else queryset
+
+
+def unpaid_registrations(company_id=None):
+    return scoped(Registration.objects, company_id).filter(registration_fee__gt=0).exclude(
+        Exists(Payment.objects.filter(registration=OuterRef('pk'), type='Registration'))
+    )
+
+
+def unpaid_enrollments(company_id=None):
+    return scoped(Enrollment.objects, company_id).filter(total_fees__gt=0).exclude(
+        Exists(Payment.objects.filter(enrollment=OuterRef('pk'), type='Enrollment'))
+    )
+
+
+def unique_matches(payments, candidates):
+    """
+    Pair (payment id, key) rows with (candidate, key) rows where the key
+    occurs exactly once on each side. Returns (matches, ambiguous payment
+    count, candidates sharing a key with an unmatched payment).
+    """
+    payment_keys = Counter(key for _, key in payments)
+    candidate_keys = Counter(key for _, key in candidates)
+    by_key = {key: candidate for candidate, key in candidates if candidate_keys[key] == 1}
+    matches = []
+    ambiguous = 0
+    for payment_id, key in payments:
+        if payment_keys[key] == 1 and key in by_key:
+            matches.append((payment_id, by_key[key]))
+        elif key in candidate_keys:
+            ambiguous += 1
+    matched = {candidate for _, candidate in matches}
+    held = {
+        candidate for candidate, key in candidates
+        if key in payment_keys and candidate not in matched
+    }
+    return matches, ambiguous, held
+
+
+def link_legacy_payments(company_id=None, batch_size=500, dry_run=False):
+    """
+    Attach unlinked payments to their registration or enrollment.
+    Returns (payments linked, ambiguous payment count, registration ids held,
+    enrollment ids held), where held candidates must not get a new payment.
+    """
+    legacy = scoped(Payment.objects, company_id).filter(registration__isnull=True, enrollment__isnull=True)
+
+    registration_matches, registration_ambiguous, registrations_held = unique_matches(
+        [
+            (pk, (company, name, amount))
+            for pk, company, name, amount in legacy.filter(type='Registration')
+            .values_list('pk', 'company_id', 'student_name', 'amount').iterator(chunk_size=batch_size)
+        ],
+        [
+            ((pk, pk), (company, name, fee))
+            for pk, company, name, fee in unpaid_registrations(company_id)
+            .values_list('pk', 'company_id', 'student_name', 'registration_fee').iterator(chunk_size=batch_size)
+        ]
+    )
+    enrollment_matches, enrollment_ambiguous, enrollments_held = unique_matches(
+        [
+            (pk, (company, name, amount))
+            for pk, company, name, amount in legacy.filter(type='Enrollment')
+            .values_list('pk', 'company_id', 'student_name', 'amount').iterator(chunk_size=batch_size)
+        ],
+        [
+            ((pk, student_id), (company, name, fees))
+            for pk, student_id, company, name, fees in unpaid_enrollments(company_id)
+            .values_list('pk', 'student_id', 'company_id', 'student__student_name', 'total_fees')
+            .iterator(chunk_size=batch_size)
+        ]
+    )
+
+    payments = [
+        Payment(pk=payment_id, registration_id=registration_id, enrollment_id=None)
+        for payment_id, (_, registration_id) in registration_matches
+    ] + [
+        Payment(pk=payment_id, registration_id=registration_id, enrollment_id=enrollment_id)
+        for payment_id, (enrollment_id, registration_id) in enrollment_matches
+    ]
+    if not dry_run:
+        for start in range(0, len(payments), batch_size):
+            batch = payments[start:start + batch_size]
+            with transaction.atomic():
+                Payment.objects.bulk_update(batch, ['registration', 'enrollment'])
+                rebuild_ledger(Registration.objects.filter(pk__in={payment.registration_id for payment in batch}))
+
+    return (
+        payments,
+        registration_ambiguous + enrollment_ambiguous,
+        {registration_id for registration_id, _ in registrations_held},
+        {enrollment_id for enrollment_id, _ in enrollments_held},
+    )
+
+
+def backfillable_enrollments(company_id=None):
+    """Unpaid enrollments paid in one go; installment plans are settled per installment"""
+    return unpaid_enrollments(company_id).exclude(
+        Exists(Installment.objects.filter(enrollment=OuterRef('pk')))
+    )
+
+
+def registration_payment(registration):
+    return Payment(
+        student_name=registration.student_name,
+        amount=registration.registration_fee,
+        type='Registration',
+        status='Success',
+        method='Cash', # Default
+        company_id=registration.company_id,
+        registration=registration
+    ), registration.registration_date
+
+
+def enrollment_payment(enrollment):
+    return Payment(
+        student_name=enrollment.student.student_name,
+        amount=enrollment.total_fees,
+        type='Enrollment',
+        status='Success',
+        method='Cash', # Default
+        company_id=enrollment.company_id,
+        registration_id=enrollment.student_id,
+        enrollment=enrollment
+    ), timezone.make_aware(datetime.datetime.combine(enrollment.start_date, datetime.time.min))
+
+
+def create_in_batches(queryset, build, batch_size, dry_run, skip=()):
+    """
+    Walk `queryset` by primary key and bulk_create a payment per row, dated
+    like its source. Returns the number of payments (that would be) created.
+    """
+    created = 0
+    last_pk = None
+    while True:
+        page = queryset.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        rows = list(page[:batch_size])
+        if not rows:
+            return created
+        last_pk = rows[-1].pk
+        rows = [row for row in rows if row.pk not in skip]
+        created += len(rows)
+        if dry_run or not rows:
+            continue
+
+        payments, dates = zip(*(build(row) for row in rows))
+        with transaction.atomic():
+            Payment.objects.bulk_create(payments)
+            # date is auto_now_add, so the real dates go in with a second, set-based write
+            for payment, date in zip(payments, dates):
+                payment.date = date
+            Payment.objects.bulk_update(payments, ['date'])
+            rebuild_ledger(Registration.objects.filter(pk__in={payment.registration_id for payment in payments}))
+
+
+def backfill_missing_payments(company_id=None, batch_size=500, dry_run=False, linked=(),
+                              registrations_held=(), enrollments_held=()):
+    """
+    Create the registration and enrollment payments that don't exist yet,
+    except for the held candidates and installment-plan enrollments. `linked` are the payments
+    link_legacy_payments attached (or, in a dry run, would have).
+    Returns (registration payments, enrollment payments).
+    """
+    return (
+        create_in_batches(
+            unpaid_registrations(company_id), registration_payment, batch_size, dry_run,
+            skip={payment.registration_id for payment in linked if payment.enrollment_id is None} | set(registrations_held)
+        ),
+        create_in_batches(
+            backfillable_enrollments(company_id).select_related('student'), enrollment_payment, batch_size, dry_run,
+            skip={payment.enrollment_id for payment in linked if payment.enrollment_id} | set(enrollments_held)
+        ),
+    )
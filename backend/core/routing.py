@@ -6,5 +6,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     path('ws/updates/', consumers.UpdatesConsumer.as_asgi()),
-    path('ws/chat/<int:conversation_id>/', consumers.ChatConsumer.as_asgi()),
+    path('ws/chat/', consumers.UserChatConsumer.as_asgi()),
+    path('ws/chat/<uuid:conversation_id>/', consumers.ChatConsumer.as_asgi()),
 ]
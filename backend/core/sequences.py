@@ -0,0 +1,54 @@
+"""
+Number sequences - per-company, per-prefix numbers for registrations and enrollments
+
+allocate() locks the company's NumberSequence row (select_for_update) and
+advances it inside the caller's transaction: concurrent creates queue on
+that one row, numbers are strictly sequential, and a rolled-back create
+gives its number back, so there are no gaps. Bulk imports take a whole
+block of numbers with a single locked update.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import NumberSequence
+
+REGISTRATION_PREFIX = 'REG'
+ENROLLMENT_PREFIX = 'ENR'
+NUMBER_WIDTH = 5
+
+
+def allocate(company_id, prefix, count=1):
+    """Reserve `count` consecutive values; returns the first one"""
+    if count < 1:
+        raise ValueError('count must be at least 1')
+
+    with transaction.atomic():
+        sequence = NumberSequence.objects.select_for_update().filter(
+            company_id=company_id, prefix=prefix
+        ).first()
+        if sequence is None:
+            try:
+                # Savepoint: losing the creation race must not break the outer transaction
+                with transaction.atomic():
+                    NumberSequence.objects.create(company_id=company_id, prefix=prefix)
+            except IntegrityError:
+                pass
+            sequence = NumberSequence.objects.select_for_update().get(company_id=company_id, prefix=prefix)
+
+        first = sequence.next_value
+        NumberSequence.objects.filter(pk=sequence.pk).update(next_value=F('next_value') + count)
+    return first
+
+
+def format_number(prefix, value):
+    return f'{prefix}-{value:0{NUMBER_WIDTH}d}'
+
+
+def next_number(company_id, prefix):
+    return format_number(prefix, allocate(company_id, prefix))
+
+
+def next_numbers(company_id, prefix, count):
+    """`count` consecutive formatted numbers (bulk imports)"""
+    first = allocate(company_id, prefix, count)
+    return [format_number(prefix, value) for value in range(first, first + count)]
@@ -1,3 +1,4 @@
+from django.urls import reverse
 from rest_framework import serializers
 from .models import (
     User, Enquiry, Registration, Enrollment, Payment, Document, 
@@ -5,8 +6,13 @@ from .models import (
     Notification, Commission, Refund, LeadSource, VisaTracking, FollowUp, FollowUpComment,
     Installment, Agent, ChatConversation, ChatMessage, GroupChat, SignupRequest,
     ApprovalRequest, Company, ActivityLog, Earning, PhysicalDocumentTransfer, TransferTimeline,
-    StudentRemark
+    StudentRemark, StudentDocumentCustody, LedgerEntry, StudentBalance
 )
+from .installments import build_schedule
+from .sequences import ENROLLMENT_PREFIX, next_number
+
+# Payment types charged against a student, which must be linked to their registration
+LEDGER_PAYMENT_TYPES = ('Registration', 'Enrollment', 'Installment')
 
 class CompanySerializer(serializers.ModelSerializer):
     class Meta:
@@ -53,6 +59,8 @@ class EnquirySerializer(serializers.ModelSerializer):
 class DocumentSerializer(serializers.ModelSerializer):
     uploaded_by_name = serializers.SerializerMethodField()
     current_holder_name = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
 
     def get_uploaded_by_name(self, obj):
         return obj.uploaded_by.username if obj.uploaded_by else '-'
@@ -60,9 +68,27 @@ class DocumentSerializer(serializers.ModelSerializer):
     def get_current_holder_name(self, obj):
         return obj.current_holder.username if obj.current_holder else '-'
 
+    def get_download_url(self, obj):
+        if not obj.file:
+            return None
+        url = reverse('document-download', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_thumbnail_url(self, obj):
+        if not obj.thumbnail:
+            return None
+        url = reverse('document-thumbnail', args=[obj.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
     class Meta:
         model = Document
-        fields = ['id', 'file_name', 'file', 'description', 'type', 'status', 'uploaded_at', 'student_name', 'registration', 'expiry_date', 'company_id', 'uploaded_by', 'current_holder', 'uploaded_by_name', 'current_holder_name']
+        fields = ['id', 'file_name', 'file', 'download_url', 'thumbnail_url', 'description', 'type', 'status', 'uploaded_at', 'student_name', 'registration', 'expiry_date', 'company_id', 'uploaded_by', 'current_holder', 'uploaded_by_name', 'current_holder_name']
+        # Files are only handed out by the permission-checked download / thumbnail actions
+        extra_kwargs = {
+            'file': {'write_only': True}
+        }
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
@@ -84,6 +110,23 @@ class StudentDocumentSerializer(serializers.ModelSerializer):
     def get_current_holder_name(self, obj):
         return obj.current_holder.username if obj.current_holder else ''
 
+class StudentDocumentCustodySerializer(serializers.ModelSerializer):
+    document_name = serializers.CharField(source='document.name', read_only=True)
+    document_number = serializers.CharField(source='document.document_number', read_only=True)
+    registration = serializers.UUIDField(source='document.registration_id', read_only=True)
+    student_name = serializers.CharField(source='document.registration.student_name', read_only=True)
+    holder_name = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = StudentDocumentCustody
+        fields = [
+            'id', 'document', 'document_name', 'document_number', 'registration', 'student_name',
+            'holder', 'holder_name', 'action', 'transfer', 'started_at', 'ended_at'
+        ]
+    
+    def get_holder_name(self, obj):
+        return obj.holder.username if obj.holder else ''
+
 class StudentRemarkSerializer(serializers.ModelSerializer):
     user_name = serializers.SerializerMethodField()
     
@@ -105,6 +148,26 @@ class RegistrationSerializer(serializers.ModelSerializer):
     documents = DocumentSerializer(many=True, read_only=True)
     student_documents = StudentDocumentSerializer(many=True, read_only=True)
 
+    class Meta:
+        model = Registration
+        fields = '__all__'
+        # Allocated per company by RegistrationViewSet.perform_create
+        read_only_fields = ['registration_no']
+
+class RegistrationListSerializer(serializers.ModelSerializer):
+    """
+    List rows: document counts come from queryset annotations
+    (RegistrationViewSet.get_queryset) instead of nested document lists
+    """
+    created_by_name = serializers.SerializerMethodField()
+    documents_count = serializers.IntegerField(read_only=True)
+    student_documents_count = serializers.IntegerField(read_only=True)
+    documents_held = serializers.IntegerField(read_only=True)
+    documents_returned = serializers.IntegerField(read_only=True)
+
+    def get_created_by_name(self, obj):
+        return obj.created_by.username if obj.created_by else '-'
+
     class Meta:
         model = Registration
         fields = '__all__'
@@ -204,29 +267,26 @@ class EnrollmentSerializer(serializers.ModelSerializer):
         total_fees = school_fees + hostel_fees + commission_amount
         validated_data['total_fees'] = total_fees
         
-        # Generate Enrollment No
-        import uuid
-        validated_data['enrollment_no'] = f"ENR-{uuid.uuid4().hex[:8].upper()}"
+        # Next enrollment number of the company (sequential, allocated in the create transaction)
+        validated_data['enrollment_no'] = next_number(validated_data.get('company_id', ''), ENROLLMENT_PREFIX)
         
         enrollment = super().create(validated_data)
         
         # Create Installments if applicable
         if payment_type == 'Installment' and installments_count and installments_count > 0:
-            from datetime import date, timedelta
-            from .models import Installment
-            
-            amount_per_installment = installment_amount or (total_fees / installments_count)
-            start_date = validated_data.get('start_date', date.today())
-            
-            for i in range(installments_count):
-                due_date = start_date + timedelta(days=30 * (i + 1))
-                Installment.objects.create(
+            # Monthly due dates; amounts add up to total_fees to the cent
+            Installment.objects.bulk_create([
+                Installment(
                     enrollment=enrollment,
-                    number=i + 1,
+                    number=number,
                     due_date=due_date,
-                    amount=amount_per_installment,
+                    amount=amount,
                     status='Pending'
                 )
+                for number, due_date, amount in build_schedule(
+                    total_fees, installments_count, enrollment.start_date, installment_amount
+                )
+            ])
                 
         return enrollment
 
@@ -241,6 +301,46 @@ class PaymentSerializer(serializers.ModelSerializer):
         refunds = obj.refunds.all()
         return RefundSerializer(refunds, many=True).data if refunds.exists() else []
 
+    def validate(self, data):
+        # An enrollment payment belongs to the enrolled student's ledger
+        enrollment = data.get('enrollment')
+        if enrollment and not data.get('registration'):
+            data['registration'] = enrollment.student
+        elif enrollment and data['registration'] != enrollment.student:
+            raise serializers.ValidationError("The enrollment belongs to a different registration.")
+
+        # Payments reach the student's ledger through their registration: match
+        # an unlinked one by name, and insist on it for new student fee payments
+        # (legacy unlinked rows stay editable; see the backfill_payments command)
+        payment_type = data.get('type', self.instance.type if self.instance else None)
+        registration = data.get('registration', self.instance.registration if self.instance else None)
+        if registration is None:
+            matches = self.registrations_named(data.get('student_name', self.instance.student_name if self.instance else ''))
+            if len(matches) == 1:
+                data['registration'] = registration = matches[0]
+            elif payment_type in LEDGER_PAYMENT_TYPES and self.instance is None:
+                raise serializers.ValidationError({
+                    'registration': "Select the student's registration for this payment."
+                    if matches else "No registration found for this student."
+                })
+
+        request = self.context.get('request')
+        if registration and request and registration.company_id != request.user.company_id:
+            raise serializers.ValidationError({'registration': "Registration not found."})
+        return data
+
+    def registrations_named(self, student_name):
+        """Up to two of the company's registrations with this student name"""
+        request = self.context.get('request')
+        if not request or not (student_name or '').strip():
+            return []
+        return list(
+            Registration.objects.filter(
+                company_id=request.user.company_id,
+                student_name__iexact=student_name.strip()
+            )[:2]
+        )
+
 class RefundSerializer(serializers.ModelSerializer):
     payment_details = serializers.SerializerMethodField()
     approved_by_name = serializers.CharField(source='approved_by.username', read_only=True)
@@ -266,6 +366,20 @@ class RefundSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("A refund request already exists for this payment.")
         return data
 
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LedgerEntry
+        fields = ['id', 'kind', 'amount', 'description', 'occurred_at', 'enrollment', 'payment', 'refund']
+
+class StudentBalanceSerializer(serializers.ModelSerializer):
+    registration_no = serializers.CharField(source='registration.registration_no', read_only=True)
+    student_name = serializers.CharField(source='registration.student_name', read_only=True)
+    mobile = serializers.CharField(source='registration.mobile', read_only=True)
+
+    class Meta:
+        model = StudentBalance
+        fields = '__all__'
+
 class DocumentTransferSerializer(serializers.ModelSerializer):
     sender = serializers.PrimaryKeyRelatedField(read_only=True)
     sender_name = serializers.CharField(source='sender.username', read_only=True)
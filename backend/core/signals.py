@@ -1,16 +1,20 @@
 """
 Django signals for broadcasting real-time updates
 """
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
+from django.utils import timezone
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
 from .models import (
     Enquiry, Registration, Enrollment, Payment,
     Document, Task, Appointment, Notification,
-    FollowUp, User, ActivityLog, Earning
+    FollowUp, User, ActivityLog, Earning, StoredBlob
 )
+from .storage import hash_from_name
 
 
 def broadcast_event(entity_type, action, instance, company_id=None):
@@ -44,14 +48,48 @@ def broadcast_event(entity_type, action, instance, company_id=None):
         }
     }
     
-    # Broadcast to room
-    try:
-        async_to_sync(channel_layer.group_send)(
-            room_group_name,
-            event_data
-        )
-    except Exception as e:
-        print(f"Error broadcasting event: {e}")
+    # Broadcast to room once the surrounding transaction (if any) commits
+    send_after_commit(channel_layer, room_group_name, event_data)
+
+
+def send_after_commit(channel_layer, room_group_name, event_data):
+    """
+    group_send when the current transaction commits (immediately outside one),
+    so a multi-row create sends nothing if it rolls back and clients never
+    refetch rows that aren't visible yet.
+    """
+    def send():
+        try:
+            async_to_sync(channel_layer.group_send)(
+                room_group_name,
+                event_data
+            )
+        except Exception as e:
+            print(f"Error broadcasting event: {e}")
+
+    transaction.on_commit(send)
+
+
+def broadcast_bulk_event(entity_type, action, ids, company_id=None):
+    """
+    Broadcast one event covering many instances changed by a queryset update
+    (which does not fire post_save). data carries 'ids' instead of 'id'.
+    """
+    channel_layer = get_channel_layer()
+    
+    if not channel_layer or not ids:
+        return
+    
+    room_group_name = f'updates_company_{company_id}' if company_id else 'updates_dev_admin'
+    
+    send_after_commit(channel_layer, room_group_name, {
+        'type': 'broadcast_update',
+        'entity': entity_type,
+        'action': action,
+        'data': {
+            'ids': [str(pk) for pk in ids],
+        }
+    })
 
 
 # Enquiry signals
@@ -167,6 +205,50 @@ def document_deleted(sender, instance, **kwargs):
     broadcast_event('document', 'deleted', instance, company_id=instance.company_id)
 
 
+# Document blob reference counts (content-addressed storage)
+@receiver(pre_save, sender=Document)
+def document_remember_blob(sender, instance, **kwargs):
+    """Remember which blob the row pointed at before this save"""
+    if instance._state.adding:
+        instance._previous_blob_id = None
+    else:
+        instance._previous_blob_id = Document.objects.filter(pk=instance.pk).values_list('blob_id', flat=True).first()
+
+
+@receiver(post_save, sender=Document)
+def document_count_blob_reference(sender, instance, **kwargs):
+    """Point the document at its blob and move the reference counts if it changed"""
+    content_hash = hash_from_name(instance.file.name if instance.file else None)
+    previous = getattr(instance, '_previous_blob_id', None)
+
+    with transaction.atomic():
+        if content_hash:
+            # Locked so gc_document_blobs can't collect the blob before the count goes up
+            if not StoredBlob.objects.select_for_update().filter(pk=content_hash).exists():
+                try:
+                    size = instance.file.storage.size(instance.file.name)
+                except FileNotFoundError:
+                    size = 0
+                StoredBlob.objects.get_or_create(sha256=content_hash, defaults={'name': instance.file.name, 'size': size})
+
+        if content_hash == previous:
+            return
+
+        Document.objects.filter(pk=instance.pk).update(blob_id=content_hash)
+        instance.blob_id = content_hash
+        if content_hash:
+            StoredBlob.objects.filter(pk=content_hash).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+        if previous:
+            StoredBlob.objects.filter(pk=previous).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Document)
+def document_release_blob(sender, instance, **kwargs):
+    """Drop the deleted document's reference; gc_document_blobs removes the file"""
+    if instance.blob_id:
+        StoredBlob.objects.filter(pk=instance.blob_id).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
 # Task signals
 @receiver(post_save, sender=Task)
 def task_saved(sender, instance, created, **kwargs):
@@ -250,12 +332,54 @@ def chat_message_saved(sender, instance, created, **kwargs):
     action = 'created' if created else 'updated'
     broadcast_event('chat_message', action, instance, company_id=instance.company_id)
 
+@receiver(m2m_changed, sender=ChatConversation.participants.through)
+def chat_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Retire the active session key when membership changes so it gets rotated,
+    keep direct message participant hashes current and drop cached membership
+    """
+    from .chat_service import invalidate_membership, refresh_participant_hashes, retire_session_keys
+    
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_membership([instance.pk])
+            retire_session_keys([instance.pk])
+            refresh_participant_hashes([instance.pk])
+    elif action in ('post_add', 'post_remove') and pk_set:
+        # user.conversations.add/remove(...): pk_set holds conversation ids
+        invalidate_membership(pk_set)
+        retire_session_keys(pk_set)
+        refresh_participant_hashes(pk_set)
+    elif action == 'pre_clear':
+        conversation_ids = list(instance.conversations.values_list('id', flat=True))
+        retire_session_keys(conversation_ids)
+        instance._cleared_conversation_ids = conversation_ids
+    elif action == 'post_clear':
+        conversation_ids = getattr(instance, '_cleared_conversation_ids', [])
+        invalidate_membership(conversation_ids)
+        refresh_participant_hashes(conversation_ids)
+
+@receiver(post_delete, sender=ChatConversation)
+def chat_conversation_deleted(sender, instance, **kwargs):
+    from .chat_service import invalidate_membership
+    invalidate_membership([instance.pk])
+
 @receiver(post_save, sender=GroupChat)
 def group_chat_saved(sender, instance, created, **kwargs):
     action = 'created' if created else 'updated'
     broadcast_event('group_chat', action, instance, company_id=instance.company_id)
 
 
+# Student Document custody: every new document starts its ledger
+from .models import StudentDocument
+
+@receiver(post_save, sender=StudentDocument)
+def student_document_created(sender, instance, created, **kwargs):
+    if created:
+        from .custody import open_custody
+        open_custody([instance])
+
+
 # NEW: Physical Document Transfer Signals
 from .models import PhysicalDocumentTransfer, TransferTimeline, DocumentTransfer
 
@@ -347,3 +471,32 @@ def template_saved(sender, instance, created, **kwargs):
 # NEW: Refund (Assuming Refund model exists based on earlier grep, adding import if model exists, else skip)
 # from .models import Refund # Wait, I didn't see Refund in file view range. Skipping to avoid error.
 
+
+
+# Student fee ledger: every charge, payment and refund posts its entry (see core.ledger)
+from .models import LedgerEntry, Refund
+
+@receiver(post_save, sender=Registration)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Refund)
+def ledger_source_saved(sender, instance, **kwargs):
+    from .ledger import post_entry
+    post_entry(instance)
+
+@receiver(pre_delete, sender=Enrollment)
+@receiver(pre_delete, sender=Payment)
+@receiver(pre_delete, sender=Refund)
+def ledger_source_deleting(sender, instance, **kwargs):
+    """Remember whose balance the row's entries counted towards"""
+    instance._ledger_registration_ids = list(instance.ledger_entries.values_list('registration_id', flat=True))
+
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Refund)
+def ledger_source_deleted(sender, instance, **kwargs):
+    from .ledger import refresh_balances
+    if sender is Enrollment:
+        # Payment entries only lose their enrollment link; the enrollment's own charge goes
+        LedgerEntry.objects.filter(source_key=f'enrollment:{instance.pk}').delete()
+    refresh_balances(getattr(instance, '_ledger_registration_ids', []), create=False)
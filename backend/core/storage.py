@@ -0,0 +1,143 @@
+"""
+Content-addressed storage for document files
+
+Each unique file is stored once as blobs/<aa>/<bb>/<sha256><ext> under
+MEDIA_ROOT. The hash is computed while the upload streams in (see the
+upload handlers below), so saving a file that already exists only costs a
+directory lookup. StoredBlob rows count the Documents referencing each blob;
+unreferenced blobs are removed by the gc_document_blobs command. Reusing a
+blob and collecting it both happen under a lock on its StoredBlob row, so a
+save never hands out a file the collector is about to delete.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+class HashingUploadHandlerMixin:
+    """Compute the sha256 of an uploaded file as its chunks arrive"""
+
+    def new_file(self, *args, **kwargs):
+        self.content_hash = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.content_hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is not None:
+            uploaded.content_hash = self.content_hash.hexdigest()
+        return uploaded
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def blob_name(content_hash, ext=''):
+    return f'{BLOB_PREFIX}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext}'
+
+
+def hash_from_name(name):
+    """sha256 of a blob from its storage name, or None if the name isn't a blob"""
+    if not name or not name.startswith(f'{BLOB_PREFIX}/'):
+        return None
+    # Derived files (e.g. <hash>.thumb.jpg) belong to the same blob
+    return os.path.basename(name).split('.')[0]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by content hash and stores each once"""
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the final name from the content; nothing can collide
+        return name
+
+    def find_blob(self, content_hash):
+        """Existing name of a blob (whatever extension it was first stored with)"""
+        directory = os.path.dirname(blob_name(content_hash))
+        try:
+            entries = os.listdir(self.path(directory))
+        except FileNotFoundError:
+            return None
+        for entry in entries:
+            if os.path.splitext(entry)[0] == content_hash:
+                return f'{directory}/{entry}'
+        return None
+
+    def reuse_blob(self, content_hash, name):
+        """
+        Claim an existing blob for a new reference: restart its GC grace
+        period under the StoredBlob row lock (gc_document_blobs takes the same
+        lock before deleting) and confirm the file is still there.
+        """
+        from .models import StoredBlob
+
+        with transaction.atomic():
+            StoredBlob.objects.select_for_update().filter(pk=content_hash).update(updated_at=timezone.now())
+            if not self.exists(name):
+                return False
+            # A file without a row yet is only protected from the orphan sweep by its age
+            os.utime(self.path(name))
+        return True
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()[:10]
+        content_hash = getattr(content, 'content_hash', None)
+
+        if content_hash:
+            existing = self.find_blob(content_hash)
+            if existing and self.reuse_blob(content_hash, existing):
+                return existing
+
+        temp_dir = self.path(f'{BLOB_PREFIX}/tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+
+        if hasattr(content, 'temporary_file_path') and content_hash:
+            # Already on disk and hashed: move it into place without copying
+            temp_path = os.path.join(temp_dir, os.path.basename(content.temporary_file_path()))
+            file_move_safe(content.temporary_file_path(), temp_path)
+        else:
+            digest = hashlib.sha256()
+            fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    out.write(chunk)
+            content_hash = digest.hexdigest()
+
+            existing = self.find_blob(content_hash)
+            if existing and self.reuse_blob(content_hash, existing):
+                os.remove(temp_path)
+                return existing
+
+        final_name = blob_name(content_hash, ext)
+        final_path = self.path(final_name)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(final_path, self.file_permissions_mode)
+        return final_name
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_document_storage():
+    return content_addressed_storage
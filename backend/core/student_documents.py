@@ -0,0 +1,102 @@
+"""
+Student documents - writes of a registration's physical document list
+
+The registration forms send the whole list back on every save. Rows are
+matched by id (or, for clients that don't send ids, by name and number) so
+only the rows that actually changed are written; untouched rows keep their
+received_at, holder, custody ledger and transfer links.
+"""
+from django.utils import timezone
+
+from .custody import move_custody, open_custody
+from .models import StudentDocument
+
+EDITABLE_FIELDS = ('name', 'document_number', 'remarks', 'status')
+STATUSES = ('Held', 'Returned')
+
+
+def build_student_document(registration, item, user):
+    return StudentDocument(
+        registration=registration,
+        name=item.get('name'),
+        document_number=item.get('document_number') or '',
+        status=item.get('status') if item.get('status') in STATUSES else 'Held',
+        remarks=item.get('remarks') or '',
+        company_id=registration.company_id,
+        created_by=user
+    )
+
+
+def create_student_documents(registration, items, user):
+    """bulk_create the named items and open their custody ledger"""
+    documents = StudentDocument.objects.bulk_create([
+        build_student_document(registration, item, user)
+        for item in items if item.get('name')
+    ])
+    open_custody(documents)
+    return documents
+
+
+def sync_student_documents(registration, items, user):
+    """
+    Make the registration's documents match `items` with the fewest writes.
+    Must run inside a transaction. Returns (created, updated, deleted) counts.
+    """
+    existing = {
+        str(document.id): document
+        for document in StudentDocument.objects.select_for_update().filter(registration=registration)
+    }
+    by_key = {}
+    for document in existing.values():
+        by_key.setdefault((document.name, document.document_number), []).append(document)
+
+    now = timezone.now()
+    claimed = set()
+    new_items = []
+    changed = []
+    returned = []
+    reopened = []
+
+    for item in items:
+        if not item.get('name'):
+            continue
+        document = existing.get(str(item.get('id') or ''))
+        if document is None and not item.get('id'):
+            candidates = by_key.get((item.get('name'), item.get('document_number') or ''), [])
+            document = next((candidate for candidate in candidates if str(candidate.id) not in claimed), None)
+        if document is None or str(document.id) in claimed:
+            new_items.append(item)
+            continue
+        claimed.add(str(document.id))
+
+        dirty = False
+        for field in EDITABLE_FIELDS:
+            if field not in item:
+                continue
+            value = item[field] or ''
+            if field == 'status' and value not in STATUSES:
+                continue
+            if getattr(document, field) != value:
+                if field == 'status':
+                    (returned if value == 'Returned' else reopened).append(document)
+                    document.returned_at = now if value == 'Returned' else None
+                setattr(document, field, value)
+                dirty = True
+        if dirty:
+            changed.append(document)
+
+    removed = [pk for pk in existing if pk not in claimed]
+    if removed:
+        StudentDocument.objects.filter(id__in=removed).delete()
+    if changed:
+        StudentDocument.objects.bulk_update(changed, [*EDITABLE_FIELDS, 'returned_at'])
+    if returned:
+        move_custody([document.id for document in returned], None, 'Returned', registration.company_id, at=now)
+    reopened_by_holder = {}
+    for document in reopened:
+        reopened_by_holder.setdefault(document.current_holder or user, []).append(document.id)
+    for holder, document_ids in reopened_by_holder.items():
+        move_custody(document_ids, holder, 'Received', registration.company_id, at=now)
+    created = create_student_documents(registration, new_items, user)
+
+    return len(created), len(changed), len(removed)
@@ -0,0 +1,111 @@
+"""
+Document thumbnails
+
+Small JPEG previews of images and of the first page of PDFs are rendered
+in a local thread pool once the upload has committed, and stored next to
+the original as <name>.thumb.jpg. Content-addressed files share their
+thumbnail, so a duplicate upload is only rendered once.
+
+Images need Pillow; PDFs additionally need poppler's pdftoppm on PATH.
+Without them documents simply have no thumbnail.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Document
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SUFFIX = '.thumb.jpg'
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+
+
+def thumbnail_name(name):
+    return f'{os.path.splitext(name)[0]}{THUMBNAIL_SUFFIX}'
+
+
+def can_render(name):
+    if Image is None or not name:
+        return False
+    ext = os.path.splitext(name)[1].lower()
+    return ext in IMAGE_EXTENSIONS or (ext == '.pdf' and shutil.which('pdftoppm') is not None)
+
+
+def open_first_page(path):
+    """First page of a PDF as a PIL image, rendered at roughly thumbnail size"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output = os.path.join(temp_dir, 'page')
+        subprocess.run(
+            ['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile',
+             '-scale-to', str(settings.THUMBNAIL_SIZE * 2), path, output],
+            check=True, capture_output=True, timeout=30
+        )
+        with Image.open(f'{output}.png') as page:
+            page.load()
+            return page.copy()
+
+
+def render_thumbnail(source_path, target_path):
+    if source_path.lower().endswith('.pdf'):
+        image = open_first_page(source_path)
+    else:
+        with Image.open(source_path) as original:
+            original.draft('RGB', (settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE))
+            image = ImageOps.exif_transpose(original)
+            image.load()
+
+    image.thumbnail((settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE))
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+        image = background
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, 'JPEG', quality=75, optimize=True)
+        os.replace(temp_path, target_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def generate_thumbnail(document_id):
+    """Render (or reuse) the thumbnail of one document and store it on the row"""
+    try:
+        document = Document.objects.filter(pk=document_id).first()
+        if document is None or not document.file or not can_render(document.file.name):
+            return
+
+        storage = document.file.storage
+        name = thumbnail_name(document.file.name)
+        if not storage.exists(name):
+            render_thumbnail(storage.path(document.file.name), storage.path(name))
+
+        if document.thumbnail.name != name:
+            document.thumbnail.name = name
+            document.save(update_fields=['thumbnail'])
+    except Exception:
+        logger.exception('Thumbnail generation failed for document %s', document_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnail(document):
+    """Render the document's thumbnail in the background after the transaction commits"""
+    if document.file and can_render(document.file.name):
+        transaction.on_commit(lambda: executor.submit(generate_thumbnail, document.pk))
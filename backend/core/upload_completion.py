@@ -0,0 +1,104 @@
+"""
+Upload completion
+
+Assembling a finished upload (up to UPLOAD_MAX_SIZE) and hashing it takes
+far longer than a request may run, so the complete endpoint only claims the
+session and hands it to this local thread pool once the claim has committed.
+The worker creates the Document or chat message and stores it on the session
+as `result`; on failure the session goes back to PENDING with an `error`, and
+the client polls GET /api/uploads/<id>/ for either.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .chat_service import broadcast_to_conversation, create_chat_message, is_member, message_payload
+from .models import ChatConversation, Document, UploadSession
+from .serializers import DocumentSerializer
+from .thumbnails import schedule_thumbnail
+from .upload_service import UploadError, assemble, finish, release
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.UPLOAD_WORKERS, thread_name_prefix='uploads')
+
+
+def complete_document(session):
+    user = session.uploaded_by
+    serializer = DocumentSerializer(data={'file_name': session.file_name, **session.params})
+    if not serializer.is_valid():
+        raise UploadError('Document fields are no longer valid')
+
+    name = assemble(session, 'documents/', Document._meta.get_field('file').storage)
+    document = serializer.save(
+        file=name,
+        uploaded_by=user,
+        current_holder=user,
+        company_id=user.company_id
+    )
+    finish(session, DocumentSerializer(document).data)
+    schedule_thumbnail(document)
+
+
+def complete_chat(session):
+    user = session.uploaded_by
+    conversation_id = session.params.get('conversation_id')
+    conversation = ChatConversation.objects.filter(id=conversation_id).first()
+    if conversation is None or not is_member(conversation.id, user):
+        raise UploadError('Conversation not found')
+
+    name = assemble(session, 'chat_attachments/')
+    content = session.params.get('content', '')
+    message, created = create_chat_message(
+        conversation,
+        user,
+        content,
+        client_id=session.params.get('client_id', ''),
+        extra_fields={
+            'attachment': name,
+            'attachment_name': session.file_name,
+            'attachment_size': session.total_size,
+            'attachment_content_type': session.content_type,
+        }
+    )
+    if not created:
+        # Retried completion - the stored message already has its own copy
+        default_storage.delete(name)
+
+    payload = message_payload(message, content)
+    finish(session, payload)
+    if created:
+        broadcast_to_conversation(conversation.id, {
+            'type': 'chat_message',
+            'message': payload
+        })
+
+
+def complete_session(session_id):
+    """Assemble a claimed session and attach the file, or release it with the reason"""
+    try:
+        session = UploadSession.objects.select_related('uploaded_by').filter(
+            pk=session_id, status='ASSEMBLING'
+        ).first()
+        if session is None:
+            return
+        try:
+            if session.purpose == 'document':
+                complete_document(session)
+            else:
+                complete_chat(session)
+        except UploadError as e:
+            release(session, str(e))
+        except Exception:
+            logger.exception('Completing upload %s failed', session_id)
+            release(session, 'Upload could not be completed')
+    finally:
+        close_old_connections()
+
+
+def schedule_completion(session):
+    """Complete a claimed session in the background after the transaction commits"""
+    transaction.on_commit(lambda: executor.submit(complete_session, session.pk))
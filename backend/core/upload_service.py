@@ -0,0 +1,198 @@
+"""
+Upload Service - resumable chunked uploads
+
+Chunks are written straight from the request stream to
+MEDIA_ROOT/uploads/<session id>/<index>.part with a sha256 check each, and
+are assembled into their final location in one streamed pass on completion.
+"""
+import hashlib
+import os
+import shutil
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """Raised when a chunk or upload fails validation"""
+
+
+def upload_dir(session):
+    return Path(settings.MEDIA_ROOT) / 'uploads' / str(session.id)
+
+
+def chunk_path(session, index):
+    return upload_dir(session) / f'{index}.part'
+
+
+def expected_chunk_size(session, index):
+    if index < session.total_chunks - 1:
+        return session.chunk_size
+    return session.total_size - session.chunk_size * (session.total_chunks - 1)
+
+
+def store_chunk(session, index, stream, checksum):
+    """
+    Stream one chunk to disk, verifying its size and sha256.
+    Re-sending a chunk replaces it, so interrupted chunks can simply be retried.
+    Returns the sorted list of received chunk indexes.
+    """
+    if index < 0 or index >= session.total_chunks:
+        raise UploadError(f'Chunk index must be between 0 and {session.total_chunks - 1}')
+    if not checksum:
+        raise UploadError('X-Chunk-SHA256 header is required')
+
+    expected_size = expected_chunk_size(session, index)
+    path = chunk_path(session, index)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix('.tmp')
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, 'wb') as out:
+            while True:
+                block = stream.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > expected_size:
+                    raise UploadError(f'Chunk {index} is larger than {expected_size} bytes')
+                digest.update(block)
+                out.write(block)
+
+        if size != expected_size:
+            raise UploadError(f'Chunk {index} has {size} bytes, expected {expected_size}')
+        if digest.hexdigest() != checksum.lower():
+            raise UploadError(f'Checksum mismatch for chunk {index}')
+    except Exception:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(temp_path, path)
+
+    with transaction.atomic():
+        locked = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if index not in locked.received_chunks:
+            locked.received_chunks = sorted(locked.received_chunks + [index])
+            locked.save(update_fields=['received_chunks', 'updated_at'])
+    return locked.received_chunks
+
+
+def missing_chunks(session):
+    received = set(session.received_chunks)
+    return [index for index in range(session.total_chunks) if index not in received]
+
+
+class AssembledFile(File):
+    """Assembled upload on local disk; storages can move it instead of copying"""
+
+    def __init__(self, path, content_hash):
+        super().__init__(open(path, 'rb'), name=os.path.basename(path))
+        self.path = path
+        self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def assemble(session, upload_to, storage=default_storage):
+    """
+    Concatenate the chunks into one file and hand it to storage under upload_to.
+    Returns the storage name to assign to a FileField.
+    """
+    if missing_chunks(session):
+        raise UploadError('Upload is incomplete')
+
+    assembled_path = upload_dir(session) / 'assembled'
+    digest = hashlib.sha256()
+    with open(assembled_path, 'wb') as out:
+        for index in range(session.total_chunks):
+            with open(chunk_path(session, index), 'rb') as chunk:
+                while True:
+                    block = chunk.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+                    out.write(block)
+
+    if session.checksum and digest.hexdigest() != session.checksum.lower():
+        assembled_path.unlink(missing_ok=True)
+        raise UploadError('Checksum mismatch for assembled file')
+
+    assembled = AssembledFile(assembled_path, digest.hexdigest())
+    try:
+        return storage.save(os.path.join(upload_to, session.file_name), assembled)
+    finally:
+        assembled.close()
+
+
+def claim(session, params=None):
+    """
+    Move a PENDING session to ASSEMBLING, recording the completion params.
+    Only one concurrent caller gets True; the others must leave the session
+    (and its chunks) alone.
+    """
+    params = params or {}
+    claimed = UploadSession.objects.filter(pk=session.pk, status='PENDING').update(
+        status='ASSEMBLING',
+        params=params,
+        error='',
+        updated_at=timezone.now()
+    )
+    if claimed:
+        session.status = 'ASSEMBLING'
+        session.params = params
+        session.error = ''
+    return bool(claimed)
+
+
+def release(session, error=''):
+    """Hand a claimed session back so the client can resend chunks and retry"""
+    error = error[:255]
+    UploadSession.objects.filter(pk=session.pk, status='ASSEMBLING').update(
+        status='PENDING',
+        error=error,
+        updated_at=timezone.now()
+    )
+    session.status = 'PENDING'
+    session.error = error
+
+
+def finish(session, result):
+    """Mark a claimed session complete with what it created, and drop its chunks"""
+    session.status = 'COMPLETE'
+    session.result = result
+    session.error = ''
+    session.save(update_fields=['status', 'result', 'error', 'updated_at'])
+    discard(session)
+
+
+def discard(session):
+    """Remove a session's chunk directory"""
+    shutil.rmtree(upload_dir(session), ignore_errors=True)
+
+
+def purge_expired_sessions(hours=None):
+    """Delete unfinished sessions (and their chunks) idle for longer than the TTL"""
+    hours = settings.UPLOAD_SESSION_TTL_HOURS if hours is None else hours
+    # An ASSEMBLING session this old belongs to a completion that died midway
+    expired = UploadSession.objects.filter(
+        status__in=('PENDING', 'ASSEMBLING'),
+        updated_at__lt=timezone.now() - timedelta(hours=hours)
+    )
+    count = 0
+    for session in expired:
+        discard(session)
+        session.delete()
+        count += 1
+    return count
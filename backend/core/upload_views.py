@@ -0,0 +1,177 @@
+"""
+Upload Views - resumable chunked uploads for documents and chat attachments
+
+Flow:
+    POST   /api/uploads/                      start a session
+    PUT    /api/uploads/<id>/chunks/<index>/  send one chunk (raw body, X-Chunk-SHA256 header)
+    GET    /api/uploads/<id>/                 which chunks arrived (to resume), or the completion result
+    POST   /api/uploads/<id>/complete/        queue assembly and creating the Document / chat message
+    DELETE /api/uploads/<id>/                 cancel
+"""
+import io
+import os
+
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .chat_service import is_member, parse_uuids
+from .models import ChatConversation, UploadSession
+from .serializers import DocumentSerializer
+from .upload_completion import schedule_completion
+from .upload_service import UploadError, claim, discard, missing_chunks, store_chunk
+
+
+def session_status(session):
+    return {
+        'id': str(session.id),
+        'purpose': session.purpose,
+        'file_name': session.file_name,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': session.total_chunks,
+        'received_chunks': session.received_chunks,
+        'missing_chunks': missing_chunks(session),
+        'status': session.status,
+        'error': session.error or None,
+        'result': session.result,
+    }
+
+
+def get_own_session(request, upload_id):
+    return get_object_or_404(UploadSession, id=upload_id, uploaded_by=request.user)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload(request):
+    """Start a chunked upload"""
+    purpose = request.data.get('purpose', 'document')
+    file_name = os.path.basename(str(request.data.get('file_name') or ''))[:255]
+
+    try:
+        total_size = int(request.data.get('total_size'))
+    except (TypeError, ValueError):
+        total_size = -1
+
+    if purpose not in dict(UploadSession.PURPOSE_CHOICES):
+        return Response({'error': 'purpose must be document or chat'}, status=status.HTTP_400_BAD_REQUEST)
+    if not file_name:
+        return Response({'error': 'file_name is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if total_size < 0 or total_size > settings.UPLOAD_MAX_SIZE:
+        return Response(
+            {'error': f'total_size must be between 0 and {settings.UPLOAD_MAX_SIZE} bytes'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    session = UploadSession.objects.create(
+        uploaded_by=request.user,
+        purpose=purpose,
+        file_name=file_name,
+        content_type=str(request.data.get('content_type') or '')[:100],
+        total_size=total_size,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        checksum=str(request.data.get('checksum') or '')[:64],
+        company_id=request.user.company_id
+    )
+    return Response(session_status(session), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, upload_id):
+    """Report upload progress, or cancel the upload"""
+    session = get_own_session(request, upload_id)
+
+    if request.method == 'DELETE':
+        if session.status == 'ASSEMBLING':
+            return busy_response(session)
+        discard(session)
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    return Response(session_status(session))
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id, index):
+    """Store one chunk; the raw request body is streamed to disk"""
+    session = get_own_session(request, upload_id)
+    if session.status != 'PENDING':
+        return busy_response(session)
+
+    try:
+        # An empty body has no stream
+        stream = request.stream or io.BytesIO()
+        received = store_chunk(session, index, stream, request.headers.get('X-Chunk-SHA256', ''))
+    except UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'index': index,
+        'received_chunks': received,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_upload(request, upload_id):
+    """
+    Queue the chunks for assembly and attaching the file; answers 202 right away.
+    document: accepts the usual Document fields (type, description, student_name, registration, expiry_date)
+    chat: requires conversation_id; content is an optional caption, client_id makes retries safe
+    Poll GET /api/uploads/<id>/ until status is COMPLETE (result holds the Document
+    or message) or back to PENDING (error says why).
+    Concurrent completes of one session: the first claims it, the others get a 409.
+    """
+    session = get_own_session(request, upload_id)
+    user = request.user
+    if session.status != 'PENDING':
+        return busy_response(session)
+
+    if session.purpose == 'document':
+        params = {key: value for key, value in request.data.items() if key != 'file'}
+        serializer = DocumentSerializer(data={'file_name': session.file_name, **params})
+        serializer.is_valid(raise_exception=True)
+    else:
+        conversation_ids = parse_uuids([request.data.get('conversation_id')])
+        if not conversation_ids or not is_member(conversation_ids[0], user):
+            raise Http404
+        get_object_or_404(ChatConversation, id=conversation_ids[0])
+        params = {
+            'conversation_id': str(conversation_ids[0]),
+            'content': str(request.data.get('content') or ''),
+            'client_id': str(request.data.get('client_id') or '')[:64],
+        }
+
+    if missing_chunks(session):
+        return incomplete_response(session)
+    if not claim(session, params):
+        return busy_response(session)
+    schedule_completion(session)
+    return Response(session_status(session), status=status.HTTP_202_ACCEPTED)
+
+
+def busy_response(session):
+    """409 for a session another request has completed or is completing"""
+    try:
+        session.refresh_from_db(fields=['status'])
+    except UploadSession.DoesNotExist:
+        raise Http404
+    if session.status == 'COMPLETE':
+        error = 'Upload is already complete'
+    else:
+        error = 'Upload is being completed by another request'
+    return Response({'error': error, 'status': session.status}, status=status.HTTP_409_CONFLICT)
+
+
+def incomplete_response(session):
+    return Response(
+        {'error': 'Upload is incomplete', 'missing_chunks': missing_chunks(session)},
+        status=status.HTTP_400_BAD_REQUEST
+    )
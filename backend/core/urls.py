@@ -10,10 +10,11 @@ from .views import (
     AgentViewSet, ChatConversationViewSet, ChatMessageViewSet,
     GroupChatViewSet, SignupRequestViewSet, ApprovalRequestViewSet,
     CompanyViewSet, FollowUpCommentViewSet, DashboardViewSet, StudentRemarkViewSet,
-    PhysicalDocumentTransferViewSet
+    PhysicalDocumentTransferViewSet, ReceivablesViewSet
 )
 from .earnings_view import EarningsRevenueView
 from . import chat_views
+from . import upload_views
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -34,6 +35,7 @@ router.register(r'templates', TemplateViewSet)
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'commissions', CommissionViewSet)
 router.register(r'refunds', RefundViewSet)
+router.register(r'receivables', ReceivablesViewSet)
 router.register(r'lead-sources', LeadSourceViewSet)
 router.register(r'visa-tracking', VisaTrackingViewSet)
 router.register(r'follow-ups', FollowUpViewSet)
@@ -56,8 +58,15 @@ urlpatterns = [
     
     # Chat API endpoints
     path('chat/conversations/', chat_views.get_conversations, name='chat-conversations'),
-    path('chat/conversations/<int:conversation_id>/messages/', chat_views.get_messages, name='chat-messages'),
+    path('chat/conversations/<uuid:conversation_id>/messages/', chat_views.get_messages, name='chat-messages'),
+    path('chat/conversations/<uuid:conversation_id>/search/', chat_views.search_messages, name='chat-search'),
     path('chat/send/', chat_views.send_message, name='chat-send'),
     path('chat/create/', chat_views.create_conversation, name='chat-create'),
-    path('chat/messages/<int:message_id>/read/', chat_views.mark_as_read, name='chat-mark-read'),
+    path('chat/messages/<uuid:message_id>/read/', chat_views.mark_as_read, name='chat-mark-read'),
+    
+    # Chunked Uploads
+    path('uploads/', upload_views.create_upload, name='upload-create'),
+    path('uploads/<uuid:upload_id>/', upload_views.upload_detail, name='upload-detail'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', upload_views.upload_chunk, name='upload-chunk'),
+    path('uploads/<uuid:upload_id>/complete/', upload_views.complete_upload, name='upload-complete'),
 ]
@@ -4,17 +4,20 @@ from .models import (
     Document, StudentDocument, DocumentTransfer, Task, Appointment, University, Template,
     Notification, Commission, LeadSource, VisaTracking, FollowUp, FollowUpComment,
     Agent, ChatConversation, ChatMessage, GroupChat, SignupRequest, ApprovalRequest, Company,
-    ActivityLog, Earning, StudentRemark, PhysicalDocumentTransfer, TransferTimeline
+    ActivityLog, Earning, StudentRemark, PhysicalDocumentTransfer, TransferTimeline,
+    LedgerEntry, StudentBalance
 )
 
 from .serializers import (
-    UserSerializer, CompanySerializer, EnquirySerializer, RegistrationSerializer, EnrollmentSerializer,
+    UserSerializer, CompanySerializer, EnquirySerializer, RegistrationSerializer, RegistrationListSerializer,
+    EnrollmentSerializer,
     InstallmentSerializer, PaymentSerializer, RefundSerializer, DocumentSerializer, StudentDocumentSerializer,
     DocumentTransferSerializer, TaskSerializer, AppointmentSerializer, UniversitySerializer,
     TemplateSerializer, NotificationSerializer, CommissionSerializer, LeadSourceSerializer,
     VisaTrackingSerializer, FollowUpSerializer, FollowUpCommentSerializer, AgentSerializer, ChatConversationSerializer,
     ChatMessageSerializer, GroupChatSerializer, SignupRequestSerializer, ApprovalRequestSerializer,
-    CompanySerializer, StudentRemarkSerializer, PhysicalDocumentTransferSerializer
+    CompanySerializer, StudentRemarkSerializer, PhysicalDocumentTransferSerializer,
+    StudentDocumentCustodySerializer, LedgerEntrySerializer, StudentBalanceSerializer
 )
 
 from rest_framework.decorators import action
@@ -23,9 +26,32 @@ from rest_framework.permissions import IsAuthenticated
 from django.db.models import Count, Sum, Avg, Q
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.db.models.functions import Concat
+from django.db.models.functions import Coalesce, Concat
 from django.db.models import Count, Sum, Avg, Q, F, Value
+from django.db.models import DecimalField, IntegerField, OuterRef, Prefetch, Subquery
 from django.db import transaction
+import csv
+from decimal import Decimal, InvalidOperation
+import functools
+import io
+import os
+import uuid
+
+from django.utils.dateparse import parse_datetime
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .chat_service import parse_uuids
+from .conversions import ConversionError, convert_enquiries, convert_enquiry, register
+from .document_expiry import expiring_documents
+from .enquiry_duplicates import find_duplicates
+from .installments import aged_receivables
+from .downloads import protected_file_response
+from .student_documents import create_student_documents, sync_student_documents
+from .zip_stream import stream_zip, unique_arcname
+from .thumbnails import schedule_thumbnail
+from .custody import current_inventory, holdings_at, move_custody, record_transfer_custody
+from .signals import broadcast_bulk_event
 
 class CompanyIsolationMixin:
     """
@@ -369,8 +395,84 @@ class EnquiryViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     queryset = Enquiry.objects.all()
     serializer_class = EnquirySerializer
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # ?unique=1 hides enquiries already clustered under an earlier one
+        if self.request.query_params.get('unique') == '1':
+            queryset = queryset.filter(duplicate_of__isnull=True)
+        return queryset
+    
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user, company_id=self.request.user.company_id)
+        enquiry = serializer.save(created_by=self.request.user, company_id=self.request.user.company_id)
+        self.possible_duplicates = find_duplicates(
+            enquiry.company_id, enquiry.mobile, enquiry.email, enquiry.candidate_name, exclude_id=enquiry.id
+        )
+    
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.data['possible_duplicates'] = self.possible_duplicates
+        return response
+    
+    @action(detail=True, methods=['post'])
+    def convert(self, request, pk=None):
+        """
+        Register the enquiry's student in one transaction.
+        Expected data: any registration fields to set or override
+        (registration_fee, payment_method, needs_loan, student_documents, ...)
+        """
+        try:
+            registration = convert_enquiry(self.get_object(), request.user, request.data, self.get_serializer_context())
+        except ConversionError as e:
+            return Response({'error': e.args[0]}, status=400)
+        return Response(RegistrationSerializer(registration, context=self.get_serializer_context()).data, status=201)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_convert(self, request):
+        """
+        Convert many enquiries at once.
+        Expected data: { ids: [enquiry_id, ...], defaults: { registration fields applied to each } }
+        """
+        enquiry_ids = []
+        for value in request.data.get('ids') or []:
+            try:
+                enquiry_ids.append(uuid.UUID(str(value)))
+            except ValueError:
+                continue
+
+        if not enquiry_ids:
+            return Response({'error': 'No enquiries provided'}, status=400)
+
+        enquiries = list(self.get_queryset().filter(id__in=enquiry_ids))
+        converted, skipped = convert_enquiries(
+            enquiries, request.user, request.data.get('defaults') or {}, self.get_serializer_context()
+        )
+        visible = {enquiry.id for enquiry in enquiries}
+        return Response({
+            'converted': {str(pk): {'id': str(registration.id), 'registration_no': registration.registration_no}
+                          for pk, registration in converted.items()},
+            'skipped': {
+                **{str(pk): error for pk, error in skipped.items()},
+                **{str(pk): 'Enquiry not found' for pk in enquiry_ids if pk not in visible},
+            },
+        })
+    
+    @action(detail=False, methods=['get'])
+    def duplicates(self, request):
+        """Likely existing enquiries for ?mobile=&email=&candidate_name= (checked while the form is filled)"""
+        params = request.query_params
+        exclude_id = None
+        if params.get('exclude'):
+            exclude_ids = parse_uuids([params['exclude']])
+            if not exclude_ids:
+                return Response({'error': 'exclude must be an enquiry id'}, status=400)
+            exclude_id = exclude_ids[0]
+        return Response(find_duplicates(
+            request.user.company_id,
+            params.get('mobile', ''),
+            params.get('email', ''),
+            params.get('candidate_name', ''),
+            exclude_id=exclude_id
+        ))
     
     def update(self, request, *args, **kwargs):
         # Check if user is an employee
@@ -386,34 +488,33 @@ class RegistrationViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     queryset = Registration.objects.all().order_by('-created_at')
     serializer_class = RegistrationSerializer
     
-    def perform_create(self, serializer):
-        # Save registration with company_id and created_by
-        instance = serializer.save(company_id=self.request.user.company_id, created_by=self.request.user)
-        
-        # Auto-create payment
-        if instance.registration_fee > 0:
-            Payment.objects.create(
-                student_name=instance.student_name,
-                amount=instance.registration_fee,
-                type='Registration',
-                status='Success',
-                method='Cash', # Default
-                company_id=instance.company_id
+    def wants_summary(self):
+        # Lists are summaries; the nested documents come from retrieve
+        return self.action == 'list'
+    
+    def get_serializer_class(self):
+        if self.wants_summary():
+            return RegistrationListSerializer
+        return super().get_serializer_class()
+    
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('created_by')
+        if self.wants_summary():
+            return queryset.annotate(
+                documents_count=count_subquery(Document.objects.filter(registration=OuterRef('pk')), 'registration'),
+                student_documents_count=count_subquery(StudentDocument.objects.filter(registration=OuterRef('pk')), 'registration'),
+                documents_held=count_subquery(StudentDocument.objects.filter(registration=OuterRef('pk'), status='Held'), 'registration'),
+                documents_returned=count_subquery(StudentDocument.objects.filter(registration=OuterRef('pk'), status='Returned'), 'registration'),
             )
-        
-        # Handle Student Documents
-        student_documents = self.request.data.get('student_documents', [])
-        if student_documents:
-            for doc in student_documents:
-                StudentDocument.objects.create(
-                    registration=instance,
-                    name=doc.get('name'),
-                    document_number=doc.get('document_number', ''),
-                    status='Held',
-                    remarks=doc.get('remarks', ''),
-                    company_id=instance.company_id,
-                    created_by=self.request.user
-                )
+        return queryset.prefetch_related(
+            Prefetch('documents', queryset=Document.objects.select_related('uploaded_by', 'current_holder', 'registration')),
+            Prefetch('student_documents', queryset=StudentDocument.objects.select_related('created_by', 'current_holder')),
+        )
+    
+    def perform_create(self, serializer):
+        # The registration and everything created alongside it commit (and broadcast) together
+        with transaction.atomic():
+            register(serializer, self.request.user, self.request.data.get('student_documents'))
     
     def update(self, request, *args, **kwargs):
         # Check if user is an employee
@@ -422,53 +523,124 @@ class RegistrationViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
                 'error': 'Employees cannot edit directly. Please submit an approval request instead.'
             }, status=403)
         
-        # Perform the standard update
-        response = super().update(request, *args, **kwargs)
-        
-        # Handle student_documents update
-        instance = self.get_object()
-        student_documents = request.data.get('student_documents', None)
-        
-        if student_documents is not None:
-            # Clear existing student documents and create new ones
-            StudentDocument.objects.filter(registration=instance).delete()
+        with transaction.atomic():
+            # Perform the standard update
+            response = super().update(request, *args, **kwargs)
             
-            for doc in student_documents:
-                if doc.get('name'):  # Only create if name is provided
-                    StudentDocument.objects.create(
-                        registration=instance,
-                        name=doc.get('name'),
-                        document_number=doc.get('document_number', ''),
-                        status=doc.get('status', 'Held'),
-                        remarks=doc.get('remarks', ''),
-                        company_id=instance.company_id,
-                        created_by=request.user
-                    )
+            # Handle student_documents update: only rows that changed are written
+            student_documents = request.data.get('student_documents', None)
+            if student_documents is not None:
+                sync_student_documents(self.get_object(), student_documents, request.user)
+                # Fresh fetch: the prefetched documents above are now stale
+                response.data = self.get_serializer(self.get_object()).data
         
         return response
 
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Fee statement: the balance snapshot and every ledger entry with the running balance"""
+        registration = self.get_object()
+        balance = StudentBalance.objects.filter(registration=registration).first() or StudentBalance(
+            registration=registration, company_id=registration.company_id
+        )
+
+        running = 0
+        entries = []
+        for entry in LedgerEntry.objects.filter(registration=registration).order_by('occurred_at', 'created_at'):
+            running += entry.amount
+            entries.append({**LedgerEntrySerializer(entry).data, 'running_balance': running})
+
+        return Response({
+            **StudentBalanceSerializer(balance).data,
+            'entries': entries,
+        })
+
+    @action(detail=True, methods=['get'])
+    def document_bundle(self, request, pk=None):
+        """
+        Stream a ZIP of every file attached to the registration.
+        ?manifest=1 adds manifest.csv listing the physical documents (StudentDocument) held.
+        """
+        registration = self.get_object()
+        entries = bundle_entries(registration, include_manifest=request.query_params.get('manifest') == '1')
+
+        response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition_header(
+            True, f'{registration.registration_no or registration.student_name}_documents.zip'
+        )
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def count_subquery(queryset, outer_field):
+    """Correlated COUNT of queryset rows per outer_field (filtered on OuterRef), 0 when none"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(outer_field).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def zip_date_time(value):
+    # ZIP timestamps cannot predate 1980
+    return max(timezone.localtime(value).timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def bundle_entries(registration, include_manifest=False):
+    """(arcname, open_file, size, date_time, compress) for stream_zip; queries run up front"""
+    used_names = set()
+    entries = []
+    for document in registration.documents.exclude(file='').exclude(file__isnull=True).order_by('uploaded_at'):
+        storage = document.file.storage
+        if not storage.exists(document.file.name):
+            continue
+        name = os.path.basename(document.file_name or document.file.name) or 'document'
+        entries.append((
+            unique_arcname(f'{document.type}/{name}' if document.type else name, used_names),
+            functools.partial(storage.open, document.file.name, 'rb'),
+            storage.size(document.file.name),
+            zip_date_time(document.uploaded_at),
+            False  # PDFs and images are already compressed
+        ))
+
+    if include_manifest:
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        writer.writerow(['Document', 'Number', 'Status', 'Holder', 'Received', 'Returned', 'Remarks'])
+        for item in registration.student_documents.select_related('current_holder').order_by('received_at'):
+            writer.writerow([
+                item.name,
+                item.document_number,
+                item.status,
+                item.current_holder.username if item.current_holder else '',
+                timezone.localtime(item.received_at).strftime('%Y-%m-%d %H:%M'),
+                timezone.localtime(item.returned_at).strftime('%Y-%m-%d %H:%M') if item.returned_at else '',
+                item.remarks,
+            ])
+        manifest = rows.getvalue().encode('utf-8-sig')
+        entries.append((
+            unique_arcname('manifest.csv', used_names),
+            functools.partial(io.BytesIO, manifest),
+            len(manifest),
+            zip_date_time(timezone.now()),
+            True
+        ))
+
+    return entries
+
 class EnrollmentViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
     
     def perform_create(self, serializer):
-        # Save enrollment with company_id and created_by
-        instance = serializer.save(company_id=self.request.user.company_id, created_by=self.request.user)
-        
-        # Handle Student Documents (taken during enrollment)
-        student_documents = self.request.data.get('student_documents', [])
-        if student_documents:
-            from .models import StudentDocument
-            for doc in student_documents:
-                StudentDocument.objects.create(
-                    registration=instance.student, # Link to the student registration
-                    name=doc.get('name'),
-                    document_number=doc.get('document_number', ''),
-                    status='Held',
-                    remarks=doc.get('remarks', ''),
-                    company_id=instance.company_id,
-                    created_by=self.request.user
-                )
+        with transaction.atomic():
+            # Save enrollment (and its installments) with company_id and created_by
+            instance = serializer.save(company_id=self.request.user.company_id, created_by=self.request.user)
+            
+            # Handle Student Documents (taken during enrollment), linked to the student registration
+            create_student_documents(instance.student, self.request.data.get('student_documents') or [], self.request.user)
 
     def update(self, request, *args, **kwargs):
         
@@ -497,6 +669,11 @@ class InstallmentViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     queryset = Installment.objects.all()
     serializer_class = InstallmentSerializer
 
+    @action(detail=False, methods=['get'])
+    def aged_receivables(self, request):
+        """Overdue installments bucketed by days overdue (1-30, 31-60, 61-90, 90+), in total and per student"""
+        return Response(aged_receivables(self.get_queryset()))
+
 class PaymentViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
@@ -533,6 +710,27 @@ class PaymentViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
             'transactionCount': transaction_count
         })
 
+class ReceivablesViewSet(CompanyIsolationMixin, viewsets.ReadOnlyModelViewSet):
+    """Students who owe money, largest balance first, read from the StudentBalance snapshot"""
+    queryset = StudentBalance.objects.select_related('registration')
+    serializer_class = StudentBalanceSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        try:
+            min_balance = Decimal(self.request.query_params.get('min_balance') or 0)
+        except InvalidOperation:
+            min_balance = Decimal(0)
+        return queryset.filter(balance__gt=min_balance).order_by('-balance')
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        totals = self.get_queryset().aggregate(
+            students=Count('id'),
+            outstanding=Coalesce(Sum('balance'), Value(0, output_field=DecimalField())),
+        )
+        return Response(totals)
+
 class RefundViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     queryset = Refund.objects.all()
     serializer_class = RefundSerializer
@@ -551,17 +749,20 @@ class RefundViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
         user = self.request.user
         print(f"DEBUG: User Role: {user.role}, Company ID: {user.company_id}")
         # Auto-approve for Admins
+        # The refund counts against the paying student's ledger
+        registration = serializer.validated_data['payment'].registration
         if user.role in ['DEV_ADMIN', 'COMPANY_ADMIN']:
             print("DEBUG: Auto-approving refund")
             serializer.save(
                 company_id=user.company_id,
+                registration=registration,
                 status='Approved',
                 approved_by=user,
                 processed_at=timezone.now()
             )
         else:
             print("DEBUG: Creating pending refund")
-            serializer.save(company_id=user.company_id)
+            serializer.save(company_id=user.company_id, registration=registration)
     
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
@@ -591,37 +792,158 @@ class DocumentViewSet(CompanyIsolationMixin, viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
 
     def perform_create(self, serializer):
-        serializer.save(
+        document = serializer.save(
             uploaded_by=self.request.user, 
             current_holder=self.request.user,
             company_id=self.request.user.company_id
         )
+        schedule_thumbnail(document)
     
     @action(detail=False, methods=['get'])
     def expiring_soon(self, request):
-        """Get documents expiring in next 30 days"""
-        thirty_days_later = timezone.now().date() + timedelta(days=30)
-        expiring = Document.objects.filter(
-            expiry_date__lte=thirty_days_later,
-            expiry_date__gte=timezone.now().date()
-        ).order_by('expiry_date')
-        
+        """Get this company's documents expiring in the next ?days= (default 30) days"""
+        try:
+            days = max(int(request.query_params.get('days', 30)), 0)
+        except ValueError:
+            days = 30
+
+        expiring = list(expiring_documents(
+            self.get_queryset().select_related('uploaded_by', 'current_holder', 'registration'),
+            days
+        ))
         serializer = self.get_serializer(expiring, many=True)
         documents = serializer.data
-        
-        # Add days until expiry
-        for doc in documents:
-            if doc.get('expiry_date'):
-                expiry = datetime.strptime(doc['expiry_date'], '%Y-%m-%d').date()
-                days_until = (expiry - timezone.now().date()).days
-                doc['daysUntilExpiry'] = days_until
-        
+        for doc, document in zip(documents, expiring):
+            doc['daysUntilExpiry'] = document.days_left.days
+
         return Response(documents)
 
-class DocumentTransferViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the file; ?inline=1 to display it in the browser instead"""
+        document = self.get_object()
+        if not document.file:
+            return Response({'error': 'Document has no file'}, status=404)
+        return protected_file_response(
+            request,
+            document.file,
+            document.file_name or os.path.basename(document.file.name),
+            content_hash=document.blob_id,
+            as_attachment=request.query_params.get('inline') != '1'
+        )
+
+    @action(detail=True, methods=['get'])
+    def thumbnail(self, request, pk=None):
+        """The document's first-page thumbnail, shown inline"""
+        document = self.get_object()
+        if not document.thumbnail:
+            return Response({'error': 'Document has no thumbnail'}, status=404)
+        return protected_file_response(
+            request,
+            document.thumbnail,
+            os.path.basename(document.thumbnail.name),
+            as_attachment=False
+        )
+
+class TransferReceiptMixin:
+    """
+    Receiving flow shared by the digital and physical transfer viewsets.
+    Transfer rows are locked, every document changes holder in a single
+    UPDATE, and one aggregated event per entity is broadcast after commit.
+    """
+    transfer_entity = None
+    document_entity = None
+
+    def receive_transfers(self, transfer_ids, user, status, allowed_statuses):
+        """
+        Move the user's transfers to `status` and make them holder of the documents.
+        Transfers not addressed to the user or not in allowed_statuses are skipped.
+        Returns the transfers that were updated.
+        """
+        model = self.get_queryset().model
+        documents_field = model._meta.get_field('documents')
+        document_model = documents_field.related_model
+        now = timezone.now()
+
+        with transaction.atomic():
+            transfers = list(
+                model.objects.select_for_update().filter(
+                    id__in=transfer_ids,
+                    receiver=user,
+                    status__in=allowed_statuses
+                )
+            )
+            if not transfers:
+                return []
+
+            ids = [transfer.id for transfer in transfers]
+            model.objects.filter(id__in=ids).update(status=status, accepted_at=now)
+
+            document_ids = list(
+                document_model.objects.filter(
+                    **{f'{documents_field.related_query_name()}__in': ids}
+                ).values_list('id', flat=True).distinct()
+            )
+            document_model.objects.filter(id__in=document_ids).update(current_holder=user)
+
+            self.documents_received(transfers, user, now)
+
+            company_id = user.company_id
+            broadcast_bulk_event(self.transfer_entity, 'updated', ids, company_id)
+            broadcast_bulk_event(self.document_entity, 'updated', document_ids, company_id)
+
+        for transfer in transfers:
+            transfer.status = status
+            transfer.accepted_at = now
+        return transfers
+
+    def documents_received(self, transfers, user, at):
+        """Hook run inside the receiving transaction"""
+
+    @action(detail=False, methods=['post'])
+    def bulk_accept(self, request):
+        """
+        Accept many pending transfers at once.
+        Expected data: { ids: [transfer_id, ...] }
+        """
+        transfer_ids = []
+        for value in request.data.get('ids') or []:
+            try:
+                transfer_ids.append(uuid.UUID(str(value)))
+            except ValueError:
+                continue
+
+        if not transfer_ids:
+            return Response({'error': 'No transfers provided'}, status=400)
+
+        visible_ids = self.get_queryset().filter(id__in=transfer_ids).values_list('id', flat=True)
+        accepted = self.receive_transfers(visible_ids, request.user, 'Accepted', ['Pending'])
+
+        # One notification per sender rather than per transfer
+        counts = {}
+        for transfer in accepted:
+            counts[transfer.sender] = counts.get(transfer.sender, 0) + 1
+        for sender, count in counts.items():
+            Notification.objects.create(
+                user=sender,
+                title='Transfers Accepted',
+                message=f'{request.user.username} accepted {count} of your document transfers.',
+                type='success',
+                company_id=request.user.company_id
+            )
+
+        accepted_ids = {transfer.id for transfer in accepted}
+        return Response({
+            'accepted': [str(pk) for pk in accepted_ids],
+            'skipped': [str(pk) for pk in transfer_ids if pk not in accepted_ids],
+        })
+
+class DocumentTransferViewSet(TransferReceiptMixin, viewsets.ModelViewSet):
     queryset = DocumentTransfer.objects.all()
     serializer_class = DocumentTransferSerializer
     pagination_class = None  # Disable pagination for transfers
+    transfer_entity = 'digital_transfer'
+    document_entity = 'document'
 
     def get_queryset(self):
         user = self.request.user
@@ -654,14 +976,9 @@ class DocumentTransferViewSet(viewsets.ModelViewSet):
         if request.user != transfer.receiver:
             return Response({'error': 'Not authorized'}, status=403)
 
-        transfer.status = 'Accepted'
-        transfer.accepted_at = timezone.now()
-        transfer.save()
-
-        # Update documents holder
-        for doc in transfer.documents.all():
-            doc.current_holder = request.user
-            doc.save()
+        # Update transfer and documents holder together
+        if not self.receive_transfers([transfer.id], request.user, 'Accepted', ['Pending']):
+            return Response({'error': 'Transfer already processed'}, status=400)
 
         # Notify sender
         Notification.objects.create(
@@ -710,10 +1027,16 @@ class DocumentTransferViewSet(viewsets.ModelViewSet):
         
         return Response({'status': 'cancelled'})
 
-class PhysicalDocumentTransferViewSet(viewsets.ModelViewSet):
+class PhysicalDocumentTransferViewSet(TransferReceiptMixin, viewsets.ModelViewSet):
     queryset = PhysicalDocumentTransfer.objects.all()
     serializer_class = PhysicalDocumentTransferSerializer
     pagination_class = None
+    transfer_entity = 'physical_transfer'
+    document_entity = 'student_document'
+
+    def documents_received(self, transfers, user, at):
+        # Physical documents keep a custody ledger
+        record_transfer_custody(transfers, user, at)
 
     def get_queryset(self):
         user = self.request.user
@@ -796,15 +1119,9 @@ class PhysicalDocumentTransferViewSet(viewsets.ModelViewSet):
         
         message = request.data.get('message', '')
         
-        # Update transfer status to Delivered (confirmed)
-        transfer.status = 'Delivered'
-        transfer.accepted_at = timezone.now()
-        transfer.save()
-        
-        # Update documents holder to receiver
-        for doc in transfer.documents.all():
-            doc.current_holder = request.user
-            doc.save()
+        # Update transfer status to Delivered (confirmed) and documents holder to receiver
+        if not self.receive_transfers([transfer.id], request.user, 'Delivered', allowed_statuses):
+            return Response({'error': 'Transfer already processed'}, status=400)
         
         # Create timeline entry
         TransferTimeline.objects.create(
@@ -839,14 +1156,9 @@ class PhysicalDocumentTransferViewSet(viewsets.ModelViewSet):
         if request.user != transfer.receiver:
             return Response({'error': 'Not authorized'}, status=403)
 
-        transfer.status = 'Accepted'
-        transfer.accepted_at = timezone.now()
-        transfer.save()
-
-        # Update documents holder
-        for doc in transfer.documents.all():
-            doc.current_holder = request.user
-            doc.save()
+        # Update transfer and documents holder together
+        if not self.receive_transfers([transfer.id], request.user, 'Accepted', ['Pending']):
+            return Response({'error': 'Transfer already processed'}, status=400)
 
         # Notify sender
         Notification.objects.create(
@@ -1501,8 +1813,11 @@ class StudentDocumentViewSet(viewsets.ModelViewSet):
             status='Held'
         ).filter(Q(company_id=request.user.company_id) | Q(company_id__isnull=True) | Q(company_id=''))
         
-        count = docs.count()
-        docs.update(status='Returned', returned_at=timezone.now())
+        now = timezone.now()
+        with transaction.atomic():
+            returned_ids = list(docs.select_for_update().values_list('id', flat=True))
+            count = StudentDocument.objects.filter(id__in=returned_ids).update(status='Returned', returned_at=now)
+            move_custody(returned_ids, None, 'Returned', request.user.company_id, at=now)
         
         return Response({
             'status': 'success',
@@ -1510,6 +1825,73 @@ class StudentDocumentViewSet(viewsets.ModelViewSet):
             'message': f'{count} document(s) marked as returned'
         })
 
+    def parse_holder(self, value):
+        try:
+            return uuid.UUID(str(value))
+        except ValueError:
+            return None
+    
+    def custody_queryset(self, queryset):
+        """Scope ledger rows to the user's company (same rule as get_queryset)"""
+        user = self.request.user
+        if user.role != 'DEV_ADMIN':
+            queryset = queryset.filter(Q(company_id=user.company_id) | Q(company_id=''))
+        return queryset.select_related('document__registration', 'holder')
+    
+    def parse_at(self, request):
+        at = request.query_params.get('at')
+        if not at:
+            return timezone.now()
+        # A '+' in an unencoded UTC offset arrives as a space
+        try:
+            at = parse_datetime(at.replace(' ', '+'))
+        except ValueError:
+            return None
+        if at and timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        return at
+    
+    @action(detail=False, methods=['get'])
+    def holdings(self, request):
+        """
+        Documents held by staff at a point in time
+        Query params: at (ISO date/datetime, default now), holder (user id, optional)
+        """
+        at = self.parse_at(request)
+        if not at:
+            return Response({'error': 'at must be an ISO date or datetime'}, status=400)
+        
+        queryset = self.custody_queryset(holdings_at(at))
+        if request.query_params.get('holder'):
+            queryset = queryset.filter(holder_id=self.parse_holder(request.query_params['holder']))
+        
+        return Response(StudentDocumentCustodySerializer(queryset, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    def inventory(self, request):
+        """
+        Documents a holder has right now
+        Query params: holder (user id, default current user)
+        """
+        holder = self.parse_holder(request.query_params.get('holder') or request.user.id)
+        queryset = self.custody_queryset(current_inventory(holder))
+        return Response(StudentDocumentCustodySerializer(queryset, many=True).data)
+    
+    @action(detail=True, methods=['get'])
+    def custody(self, request, pk=None):
+        """
+        Custody history of one document (newest first)
+        Query params: at (optional) - only the period covering that time
+        """
+        document = self.get_object()
+        queryset = document.custody.select_related('document__registration', 'holder')
+        if request.query_params.get('at'):
+            at = self.parse_at(request)
+            if not at:
+                return Response({'error': 'at must be an ISO date or datetime'}, status=400)
+            queryset = queryset.filter(started_at__lte=at).filter(Q(ended_at__isnull=True) | Q(ended_at__gt=at))
+        return Response(StudentDocumentCustodySerializer(queryset, many=True).data)
+
 class DashboardViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
@@ -0,0 +1,76 @@
+"""
+Streaming ZIP writer
+
+zipfile writes to any object with write(); given one that cannot seek it
+falls back to data descriptors, so the archive can be produced front to
+back. stream_zip() drains that buffer after every block it copies, which
+keeps memory at one block regardless of how large the archive gets.
+"""
+import zipfile
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class StreamBuffer:
+    """Write-only sink for ZipFile that hands out what was written so far"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """
+    Yield a ZIP archive in pieces.
+    entries: iterable of (arcname, open_file, size, date_time, compress) where
+    open_file() returns a binary file object.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as archive:
+        for arcname, open_file, size, date_time, compress in entries:
+            info = zipfile.ZipInfo(arcname, date_time=date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.file_size = size
+            with open_file() as source, archive.open(info, 'w') as target:
+                while True:
+                    block = source.read(STREAM_BLOCK_SIZE)
+                    if not block:
+                        break
+                    target.write(block)
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            data = buffer.pop()
+            if data:
+                yield data
+    yield buffer.pop()
+
+
+def unique_arcname(name, used):
+    """name, or name (2), name (3), ... if already used in this archive"""
+    candidate = name
+    stem, dot, ext = name.rpartition('.')
+    if not dot:
+        stem, ext = name, ''
+    counter = 2
+    while candidate.lower() in used:
+        candidate = f'{stem} ({counter}).{ext}' if ext else f'{stem} ({counter})'
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
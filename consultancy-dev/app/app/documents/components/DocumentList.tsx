@@ -72,13 +72,8 @@ export function DocumentList() {
 
 
     const handlePrint = (doc: Document) => {
-        if (doc.file) {
-            const printWindow = window.open(doc.file, '_blank');
-            if (printWindow) {
-                printWindow.onload = () => {
-                    printWindow.print();
-                };
-            }
+        if (doc.download_url) {
+            apiClient.documents.open(doc.id, { print: true }).catch(() => toast.error('Failed to open file'));
         } else {
             toast.error('No file available to print');
         }
@@ -4,7 +4,7 @@ import { useState, useEffect } from 'react';
 import { useForm, useFieldArray, Controller } from 'react-hook-form';
 import { zodResolver } from '@hookform/resolvers/zod';
 import { z } from 'zod';
-import { useQuery } from '@tanstack/react-query';
+import { useQuery, useQueryClient } from '@tanstack/react-query';
 import { apiClient } from '@/lib/apiClient';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -79,6 +79,7 @@ export function EnrollmentWizard({ onSubmit, isLoading }: EnrollmentWizardProps)
     const [selectedStudentName, setSelectedStudentName] = useState<string>('');
     const [isDirty, setIsDirty] = useState(false);
     const [showLeaveModal, setShowLeaveModal] = useState(false);
+    const queryClient = useQueryClient();
 
     // Fetch registrations (students available for enrollment)
     const { data: registrations } = useQuery({
@@ -130,6 +131,13 @@ export function EnrollmentWizard({ onSubmit, isLoading }: EnrollmentWizardProps)
 
     const { fields, append, remove, replace } = useFieldArray({ control, name: 'student_documents' });
     const watchedValues = watch();
+
+    // List rows only carry document counts; the selected student's documents come from retrieve
+    const { data: selectedStudent } = useQuery({
+        queryKey: ['registrations', watchedValues.studentId],
+        queryFn: () => apiClient.registrations.get(watchedValues.studentId),
+        enabled: !!watchedValues.studentId,
+    });
     const totalFees = (Number(watchedValues.serviceCharge) || 0) + (Number(watchedValues.schoolFees) || 0) + (Number(watchedValues.hostelFees) || 0);
 
     // Set selectedStudentName from draft if exists
@@ -162,7 +170,7 @@ export function EnrollmentWizard({ onSubmit, isLoading }: EnrollmentWizardProps)
     }, [isDirty]);
 
     // Handle student selection - USE String() for comparison
-    const handleStudentSelect = (studentId: string) => {
+    const handleStudentSelect = async (studentId: string) => {
         const student = availableStudents.find(s => String(s.id) === studentId);
         if (student) {
             setSelectedStudentName(student.studentName);
@@ -170,8 +178,12 @@ export function EnrollmentWizard({ onSubmit, isLoading }: EnrollmentWizardProps)
             setValue('studentName', student.studentName);
 
             // Populate physical documents
-            if (student.student_documents && student.student_documents.length > 0) {
-                replace(student.student_documents);
+            const detail = await queryClient.fetchQuery({
+                queryKey: ['registrations', studentId],
+                queryFn: () => apiClient.registrations.get(studentId),
+            });
+            if (detail?.student_documents && detail.student_documents.length > 0) {
+                replace(detail.student_documents);
                 setValue('documentTakeoverEnabled', true);
             } else {
                 replace([]);
@@ -479,7 +491,7 @@ export function EnrollmentWizard({ onSubmit, isLoading }: EnrollmentWizardProps)
                                         <DocumentUpload
                                             registrationId={watchedValues.studentId || undefined}
                                             studentName={selectedStudentName || ''}
-                                            initialDocuments={availableStudents.find(s => String(s.id) === String(watchedValues.studentId))?.documents || []}
+                                            initialDocuments={selectedStudent?.documents || []}
                                             onDocumentsChange={(docs) => setValue('documents', docs)}
                                             readOnly={false}
                                         />
@@ -680,8 +680,9 @@ export default function PaymentsPage() {
             queryClient.invalidateQueries({ queryKey: ['payments'] });
             toast({ title: 'Success', description: 'Payment recorded successfully.' });
             setIsPaymentModalOpen(false);
-          } catch (error) {
-            toast({ type: 'error', title: 'Error', description: 'Failed to record payment.' });
+          } catch (error: any) {
+            const msg = error?.response?.data?.registration?.[0] || 'Failed to record payment.';
+            toast({ type: 'error', title: 'Error', description: msg });
           }
         }}
       />
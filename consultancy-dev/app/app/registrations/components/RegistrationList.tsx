@@ -58,6 +58,19 @@ export function RegistrationList({ searchTerm = '' }: RegistrationListProps) {
     queryFn: apiClient.registrations.list,
   });
 
+  // List rows only carry document counts; the modals load the nested documents via retrieve
+  const { data: viewDetail } = useQuery({
+    queryKey: ['registrations', viewReg?.id],
+    queryFn: () => apiClient.registrations.get(viewReg!.id),
+    enabled: !!viewReg,
+  });
+
+  const { data: editDetail } = useQuery({
+    queryKey: ['registrations', editReg?.id],
+    queryFn: () => apiClient.registrations.get(editReg!.id),
+    enabled: !!editReg,
+  });
+
   const deleteMutation = useMutation({
     mutationFn: async (id: string) => {
       await apiClient.registrations.delete(id);
@@ -429,7 +442,7 @@ export function RegistrationList({ searchTerm = '' }: RegistrationListProps) {
           <Dialog.Content className="fixed left-[50%] top-[50%] h-[85vh] w-[90vw] max-w-[900px] translate-x-[-50%] translate-y-[-50%] rounded-xl bg-white shadow-xl focus:outline-none z-50 border border-slate-200 overflow-hidden flex flex-col">
             {viewReg && (
               <RegistrationViewModal
-                registration={viewReg}
+                registration={viewDetail?.id === viewReg.id ? viewDetail : viewReg}
                 onClose={() => setViewReg(null)}
                 router={router}
                 onPrintReceipt={() => {
@@ -483,9 +496,9 @@ export function RegistrationList({ searchTerm = '' }: RegistrationListProps) {
         <Dialog.Portal>
           <Dialog.Overlay className="fixed inset-0 bg-black/50 z-50" />
           <Dialog.Content className="fixed left-[50%] top-[50%] h-[85vh] w-[90vw] max-w-[900px] translate-x-[-50%] translate-y-[-50%] rounded-xl bg-white shadow-xl focus:outline-none z-50 border border-slate-200 overflow-hidden flex flex-col">
-            {editReg && (
+            {editReg && editDetail?.id === editReg.id && (
               <RegistrationEditModal
-                registration={editReg}
+                registration={editDetail}
                 onClose={() => setEditReg(null)}
                 onSave={handleEditSubmit}
                 isLoading={updateMutation.isPending || requestUpdateMutation.isPending}
@@ -792,11 +805,11 @@ function RegistrationViewModal({
                           {doc.description && <p className="text-xs text-slate-400 truncate">{doc.description}</p>}
                         </div>
                       </div>
-                      {doc.file && (
+                      {doc.download_url && (
                         <Button
                           variant="outline"
                           size="sm"
-                          onClick={() => window.open(doc.file, '_blank')}
+                          onClick={() => apiClient.documents.open(doc.id)}
                           className="text-blue-600 hover:text-blue-700 shrink-0"
                         >
                           View
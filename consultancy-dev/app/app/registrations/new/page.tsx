@@ -24,12 +24,11 @@ export default function NewRegistrationPage() {
       // 1. Separate documents from registration data
       const { documents, ...registrationDetails } = data;
 
-      // 2. Create the registration
-      const payload = { ...registrationDetails };
-      if (enquiryId) {
-        payload.enquiry = enquiryId;
-      }
-      const newReg = await apiClient.registrations.create(payload);
+      // 2. Create the registration; from an enquiry, the server converts it
+      // (registration, fee payment, enquiry marked Converted) in one transaction
+      const newReg = enquiryId
+        ? await apiClient.enquiries.convert(enquiryId, registrationDetails)
+        : await apiClient.registrations.create(registrationDetails);
 
       // 3. Upload documents if any exist and have files
       if (documents && documents.length > 0) {
@@ -58,6 +57,9 @@ export default function NewRegistrationPage() {
     },
     onSuccess: (data) => {
       queryClient.invalidateQueries({ queryKey: ['registrations'] });
+      if (enquiryId) {
+        queryClient.invalidateQueries({ queryKey: ['enquiries'] });
+      }
       setRegistrationData(data);
       setShowSuccessModal(true);
     },
@@ -80,8 +80,8 @@ export function DocumentList({ studentName, registrationId }: DocumentListProps)
                                         {/* {doc.description && <p className="text-[10px] text-slate-400 truncate">{doc.description}</p>} */}
                                     </div>
                                 </div>
-                                {doc.file && (
-                                    <Button variant="ghost" size="sm" onClick={() => window.open(doc.file, '_blank')}>
+                                {doc.download_url && (
+                                    <Button variant="ghost" size="sm" onClick={() => apiClient.documents.open(doc.id, { inline: false })}>
                                         <Download size={16} />
                                     </Button>
                                 )}
@@ -24,9 +24,11 @@ import { PaymentDetailsModal } from '@/components/common/PaymentDetailsModal';
 
 interface PaymentHistoryProps {
     studentName: string;
+    registrationId?: string;
+    enrollmentId?: string;
 }
 
-export function PaymentHistory({ studentName }: PaymentHistoryProps) {
+export function PaymentHistory({ studentName, registrationId, enrollmentId }: PaymentHistoryProps) {
     const [showPaymentModal, setShowPaymentModal] = useState(false);
     const [showRefundModal, setShowRefundModal] = useState(false);
     const [showDetailsModal, setShowDetailsModal] = useState(false);
@@ -345,15 +347,17 @@ export function PaymentHistory({ studentName }: PaymentHistoryProps) {
                             description: `Payment of ₹${data.amount} has been recorded successfully`,
                         });
                         setShowPaymentModal(false);
-                    } catch (error) {
+                    } catch (error: any) {
                         toast({
                             type: 'error',
                             title: 'Error',
-                            description: 'Failed to add payment. Please try again.',
+                            description: error?.response?.data?.registration?.[0] || 'Failed to add payment. Please try again.',
                         });
                     }
                 }}
                 studentName={studentName}
+                registrationId={registrationId}
+                enrollmentId={enrollmentId}
             />
 
             {selectedPayment && (
@@ -572,7 +572,7 @@ export function StudentProfileView({ type, id }: StudentProfileViewProps) {
                         <TabsContent value="payments" className="mt-0 focus-visible:outline-none">
                             <Card className="border border-slate-200 shadow-sm">
                                 <CardHeader className="py-3 px-4 border-b border-slate-100"><CardTitle className="text-sm font-bold">Payments</CardTitle></CardHeader>
-                                <CardContent className="p-4"><PaymentHistory studentName={studentName} /></CardContent>
+                                <CardContent className="p-4"><PaymentHistory studentName={studentName} registrationId={registrationIdStr || undefined} enrollmentId={isEnrollment(primaryRecord) ? primaryRecord.id : undefined} /></CardContent>
                             </Card>
                         </TabsContent>
 
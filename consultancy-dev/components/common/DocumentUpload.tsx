@@ -14,7 +14,8 @@ interface Document {
     file_name?: string;
     fileName?: string;
     description: string;
-    file?: File | string;
+    file?: File;
+    download_url?: string;
     uploaded_at?: string;
     uploadedAt?: string;
     type?: string;
@@ -160,7 +161,7 @@ export function DocumentUpload({
                         id: uploadedDoc.id,
                         file_name: uploadedDoc.fileName,
                         description: doc.description,
-                        file: uploadedDoc.file,
+                        download_url: uploadedDoc.download_url,
                         uploaded_at: uploadedDoc.uploadedAt,
                         type: uploadedDoc.type
                     };
@@ -280,10 +281,10 @@ export function DocumentUpload({
                         </div>
 
                         <div className="flex flex-col gap-1">
-                            {doc.file && typeof doc.file === 'string' && (
-                                <a href={doc.file} target="_blank" rel="noopener noreferrer" className="h-7 w-7 flex items-center justify-center text-slate-400 hover:bg-teal-50 hover:text-teal-600 rounded-md transition-all">
+                            {doc.id && doc.download_url && (
+                                <button type="button" onClick={() => apiClient.documents.open(doc.id!, { inline: false })} className="h-7 w-7 flex items-center justify-center text-slate-400 hover:bg-teal-50 hover:text-teal-600 rounded-md transition-all">
                                     <Download size={14} />
-                                </a>
+                                </button>
                             )}
 
                             {!readOnly && (
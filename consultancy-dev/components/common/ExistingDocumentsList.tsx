@@ -22,10 +22,10 @@ export function ExistingDocumentsList({ studentId }: { studentId: string }) {
                         <span className="font-medium">{doc.fileName || doc.file_name}</span>
                         {doc.description && <span className="text-slate-500">- {doc.description}</span>}
                     </div>
-                    {doc.file && (
-                        <a href={doc.file} target="_blank" rel="noopener noreferrer" className="text-blue-600 hover:underline">
+                    {doc.download_url && (
+                        <button type="button" onClick={() => apiClient.documents.open(doc.id)} className="text-blue-600 hover:underline">
                             View
-                        </a>
+                        </button>
                     )}
                 </div>
             ))}
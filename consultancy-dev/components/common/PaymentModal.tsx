@@ -42,10 +42,13 @@ interface PaymentModalProps {
     onClose: () => void;
     onSubmit: (data: any) => Promise<void>;
     studentName: string;
+    // The student's registration / enrollment, so the payment lands on their ledger
+    registrationId?: string;
+    enrollmentId?: string;
     isLoading?: boolean;
 }
 
-export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading = false }: PaymentModalProps) {
+export function PaymentModal({ open, onClose, onSubmit, studentName, registrationId, enrollmentId, isLoading = false }: PaymentModalProps) {
     const {
         register,
         handleSubmit,
@@ -64,6 +67,7 @@ export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading =
     const { errors } = formState;
     const paymentMethod = watch('paymentMethod');
     const [selectedStudent, setSelectedStudent] = useState<string>('');
+    const [selectedLink, setSelectedLink] = useState<{ registration?: string; enrollment?: string }>({});
     const [openCombobox, setOpenCombobox] = useState(false);
     const [searchTerm, setSearchTerm] = useState('');
 
@@ -80,19 +84,22 @@ export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading =
                 id: `enr-${e.id}`,
                 name: e.studentName,
                 type: 'Enrollment',
-                detail: e.enrollmentNo || e.programName
+                detail: e.enrollmentNo || e.programName,
+                link: { registration: e.studentId, enrollment: e.id }
             })),
             ...registrations.map((r: any) => ({
                 id: `reg-${r.id}`,
                 name: r.studentName,
                 type: 'Registration',
-                detail: r.registrationNo || r.mobile
+                detail: r.registrationNo || r.mobile,
+                link: { registration: r.id }
             })),
             ...enquiries.map((e: any) => ({
                 id: `enq-${e.id}`,
                 name: e.candidateName,
                 type: 'Enquiry',
-                detail: e.mobile || e.courseInterested
+                detail: e.mobile || e.courseInterested,
+                link: {}
             }))
         ];
 
@@ -128,8 +135,15 @@ export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading =
             if (data.transactionId) metadata.transactionId = data.transactionId;
         }
 
+        // A manually typed name has no link; the server matches it to a registration if it can
+        const link: { registration?: string; enrollment?: string } = studentName
+            ? { registration: registrationId, enrollment: enrollmentId }
+            : (selectedStudent ? selectedLink : {});
+
         await onSubmit({
             studentName: finalStudentName,
+            registration: link.registration,
+            enrollment: link.enrollment,
             amount: data.amount,
             date: data.paymentDate,
             method: data.paymentMethod,
@@ -139,6 +153,7 @@ export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading =
         });
         reset();
         setSelectedStudent('');
+        setSelectedLink({});
         onClose();
     };
 
@@ -184,6 +199,7 @@ export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading =
                                                 setSearchTerm(e.target.value);
                                                 setOpenCombobox(true);
                                                 setSelectedStudent('');
+                                                setSelectedLink({});
                                             }}
                                             onFocus={() => setOpenCombobox(true)}
                                         />
@@ -211,6 +227,7 @@ export function PaymentModal({ open, onClose, onSubmit, studentName, isLoading =
                                                                 className="px-4 py-2.5 hover:bg-slate-50 cursor-pointer border-b last:border-0 border-slate-50 transition-colors"
                                                                 onClick={() => {
                                                                     setSelectedStudent(student.name);
+                                                                    setSelectedLink(student.link);
                                                                     setSearchTerm(student.name);
                                                                     setOpenCombobox(false);
                                                                 }}
@@ -126,8 +126,13 @@ const mapRegistration = (data: any): Registration => ({
 
   // Other fields from data
   preferences: data.preferences ?? [],
-  documents: data.documents ?? [],
-  student_documents: data.student_documents ?? [],
+  // Nested documents only come back from retrieve; list rows carry the counts
+  documents: data.documents,
+  student_documents: data.student_documents,
+  documentsCount: data.documents_count,
+  studentDocumentsCount: data.student_documents_count,
+  documentsHeld: data.documents_held,
+  documentsReturned: data.documents_returned,
   enquiry: data.enquiry,
   created_by_name: data.created_by_name,
 });
@@ -149,6 +154,54 @@ const mapEnrollment = (data: any): Enrollment => ({
   installments: data.installments,
 });
 
+// Registration form data -> API fields, for creating a registration or converting an enquiry into one
+const registrationPayload = (data: any) => ({
+  ...data,
+  registration_no: `REG-${Date.now()}`,
+  student_name: data.studentName,
+  registration_date: new Date().toISOString(),
+  needs_loan: data.needsLoan,
+  payment_status: data.paymentStatus,
+  payment_method: data.paymentMethod,
+  registration_fee: data.registrationFee,
+  father_name: data.fatherName,
+  mother_name: data.motherName,
+  permanent_address: data.permanentAddress,
+
+  // New Fields Payload
+  father_occupation: data.fatherOccupation,
+  mother_occupation: data.motherOccupation,
+  father_mobile: data.fatherMobile,
+  mother_mobile: data.motherMobile,
+  family_place: data.familyPlace,
+  family_state: data.familyState,
+
+  school_name: data.schoolName,
+  school_board: data.schoolBoard,
+  school_place: data.schoolPlace,
+  school_state: data.schoolState,
+  class10_percentage: data.class10Percentage,
+  class12_percentage: data.class12Percentage,
+  class12_passing_year: data.class12PassingYear,
+
+  gap_year: data.gapYear,
+  gap_year_from: data.gapYearFrom,
+  gap_year_to: data.gapYearTo,
+  college_dropout: data.collegeDropout,
+
+  pcb_percentage: data.pcbPercentage,
+  pcm_percentage: data.pcmPercentage,
+  physics_marks: data.physicsMarks,
+  chemistry_marks: data.chemistryMarks,
+  biology_marks: data.biologyMarks,
+  maths_marks: data.mathsMarks,
+  previous_neet_marks: data.previousNeetMarks,
+  present_neet_marks: data.presentNeetMarks,
+
+  // Link to enquiry if converting from enquiry
+  enquiry: data.enquiryId || data.enquiry || null,
+});
+
 export const apiClient = {
   auth: {
     login: async (email: string, role: Role = 'EMPLOYEE') => { throw new Error("Use authStore"); },
@@ -463,6 +516,16 @@ export const apiClient = {
     },
     delete: async (id: string): Promise<void> => {
       await api.delete(`enquiries/${id}/`);
+    },
+    // Server-side conversion: registration, fee payment, documents and enquiry status in one transaction
+    // Registers the enquiry's student server-side in one transaction; data is registration form data
+    convert: async (id: string, data: any = {}): Promise<Registration> => {
+      const res = await api.post(`enquiries/${id}/convert/`, registrationPayload(data));
+      return mapRegistration(res.data);
+    },
+    bulkConvert: async (ids: string[], defaults: any = {}) => {
+      const res = await api.post('enquiries/bulk_convert/', { ids, defaults });
+      return res.data;
     }
   },
 
@@ -472,52 +535,7 @@ export const apiClient = {
       return res.data.map(mapRegistration);
     },
     create: async (data: any): Promise<Registration> => {
-      const payload = {
-        ...data,
-        registration_no: `REG-${Date.now()}`,
-        student_name: data.studentName,
-        registration_date: new Date().toISOString(),
-        needs_loan: data.needsLoan,
-        payment_status: data.paymentStatus,
-        payment_method: data.paymentMethod,
-        registration_fee: data.registrationFee,
-        father_name: data.fatherName,
-        mother_name: data.motherName,
-        permanent_address: data.permanentAddress,
-
-        // New Fields Payload
-        father_occupation: data.fatherOccupation,
-        mother_occupation: data.motherOccupation,
-        father_mobile: data.fatherMobile,
-        mother_mobile: data.motherMobile,
-        family_place: data.familyPlace,
-        family_state: data.familyState,
-
-        school_name: data.schoolName,
-        school_board: data.schoolBoard,
-        school_place: data.schoolPlace,
-        school_state: data.schoolState,
-        class10_percentage: data.class10Percentage,
-        class12_percentage: data.class12Percentage,
-        class12_passing_year: data.class12PassingYear,
-
-        gap_year: data.gapYear,
-        gap_year_from: data.gapYearFrom,
-        gap_year_to: data.gapYearTo,
-        college_dropout: data.collegeDropout,
-
-        pcb_percentage: data.pcbPercentage,
-        pcm_percentage: data.pcmPercentage,
-        physics_marks: data.physicsMarks,
-        chemistry_marks: data.chemistryMarks,
-        biology_marks: data.biologyMarks,
-        maths_marks: data.mathsMarks,
-        previous_neet_marks: data.previousNeetMarks,
-        present_neet_marks: data.presentNeetMarks,
-
-        // Link to enquiry if converting from enquiry
-        enquiry: data.enquiryId || data.enquiry || null,
-      };
+      const payload = registrationPayload(data);
       const res = await api.post('registrations/', payload);
       return mapRegistration(res.data);
     },
@@ -702,6 +720,28 @@ export const apiClient = {
         expiryDate: res.data.expiry_date
       };
     },
+    // Files are only served by the tenant-checked download endpoint, which needs the auth header,
+    // so they are fetched here and opened from a blob URL rather than linked directly
+    open: async (id: string, { inline = true, print = false } = {}): Promise<void> => {
+      const target = window.open('', '_blank');
+      try {
+        const res = await api.get(`documents/${id}/download/`, {
+          params: inline ? { inline: 1 } : {},
+          responseType: 'blob'
+        });
+        const url = URL.createObjectURL(res.data);
+        if (target) {
+          target.location.href = url;
+          if (print) target.onload = () => target.print();
+        } else {
+          window.open(url, '_blank');
+        }
+        setTimeout(() => URL.revokeObjectURL(url), 60_000);
+      } catch (error) {
+        target?.close();
+        throw error;
+      }
+    },
     toggleStatus: async (id: string, status: 'IN' | 'OUT'): Promise<void> => {
       await api.patch(`documents/${id}/`, { status });
     },
@@ -739,7 +779,9 @@ export const apiClient = {
     create: async (data: any): Promise<Payment> => {
       const payload = {
         ...data,
-        student_name: data.studentName
+        student_name: data.studentName,
+        registration: data.registration || null,
+        enrollment: data.enrollment || null
       };
       const res = await api.post('payments/', payload);
       return { ...res.data, studentName: res.data.student_name };
@@ -147,6 +147,10 @@ export interface Registration {
   preferences: StudyPreference[];
   documents?: any[]; // Backend returns snake_case document objects
   student_documents?: StudentDocument[];
+  documentsCount?: number;
+  studentDocumentsCount?: number;
+  documentsHeld?: number;
+  documentsReturned?: number;
   created_by_name?: string;
   enquiry?: string; // ID of linked enquiry
 }
@@ -218,7 +222,8 @@ export interface Document {
   studentName?: string; // Associated student
   registration?: number; // Registration ID
   registrationNo?: string;
-  file?: string;
+  download_url?: string;
+  thumbnail_url?: string;
   expiryDate?: string;
 }
 